@@ -1,9 +1,10 @@
 # app.py - Bot Berita Acara Pro Wifi
+import time
+APP_IMPORT_STARTED = time.perf_counter()  # Awal pengukuran startup (import app.py -> bot_ready)
 import os
 import logging
 import asyncio
 import threading
-import time
 from dotenv import load_dotenv
 load_dotenv()
 from flask import Flask, request, jsonify
@@ -58,6 +59,7 @@ bot = None
 loop = None
 loop_thread = None
 bot_ready = False
+startup_seconds = None  # Waktu dari import app.py sampai startup selesai
 
 def create_and_run_loop():
     """Create and run event loop in dedicated thread"""
@@ -134,6 +136,7 @@ def index():
     system_info = {
         'status': 'running',
         'bot_ready': bot_ready,
+        'startup_seconds': startup_seconds,
         'loop_running': loop is not None and not loop.is_closed(),
         'message': 'Bot Berita Acara Pro Wifi & Datin',
         'config': {
@@ -206,7 +209,7 @@ def webhook():
 
 # Application startup
 def startup():
-    global bot_ready
+    global bot_ready, startup_seconds
     
     logger.info("🚀 Starting Bot Berita Acara Pro Wifi...")
     
@@ -228,10 +231,12 @@ def startup():
     else:
         bot_ready = True
     
-    logger.info("✅ Application startup complete!")
+    startup_seconds = time.perf_counter() - APP_IMPORT_STARTED
+    logger.info(f"✅ Application startup complete in {startup_seconds:.2f}s (bot_ready={bot_ready})")
 
-# Run startup
-startup()
+# Run startup (tidak di worker render Excel, yang meng-import ulang modul ini sebagai __mp_main__)
+if __name__ != '__mp_main__':
+    startup()
 
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 5000))
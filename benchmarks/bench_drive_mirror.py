@@ -0,0 +1,269 @@
+# benchmarks/bench_drive_mirror.py - DriveFolderMirror vs files.list per lookup, dengan fake Drive lokal
+"""
+Fake Drive di memory (files.list, changes.getStartPageToken, changes.list) dengan
+beberapa folder template. Selama --rounds ronde, file di folder itu ditambah,
+di-rename, diubah isinya, dipindah antar folder atau keluar folder, di-trash dan
+dihapus; setiap ronde diakhiri --lookups lookup template.
+
+Dibandingkan jumlah API call dan waktu lookup antara:
+    list: files.list penuh setiap lookup (perilaku sebelum mirror)
+    mirror: DriveFolderMirror, sync lewat changes feed lalu baca dict lokal
+
+Setelah setiap sync isi mirror dicek sama persis dengan isi fake Drive. Dicek juga:
+restart dari state file (lanjut dari page token terakhir) dan page token yang
+ditolak (410, listing penuh ulang). Exit code 1 kalau ada perbedaan.
+
+    python benchmarks/bench_drive_mirror.py --rounds 50 --lookups 20
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import logging
+from collections import Counter
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.drive_folder_mirror import DriveFolderMirror, FILE_FIELDS
+
+XLSX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+MIRROR_FIELDS = [field.strip() for field in FILE_FIELDS.split(',')]
+
+
+class FakeRequest:
+    def __init__(self, drive, method, func):
+        self.drive = drive
+        self.method = method
+        self.func = func
+
+    def execute(self):
+        self.drive.calls[self.method] += 1
+        return self.func()
+
+
+class FakeDrive:
+    """Drive di memory dengan changes feed; page token = posisi di log perubahan"""
+
+    def __init__(self, page_size=100):
+        self.page_size = page_size
+        self.items = {}  # {file_id: metadata}
+        self.log = []  # file_id yang berubah, urut
+        self.calls = Counter()
+        self.expire_tokens_before = 0  # Token lebih lama dari posisi ini ditolak (410)
+        self._next_id = 0
+
+    # Operasi yang dilakukan user lain di Drive
+    def put(self, file_id=None, **metadata):
+        if file_id is None:
+            self._next_id += 1
+            file_id = f'file{self._next_id}'
+        item = dict(self.items.get(file_id, {'id': file_id, 'trashed': False}))
+        item.update(metadata)
+        item['modifiedTime'] = f'2026-01-01T00:00:{len(self.log):06d}Z'
+        self.items[file_id] = item
+        self.log.append(file_id)
+        return file_id
+
+    def delete(self, file_id):
+        self.items.pop(file_id, None)
+        self.log.append(file_id)
+
+    def folder_contents(self, folder_id):
+        """Ground truth, dalam bentuk yang sama dengan mirror"""
+        return {
+            file_id: self._fields(item) for file_id, item in self.items.items()
+            if folder_id in item.get('parents', []) and not item['trashed']
+        }
+
+    def _fields(self, item):
+        return {field: item[field] for field in MIRROR_FIELDS if field in item}
+
+    # Client API seperti googleapiclient
+    def files(self):
+        return self
+
+    def changes(self):
+        return FakeChanges(self)
+
+    def list(self, q, pageToken=None, **kwargs):
+        folder_id = q.split("'")[1]
+
+        def run():
+            files = sorted(self.folder_contents(folder_id).values(), key=lambda item: item['id'])
+            start = int(pageToken or 0)
+            response = {'files': files[start:start + self.page_size]}
+            if start + self.page_size < len(files):
+                response['nextPageToken'] = str(start + self.page_size)
+            return response
+        return FakeRequest(self, 'files.list', run)
+
+
+class FakeChanges:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self, **kwargs):
+        return FakeRequest(self.drive, 'changes.getStartPageToken', lambda: {'startPageToken': str(len(self.drive.log))})
+
+    def list(self, pageToken, pageSize=100, **kwargs):
+        drive = self.drive
+
+        def run():
+            start = int(pageToken)
+            if start < drive.expire_tokens_before:
+                raise HttpError(httplib2.Response({'status': 410}), b'{"error": {"message": "Invalid page token"}}')
+            end = min(start + pageSize, len(drive.log))
+            changes = []
+            for file_id in drive.log[start:end]:
+                item = drive.items.get(file_id)
+                if item is None:
+                    changes.append({'fileId': file_id, 'removed': True})
+                else:
+                    changes.append({'fileId': file_id, 'removed': False, 'file': drive._fields(item)})
+            response = {'changes': changes}
+            if end < len(drive.log):
+                response['nextPageToken'] = str(end)
+            else:
+                response['newStartPageToken'] = str(end)
+            return response
+        return FakeRequest(drive, 'changes.list', run)
+
+
+def find_template_by_listing(drive, folder_id):
+    """Perilaku sebelum mirror: files.list setiap lookup"""
+    files = []
+    page_token = None
+    while True:
+        response = drive.files().list(q=f"'{folder_id}' in parents and trashed = false", pageToken=page_token).execute()
+        files.extend(response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    excel = sorted((item for item in files if item.get('mimeType') == XLSX_MIME_TYPE), key=lambda item: item['name'])
+    return excel[0] if excel else None
+
+
+def find_template_in_mirror(mirror, drive, folder_id):
+    mirror.sync_if_due(drive)
+    excel = [item for item in mirror.files_in(folder_id) if item.get('mimeType') == XLSX_MIME_TYPE]
+    return excel[0] if excel else None
+
+
+def mutate(drive, rng, folders, outside):
+    """One random change made by someone else in Drive"""
+    ids = list(drive.items)
+    operation = rng.choice(['add', 'add', 'rename', 'modify', 'move', 'move_out', 'trash', 'restore', 'delete'])
+    if operation == 'add' or not ids:
+        mime_type = rng.choice([XLSX_MIME_TYPE, 'application/pdf', 'image/png'])
+        drive.put(name=f'template_{rng.randrange(10000):04d}.xlsx', mimeType=mime_type,
+                  md5Checksum=f'{rng.getrandbits(64):016x}', parents=[rng.choice(folders)])
+        return
+    file_id = rng.choice(ids)
+    if operation == 'rename':
+        drive.put(file_id, name=f'template_{rng.randrange(10000):04d}.xlsx')
+    elif operation == 'modify':
+        drive.put(file_id, md5Checksum=f'{rng.getrandbits(64):016x}')
+    elif operation == 'move':
+        drive.put(file_id, parents=[rng.choice(folders)])
+    elif operation == 'move_out':
+        drive.put(file_id, parents=[outside])
+    elif operation == 'trash':
+        drive.put(file_id, trashed=True)
+    elif operation == 'restore':
+        drive.put(file_id, trashed=False)
+    else:
+        drive.delete(file_id)
+
+
+def mismatches(mirror, drive, folders):
+    return [
+        folder_id for folder_id in folders
+        if {item['id']: item for item in mirror.files_in(folder_id)} != drive.folder_contents(folder_id)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--lookups', type=int, default=20, help='lookup template per ronde')
+    parser.add_argument('--changes', type=int, default=5, help='perubahan di Drive per ronde')
+    parser.add_argument('--files', type=int, default=300, help='file awal per folder')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    folders = ['template_wifi', 'template_datin']
+    outside = 'other_folder'
+    drive = FakeDrive()
+    for folder_id in folders:
+        for n in range(args.files):
+            drive.put(name=f'file_{n:04d}.xlsx', mimeType=rng.choice([XLSX_MIME_TYPE, 'image/png']),
+                      md5Checksum=f'{n:016x}', parents=[folder_id])
+
+    state_dir = tempfile.mkdtemp(prefix='bench_drive_mirror_')
+    state_file = os.path.join(state_dir, 'mirror.json')
+    failed = []
+    try:
+        mirror = DriveFolderMirror(state_file=state_file, poll_interval=0)
+        for folder_id in folders:
+            mirror.watch(folder_id)
+
+        timings = {'list': 0.0, 'mirror': 0.0}
+        calls = {'list': Counter(), 'mirror': Counter()}
+        for round_number in range(args.rounds):
+            for _ in range(args.changes):
+                mutate(drive, rng, folders, outside)
+
+            if round_number == args.rounds // 3:
+                # Restart: mirror baru dari state file, lanjut dari page token terakhir
+                mirror = DriveFolderMirror(state_file=state_file, poll_interval=0)
+                for folder_id in folders:
+                    mirror.watch(folder_id)
+            if round_number == 2 * args.rounds // 3:
+                # Page token lama ditolak: sync pertama gagal, sync berikutnya listing penuh
+                drive.expire_tokens_before = len(drive.log)
+                mirror.sync(drive)
+
+            for lookup in range(args.lookups):
+                folder_id = folders[lookup % len(folders)]
+                for name in ('list', 'mirror'):
+                    before = Counter(drive.calls)
+                    started = time.perf_counter()
+                    if name == 'list':
+                        expected = find_template_by_listing(drive, folder_id)
+                    else:
+                        found = find_template_in_mirror(mirror, drive, folder_id)
+                    timings[name] += time.perf_counter() - started
+                    calls[name].update(drive.calls - before)
+                # Nama yang sama bisa muncul dua kali, jadi yang dibandingkan namanya
+                if (found or {}).get('name') != (expected or {}).get('name'):
+                    failed.append(f"round {round_number}: mirror found {found and found['name']}, listing {expected and expected['name']}")
+
+            failed.extend(f"round {round_number}: mirror differs for {folder_id}" for folder_id in mismatches(mirror, drive, folders))
+
+        lookups = args.rounds * args.lookups
+        print(f"folders={len(folders)} files/folder={args.files} rounds={args.rounds} lookups={lookups} "
+              f"changes/round={args.changes}")
+        for name in ('list', 'mirror'):
+            detail = ', '.join(f"{method} {count}" for method, count in sorted(calls[name].items()))
+            print(f"{name:>7}: {sum(calls[name].values()):>6} API calls ({detail}), "
+                  f"{timings[name] / lookups * 1000:.3f} ms/lookup")
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    for failure in failed[:20]:
+        print(f"❌ {failure}")
+    print("✅ mirror matched Drive after every sync" if not failed else f"❌ {len(failed)} mismatches")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
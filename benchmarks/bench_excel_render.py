@@ -0,0 +1,267 @@
+# benchmarks/bench_excel_render.py - Waktu dan memory isi template Excel: openpyxl vs patch XML
+"""
+Isi template BA dengan form lengkap (semua section + 2 tanda tangan) memakai
+fill_excel_template (load/save openpyxl), fill_excel_template dengan WorkbookPool
+(workbook sudah di-parse) dan render_excel_template (XlsxTemplate).
+Dilaporkan p50/p99 per render dan peak memory (tracemalloc) per engine.
+
+Setelah timing, hasil setiap engine dibuka ulang dengan openpyxl dan dibandingkan dengan openpyxl:
+nilai dan tipe cell, style, merge, ukuran kolom/baris, posisi/ukuran/isi gambar.
+Exit code 1 kalau ada perbedaan.
+
+--concurrent N menjalankan N render bersamaan (seperti N teknisi generate di saat
+yang sama) di thread pool vs ExcelRenderPool, dan melaporkan total waktunya.
+
+    python benchmarks/bench_excel_render.py --form-type wifi datin --renders 50
+    python benchmarks/bench_excel_render.py --template template_ba.xlsx
+    python benchmarks/bench_excel_render.py --engine openpyxl --concurrent 8 --processes 4
+
+Tanpa --template dipakai template sintetis dengan style, merge dan ukuran kolom
+seperti template BA.
+"""
+import argparse
+import hashlib
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openpyxl
+from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
+from PIL import Image as PILImage
+
+from config.ba_config import BeritaAcaraConfig
+from services.excel_renderer import ExcelRenderer
+from services.excel_render_pool import ExcelRenderPool
+from services.xlsx_patcher import XlsxTemplate
+
+TEMPLATE_KEY = ('bench-template', '1')
+
+
+def make_template():
+    """Template sintetis: header ber-style, border di area form, merge dan kolom/baris ukuran custom"""
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = 'BA'
+    thin = Side(style='thin')
+    for row in range(1, 45):
+        for column in range(1, 22):
+            cell = worksheet.cell(row, column)
+            cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+            if row < 4:
+                cell.font = Font(bold=True, size=12)
+                cell.fill = PatternFill('solid', fgColor='DDEEFF')
+                cell.alignment = Alignment(horizontal='center')
+    worksheet['A1'] = 'BERITA ACARA'
+    worksheet['A4'] = 'HARI'
+    worksheet['Q4'] = 'TANGGAL'
+    worksheet.merge_cells('A1:U2')
+    worksheet.merge_cells('C41:H42')
+    for letter, width in (('C', 16), ('D', 24), ('O', 20), ('Q', 18)):
+        worksheet.column_dimensions[letter].width = width
+    for row in (38, 39):
+        worksheet.row_dimensions[row].height = 60
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def make_signature(color):
+    output = io.BytesIO()
+    PILImage.new('RGB', (365, 380), color).save(output, format='png', dpi=(301, 301))
+    return output.getvalue()
+
+
+def make_form_data(ba_config, form_type, signature_dir, signatures, prefix=''):
+    """Form lengkap seperti session setelah semua section diisi"""
+    form_data = {}
+    for section_id, section in ba_config.get_sections_for_form_type(form_type).items():
+        if section.is_signature:
+            continue
+        form_data[section_id] = {field_name: f"nilai {field_name.lower()}" for field_name in section.fields}
+
+    form_data['tanda_tangan'] = {}
+    for (field_name, image_data) in zip(ba_config.sections['tanda_tangan'].fields, signatures):
+        # Satu file signature per render, seperti tanda tangan yang di-upload teknisi
+        path = os.path.join(signature_dir, f"{prefix}{field_name.replace(' ', '_')}.png")
+        with open(path, 'wb') as f:
+            f.write(image_data)
+        form_data['tanda_tangan'][field_name] = f'SIGNATURE_IMAGE:{path}'
+    return form_data
+
+
+def summary(content):
+    """Isi workbook seperti yang dibaca openpyxl (dipakai untuk cek kesamaan hasil)"""
+    workbook = openpyxl.load_workbook(io.BytesIO(content))
+    worksheet = workbook.active
+    cells = {
+        cell.coordinate: (cell.value, cell.data_type, cell.style_id)
+        for row in worksheet.iter_rows() for cell in row
+        if cell.value is not None or cell.has_style
+    }
+    images = sorted(
+        (image.anchor._from.col, image.anchor._from.row, image.anchor.ext.width, image.anchor.ext.height,
+         hashlib.sha1(image._data()).hexdigest()[:12])
+        for image in worksheet._images
+    )
+    return {
+        'cells': cells,
+        'images': images,
+        'merged': sorted(str(merged) for merged in worksheet.merged_cells.ranges),
+        'columns': {letter: dim.width for letter, dim in worksheet.column_dimensions.items()},
+        'rows': {row: dim.height for row, dim in worksheet.row_dimensions.items() if dim.height},
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(render, renders):
+    timings = []
+    for _ in range(renders):
+        started = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    content = render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, peak, content
+
+
+def run_concurrent(render, jobs):
+    """Wall time for `jobs` renders submitted at the same moment"""
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        started = time.perf_counter()
+        results = list(executor.map(render, range(jobs)))
+        elapsed = time.perf_counter() - started
+    return elapsed, sum(1 for content in results if content)
+
+
+def compare_concurrent(args, template_content, ba_config, signatures, signature_dir):
+    """N render bersamaan: thread pool (berbagi GIL) vs process pool"""
+    form_type = args.form_type[0]
+    renderer = ExcelRenderer(engine=args.engine)
+    os.environ['EXCEL_RENDER_ENGINE'] = args.engine  # dibaca worker saat import
+    pool = ExcelRenderPool(workers=args.processes, queue_limit=max(args.concurrent, 1))
+    pool.preload(TEMPLATE_KEY, template_content, args.form_type)
+
+    def render_thread(index):
+        form_data = make_form_data(ba_config, form_type, signature_dir, signatures, prefix=f'thread{index}_')
+        return renderer.render(TEMPLATE_KEY, template_content, form_data, ba_config, form_type)
+
+    def render_process(index):
+        form_data = make_form_data(ba_config, form_type, signature_dir, signatures, prefix=f'process{index}_')
+        return pool.render(TEMPLATE_KEY, template_content, form_data, form_type)
+
+    print(f"\n== concurrent={args.concurrent} engine={args.engine} form_type={form_type} ==")
+    started = time.perf_counter()
+    pool.start()
+    print(f"process pool start (spawn + warm {args.processes} workers): {time.perf_counter() - started:.2f}s")
+    try:
+        for name, render in (('threads', render_thread), (f'{args.processes} processes', render_process)):
+            run_concurrent(render, args.concurrent)  # warm-up
+            elapsed, done = run_concurrent(render, args.concurrent)
+            print(f"{name:>14}: {elapsed * 1000:>8.1f} ms for {done}/{args.concurrent} renders")
+        stats = pool.stats()
+        print(f"pool: {stats['jobs']} jobs, avg queued {stats['avg_queued_ms']:.1f} ms, "
+              f"avg render {stats['avg_render_ms']:.1f} ms, rejected {stats['rejected']}, "
+              f"workbook pools ~{stats['workbook_pool_bytes'] / 1e6:.2f} MB")
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--template', help='xlsx template (default: template sintetis)')
+    parser.add_argument('--form-type', nargs='+', choices=['wifi', 'datin'], default=['wifi', 'datin'])
+    parser.add_argument('--renders', type=int, default=30)
+    parser.add_argument('--concurrent', type=int, default=0, help='also compare N simultaneous renders: threads vs processes')
+    parser.add_argument('--processes', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--engine', choices=['xml', 'openpyxl'], default='openpyxl', help='engine for --concurrent')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    if args.template:
+        with open(args.template, 'rb') as f:
+            template_content = f.read()
+    else:
+        template_content = make_template()
+
+    ba_config = BeritaAcaraConfig()
+    renderer = ExcelRenderer()
+    signatures = [make_signature('black'), make_signature('navy')]
+    signature_dir = tempfile.mkdtemp(prefix='bench_excel_render_')
+
+    failed = False
+    try:
+        for form_type in args.form_type:
+            template = XlsxTemplate(template_content, ba_config.excel_coordinates(form_type))
+
+            def render_openpyxl():
+                form_data = make_form_data(ba_config, form_type, signature_dir, signatures)
+                return renderer.fill_excel_template(io.BytesIO(template_content), form_data, ba_config, form_type)
+
+            def render_pooled():
+                form_data = make_form_data(ba_config, form_type, signature_dir, signatures)
+                return renderer.fill_excel_template(
+                    io.BytesIO(template_content), form_data, ba_config, form_type, template_key=TEMPLATE_KEY
+                )
+
+            def render_xml():
+                form_data = make_form_data(ba_config, form_type, signature_dir, signatures)
+                return renderer.render_excel_template(template, form_data, ba_config, form_type)
+
+            print(f"\n== form_type={form_type} renders={args.renders} template={len(template_content)} bytes ==")
+            print(f"{'engine':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>9} {'output KB':>10}")
+            results = {}
+            for engine, render in (('openpyxl', render_openpyxl), ('pooled', render_pooled), ('xml', render_xml)):
+                timings, peak, content = measure(render, args.renders)
+                results[engine] = content
+                print(f"{engine:>10} {percentile(timings, 0.5) * 1000:>9.2f} {percentile(timings, 0.99) * 1000:>9.2f} "
+                      f"{peak / 1e6:>9.2f} {len(content) / 1024:>10.1f}")
+
+            pool_stats = renderer.workbook_pool.stats()
+            print(f"workbook pool: {pool_stats['idle']} idle workbooks, ~{pool_stats['memory_bytes'] / 1e6:.2f} MB, "
+                  f"{pool_stats['hits']} hits / {pool_stats['misses']} misses")
+
+            expected = summary(results['openpyxl'])
+            for engine in ('pooled', 'xml'):
+                actual = summary(results[engine])
+                mismatched = [key for key in expected if expected[key] != actual[key]]
+                if mismatched:
+                    failed = True
+                    for key in mismatched:
+                        if key == 'cells':
+                            diff = {
+                                coordinate: (expected['cells'].get(coordinate), actual['cells'].get(coordinate))
+                                for coordinate in set(expected['cells']) | set(actual['cells'])
+                                if expected['cells'].get(coordinate) != actual['cells'].get(coordinate)
+                            }
+                            print(f"❌ {engine}: cells differ: {diff}")
+                        else:
+                            print(f"❌ {engine}: {key} differ: {expected[key]} != {actual[key]}")
+                else:
+                    print(f"✅ {engine}: identical after reload ({len(actual['cells'])} cells, {len(actual['images'])} images)")
+
+        if args.concurrent:
+            compare_concurrent(args, template_content, ba_config, signatures, signature_dir)
+    finally:
+        shutil.rmtree(signature_dir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_session_codec.py - Ukuran file, waktu parse dan memory: JSON lama vs SessionCodec
+"""
+Bandingkan format session lama (json indent=2) dengan format ringkas SessionCodec
+untuk N session yang semua section-nya terisi. "memory" adalah memory yang dipegang
+hasil load (SessionCodec menyimpan session ter-encode dan hanya men-decode yang diakses).
+
+    python benchmarks/bench_session_codec.py --sessions 100 1000 10000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.ba_config import BeritaAcaraConfig
+from services.session_codec import SessionCodec
+
+
+def make_sessions(count):
+    """Session lengkap seperti setelah teknisi mengisi semua section"""
+    config = BeritaAcaraConfig()
+    now = datetime.now().isoformat()
+    sessions = {}
+    for index in range(count):
+        user_id = 100000000 + index
+        form_data = {
+            section_id: {field_name: f"nilai {field_name.lower()} {index}" for field_name in section.fields}
+            for section_id, section in config.sections.items()
+        }
+        sessions[str(user_id)] = {
+            'user_id': user_id,
+            'form_data': form_data,
+            'current_section': None,
+            'temp_data': {},
+            'photos': [
+                {'filename': f'evidence_{n}.jpg', 'file_id': f'file{index}_{n}', 'description': f'Evidence photo {n}', 'uploaded_at': now}
+                for n in range(3)
+            ],
+            'evidence_folder_id': f'folder{index}',
+            'created_at': now,
+            'updated_at': now,
+            'status': 'active',
+            'form_type': 'wifi',
+        }
+    return sessions
+
+
+def measure(loads, text, repeat):
+    """Best-of parse time and memory held by the parsed sessions"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        loads(text)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    sessions = loads(text)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sessions
+    return best, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    codec = SessionCodec.from_config()
+    print(f"{'sessions':>9} {'format':>8} {'bytes':>12} {'dump ms':>9} {'parse ms':>9} {'memory MB':>10}")
+    for count in args.sessions:
+        sessions = make_sessions(count)
+        formats = [
+            ('json', lambda s: json.dumps(s, indent=2, ensure_ascii=False), json.loads),
+            ('codec', codec.dumps, codec.loads),
+        ]
+        for name, dumps, loads in formats:
+            started = time.perf_counter()
+            text = dumps(sessions)
+            dump_time = time.perf_counter() - started
+
+            assert dict(loads(text)) == sessions
+            parse_time, held = measure(loads, text, args.repeat)
+            print(f"{count:>9} {name:>8} {len(text.encode('utf-8')):>12} {dump_time * 1000:>9.1f} "
+                  f"{parse_time * 1000:>9.1f} {held / 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/bench_session_multiprocess.py - Throughput session store dengan beberapa worker process
+"""
+Simulasi beberapa worker gunicorn yang memakai session store yang sama.
+
+Setiap worker memproses "update" teknisi: baca session, simpan satu section
+dan (setiap beberapa update) satu foto, lewat unit of work seperti bot_ba.py.
+Di akhir, semua session dicek supaya tidak ada update yang hilang.
+
+Hanya sqlite yang throughput-nya naik saat worker ditambah. Backend json tetap
+benar (tidak ada update hilang), tapi setiap tulis memegang satu lock file dan
+menulis ulang seluruh file, jadi dengan --think-ms 0 throughput-nya justru turun
+(mis. 1 worker 1592 updates/s, 2 worker 862 updates/s). Deploy dengan
+WEB_CONCURRENCY > 1 harus memakai SESSION_BACKEND=sqlite; create_session_service
+memberi warning untuk json dan journal.
+
+    python benchmarks/bench_session_multiprocess.py --backend sqlite --workers 1 2 4 8
+    python benchmarks/bench_session_multiprocess.py --backend json --think-ms 20
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.session_ba_service import SessionBAService
+from services.session_sqlite_service import SQLiteSessionBAService
+
+
+def make_service(backend, data_dir):
+    """Semua worker memakai file yang sama di data_dir"""
+    if backend == 'sqlite':
+        return SQLiteSessionBAService(os.path.join(data_dir, 'ba_user_sessions.db'))
+    return SessionBAService(os.path.join(data_dir, 'ba_user_sessions.json'))
+
+
+def run_worker(backend, data_dir, worker_id, users, updates, think_ms, start_event, result_queue):
+    """Process one worker's share of technicians"""
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    service = make_service(backend, data_dir)
+    user_ids = [worker_id * 100000 + i for i in range(users)]
+    for user_id in user_ids:
+        service.create_session(user_id)
+
+    start_event.wait()
+    started = time.perf_counter()
+
+    for n in range(updates):
+        user_id = user_ids[n % users]
+        with service.unit_of_work(user_id):
+            service.get_session(user_id)
+            service.update_form_section(user_id, f'section_{n // users}', {'value': n})
+            if n % 4 == 0:
+                service.add_photo(user_id, {'file_id': f'photo_{n}'})
+        if think_ms:
+            # Latency Telegram/Drive API yang dialami handler sungguhan
+            time.sleep(think_ms / 1000)
+
+    elapsed = time.perf_counter() - started
+    result_queue.put((worker_id, user_ids, elapsed))
+
+
+def run(backend, workers, users, updates, think_ms):
+    data_dir = tempfile.mkdtemp(prefix='bench_sessions_')
+    try:
+        ctx = multiprocessing.get_context('spawn')
+        start_event = ctx.Event()
+        result_queue = ctx.Queue()
+        processes = [
+            ctx.Process(target=run_worker, args=(backend, data_dir, worker_id, users, updates, think_ms, start_event, result_queue))
+            for worker_id in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        # Tunggu semua worker siap sebelum mulai mengukur
+        time.sleep(1.0)
+        wall_started = time.perf_counter()
+        start_event.set()
+        results = [result_queue.get() for _ in processes]
+        wall = time.perf_counter() - wall_started
+        for process in processes:
+            process.join()
+
+        # Verifikasi: tidak ada section atau foto yang hilang
+        service = make_service(backend, data_dir)
+        lost = 0
+        for _, user_ids, _ in results:
+            for index, user_id in enumerate(user_ids):
+                handled = len(range(index, updates, users))
+                expected_photos = len([n for n in range(index, updates, users) if n % 4 == 0])
+                session = service._read_session(user_id) or {}
+                lost += handled - len(session.get('form_data', {}))
+                lost += expected_photos - len(session.get('photos', []))
+
+        total = workers * updates
+        return total / wall, lost
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default='sqlite')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=10, help='technicians per worker')
+    parser.add_argument('--updates', type=int, default=200, help='updates per worker')
+    parser.add_argument('--think-ms', type=float, default=0, help='simulated API latency per update')
+    args = parser.parse_args()
+
+    print(f"backend={args.backend} users/worker={args.users} updates/worker={args.updates} think={args.think_ms}ms")
+    print(f"{'workers':>8} {'updates/s':>12} {'speedup':>8} {'lost':>6}")
+    baseline = None
+    for workers in args.workers:
+        throughput, lost = run(args.backend, workers, args.users, args.updates, args.think_ms)
+        baseline = baseline or throughput
+        print(f"{workers:>8} {throughput:>12.1f} {throughput / baseline:>7.2f}x {lost:>6}")
+
+
+if __name__ == '__main__':
+    main()
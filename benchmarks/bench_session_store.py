@@ -0,0 +1,215 @@
+# benchmarks/bench_session_store.py - Benchmark dan stress test SessionBAService
+"""
+Simulasi N teknisi yang mengisi form bersamaan di satu process (beberapa thread).
+
+Setiap teknisi: create_session, beberapa update_form_section dan set_temp_data,
+beberapa add_photo, lalu end_session. Dilaporkan p50/p99 latency per operasi,
+ops/sec, ukuran file session dan peak RSS; di akhir semua session dicek supaya
+tidak ada update yang hilang.
+
+Mode --contend membuat semua thread juga menambah foto ke session bersama,
+sehingga read-modify-write yang tidak aman akan kehilangan foto. Setiap foto
+bersama ditambah dua kali: langsung, dan lewat unit_of_work dengan jeda antara
+get_session dan add_photo (seperti upload Drive di handle_photo_upload untuk
+foto album yang diproses bersamaan).
+
+    python benchmarks/bench_session_store.py --backend sqlite journal --sessions 10 100 10000
+    python benchmarks/bench_session_store.py --backend json --sessions 10 100 --threads 8 --contend
+
+Backend json menulis ulang seluruh file per operasi; dengan 10.000 session
+jalankan dengan --updates kecil atau siapkan waktu yang lama.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.ba_config import BeritaAcaraConfig
+
+OPERATIONS = ['create_session', 'update_form_section', 'set_temp_data', 'add_photo', 'end_session', 'contended_add_photo',
+              'contended_unit_of_work']
+SHARED_USERS = 10
+
+
+def make_service(backend, data_dir):
+    if backend == 'sqlite':
+        from services.session_sqlite_service import SQLiteSessionBAService
+        return SQLiteSessionBAService(os.path.join(data_dir, 'ba_user_sessions.db'))
+    if backend == 'journal':
+        from services.session_journal_service import JournalSessionBAService
+        return JournalSessionBAService(os.path.join(data_dir, 'ba_user_sessions.json'))
+
+    from services.session_ba_service import SessionBAService
+    return SessionBAService(os.path.join(data_dir, 'ba_user_sessions.json'))
+
+
+def store_size(data_dir):
+    """Total bytes of everything the backend wrote (file utama, journal, WAL)"""
+    return sum(os.path.getsize(os.path.join(data_dir, name)) for name in os.listdir(data_dir))
+
+
+def peak_rss_mb():
+    # ru_maxrss dalam KB di Linux, byte di macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def technician(service, user_id, sections, updates, photos, timings):
+    """One technician filling the whole form"""
+    def timed(name, func, *args):
+        started = time.perf_counter()
+        func(*args)
+        timings[name].append(time.perf_counter() - started)
+
+    timed('create_session', service.create_session, user_id)
+    for n in range(updates):
+        section_id, fields = sections[n % len(sections)]
+        section_data = {field_name: f"{field_name} {user_id} {n}" for field_name in fields}
+        timed('update_form_section', service.update_form_section, user_id, section_id, section_data)
+        timed('set_temp_data', service.set_temp_data, user_id, f'step_{n}', n)
+    for n in range(photos):
+        timed('add_photo', service.add_photo, user_id, {'filename': f'evidence_{n}.jpg', 'file_id': f'{user_id}_{n}'})
+    timed('end_session', service.end_session, user_id)
+
+
+def expected_form_data(user_id, sections, updates):
+    form_data = {}
+    for n in range(updates):
+        section_id, fields = sections[n % len(sections)]
+        form_data[section_id] = {field_name: f"{field_name} {user_id} {n}" for field_name in fields}
+    return form_data
+
+
+def run_config(backend, sessions, threads, updates, photos, contend, result_queue):
+    """Run one backend/size combination in a fresh process"""
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    data_dir = tempfile.mkdtemp(prefix='bench_session_store_')
+    try:
+        service = make_service(backend, data_dir)
+        sections = [(section_id, list(section.fields)) for section_id, section in BeritaAcaraConfig().sections.items()]
+        user_ids = [100000000 + n for n in range(sessions)]
+        shared_ids = [900000000 + n for n in range(SHARED_USERS)] if contend else []
+        for user_id in shared_ids:
+            service.create_session(user_id)
+
+        timings_per_thread = [defaultdict(list) for _ in range(threads)]
+
+        def worker(index):
+            timings = timings_per_thread[index]
+            for position, user_id in enumerate(user_ids[index::threads]):
+                technician(service, user_id, sections, updates, photos, timings)
+                if contend:
+                    # Semua thread menambah foto ke session yang sama
+                    shared_id = shared_ids[position % SHARED_USERS]
+                    started = time.perf_counter()
+                    service.add_photo(shared_id, {'file_id': f'shared_{index}_{position}'})
+                    timings['contended_add_photo'].append(time.perf_counter() - started)
+                    
+                    started = time.perf_counter()
+                    with service.unit_of_work(shared_id):
+                        service.get_session(shared_id)
+                        time.sleep(0.001)  # Upload Drive
+                        service.add_photo(shared_id, {'file_id': f'shared_unit_{index}_{position}'})
+                    timings['contended_unit_of_work'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if hasattr(service, 'close'):
+            service.close()
+
+        timings = defaultdict(list)
+        for thread_timings in timings_per_thread:
+            for name, values in thread_timings.items():
+                timings[name].extend(values)
+
+        # Verifikasi dari store yang dibuka ulang, bukan dari cache process ini
+        reopened = make_service(backend, data_dir)
+        lost = 0
+        for user_id in user_ids:
+            session = reopened._read_session(user_id) or {}
+            expected = expected_form_data(user_id, sections, updates)
+            lost += sum(1 for section_id, data in expected.items() if session.get('form_data', {}).get(section_id) != data)
+            lost += sum(1 for n in range(updates) if session.get('temp_data', {}).get(f'step_{n}') != n)
+            lost += photos - len(session.get('photos', []))
+            lost += session.get('status') != 'completed'
+        if contend:
+            contended_photos = sum(len((reopened._read_session(user_id) or {}).get('photos', [])) for user_id in shared_ids)
+            lost += len(timings['contended_add_photo']) + len(timings['contended_unit_of_work']) - contended_photos
+        if hasattr(reopened, 'close'):
+            reopened.close()
+
+        total_ops = sum(len(values) for values in timings.values())
+        result_queue.put({
+            'timings': dict(timings),
+            'ops_per_sec': total_ops / elapsed,
+            'elapsed': elapsed,
+            'size': store_size(data_dir),
+            'peak_rss_mb': peak_rss_mb(),
+            'lost': lost,
+        })
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(backend, sessions, threads, result):
+    print(f"\n== backend={backend} sessions={sessions} threads={threads} ==")
+    print(f"{'operation':>22} {'count':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for name in OPERATIONS:
+        values = result['timings'].get(name)
+        if values:
+            print(f"{name:>22} {len(values):>8} {percentile(values, 0.5) * 1000:>9.2f} {percentile(values, 0.99) * 1000:>9.2f}")
+    print(f"ops/sec {result['ops_per_sec']:.0f} | elapsed {result['elapsed']:.1f}s | "
+          f"store {result['size'] / 1e6:.2f} MB | peak RSS {result['peak_rss_mb']:.1f} MB | lost updates {result['lost']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', nargs='+', choices=['json', 'journal', 'sqlite'], default=['journal', 'sqlite'])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10, 100, 10000])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--updates', type=int, default=6, help='update_form_section + set_temp_data per technician')
+    parser.add_argument('--photos', type=int, default=3, help='add_photo per technician')
+    parser.add_argument('--contend', action='store_true', help='all threads also append photos to shared sessions')
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    failed = False
+    for backend in args.backend:
+        for sessions in args.sessions:
+            result_queue = ctx.Queue()
+            process = ctx.Process(
+                target=run_config,
+                args=(backend, sessions, args.threads, args.updates, args.photos, args.contend, result_queue)
+            )
+            process.start()
+            result = result_queue.get()
+            process.join()
+            report(backend, sessions, args.threads, result)
+            failed = failed or result['lost'] > 0
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/bench_startup.py - Waktu startup: import app.py sampai bot_ready, dan build Drive client
+"""
+Default: jalankan `import app` di process Python baru sebanyak --runs kali dan catat
+app.startup_seconds (import app.py sampai startup() selesai / bot_ready). Memakai
+environment (dan .env) yang sama seperti deploy, jadi termasuk token OAuth (cold atau
+warm tergantung token cache), init Telegram dan service Google.
+
+--client: ukur hanya pembuatan Drive client di process baru (tanpa jaringan):
+googleapiclient build('drive', 'v3') vs GoogleDriveClient dari discovery document
+yang ikut di repo. "first" = client pertama, "startup" = semua client yang dibuat
+saat startup dua form type (pola lama: drive + sheets, dua kali per form type).
+
+    python benchmarks/bench_startup.py --runs 3
+    python benchmarks/bench_startup.py --client --runs 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_SCRIPT = """
+import json, sys
+sys.path.insert(0, {root!r})
+import app
+print(json.dumps({{'startup_seconds': app.startup_seconds, 'bot_ready': app.bot_ready}}))
+"""
+
+# Import tidak ikut diukur; yang dibandingkan hanya pembuatan client
+BUILD_SCRIPT = """
+import json, time
+import httplib2
+from googleapiclient.discovery import build
+started = time.perf_counter()
+build('drive', 'v3', http=httplib2.Http())
+first = time.perf_counter() - started
+# Pola startup lama: 2 form type, masing-masing build drive + sheets dua kali (authenticate + ensure_valid_token)
+for _ in range(4):
+    build('drive', 'v3', http=httplib2.Http())
+    build('sheets', 'v4', http=httplib2.Http())
+print(json.dumps({'seconds': first, 'startup_seconds': time.perf_counter() - started}))
+"""
+
+BUNDLED_SCRIPT = """
+import json, os, sys, time
+os.environ.setdefault('TOKEN_CACHE_FILE', '')
+sys.path.insert(0, {root!r})
+from services.google_drive_client import GoogleDriveClient
+from oauth_token_manager import CredentialPool, OAuthTokenManager
+started = time.perf_counter()
+client = GoogleDriveClient(CredentialPool({{'default': OAuthTokenManager('')}}))
+client.service
+first = time.perf_counter() - started
+# Service form type berikutnya memakai client yang sama
+for _ in range(3):
+    client.service
+print(json.dumps({{'seconds': first, 'startup_seconds': time.perf_counter() - started}}))
+"""
+
+
+def run_script(script):
+    """Run a script in a fresh interpreter; returns its last stdout line as JSON"""
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit {result.returncode}")
+    return json.loads(lines[-1])
+
+
+def report(name, values):
+    ordered = sorted(values)
+    print(f"{name:>32}: min {ordered[0] * 1000:>8.1f} ms  median {ordered[len(ordered) // 2] * 1000:>8.1f} ms  "
+          f"max {ordered[-1] * 1000:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--client', action='store_true', help='hanya ukur pembuatan Drive client (offline)')
+    args = parser.parse_args()
+
+    if args.client:
+        for name, script in (('googleapiclient build', BUILD_SCRIPT),
+                             ('bundled discovery', BUNDLED_SCRIPT.format(root=ROOT))):
+            results = [run_script(script) for _ in range(args.runs)]
+            report(f'{name} (first)', [result['seconds'] for result in results])
+            report(f'{name} (startup)', [result['startup_seconds'] for result in results])
+        return
+
+    timings = []
+    for run in range(args.runs):
+        try:
+            result = run_script(APP_SCRIPT.format(root=ROOT))
+        except RuntimeError as e:
+            print(f"❌ run {run + 1}: app.py failed to start: {e}")
+            sys.exit(1)
+        print(f"run {run + 1}: startup {result['startup_seconds']:.2f}s, bot_ready={result['bot_ready']}")
+        timings.append(result['startup_seconds'])
+    report('import app -> bot_ready', timings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# benchmarks/bench_token_startup.py - Waktu startup token OAuth: cold vs warm (token cache di disk)
+"""
+Simulasi beberapa worker gunicorn yang start bersamaan dan masing-masing perlu
+access token (seperti authenticate() di BeritaAcaraBot.__init__).
+
+Token endpoint Google diganti server lokal dengan latency --latency-ms, yang
+menghitung berapa request refresh yang masuk. Setiap worker adalah process baru
+(spawn) dan mengukur waktu dari import oauth_token_manager sampai token didapat.
+
+    cold: token cache dihapus dulu (deploy pertama)
+    warm: token cache dari run sebelumnya masih ada (redeploy / worker recycle)
+    no-cache: TOKEN_CACHE_FILE='' (perilaku tanpa token cache)
+
+    python benchmarks/bench_token_startup.py --workers 4 --latency-ms 300
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_token_server(latency_ms):
+    """Fake token endpoint; returns (server, request counter)"""
+    counter = {'requests': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            with lock:
+                counter['requests'] += 1
+                number = counter['requests']
+            time.sleep(latency_ms / 1000)
+            body = json.dumps({'access_token': f'bench-token-{number}', 'expires_in': 3599}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counter
+
+
+def run_worker(token_url, cache_file, start_event, result_queue):
+    """One worker process: import the token manager and get a token"""
+    import logging
+    logging.disable(logging.CRITICAL)
+    os.environ['TOKEN_CACHE_FILE'] = cache_file
+    sys.path.insert(0, ROOT)
+
+    start_event.wait()
+    started = time.perf_counter()
+    import oauth_token_manager
+    oauth_token_manager.TOKEN_URL = token_url
+    token = oauth_token_manager.get_access_token()
+    result_queue.put((time.perf_counter() - started, token))
+
+
+def run_round(workers, token_url, cache_file):
+    context = multiprocessing.get_context('spawn')
+    start_event = context.Event()
+    result_queue = context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(token_url, cache_file, start_event, result_queue))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(0.5)  # Tunggu interpreter semua worker siap
+    start_event.set()
+    results = [result_queue.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency-ms', type=float, default=300, help='latency token endpoint palsu')
+    args = parser.parse_args()
+
+    os.environ.update(CLIENT_ID='bench-client', CLIENT_SECRET='bench-secret', REFRESH_TOKEN='bench-refresh')
+    server, counter = make_token_server(args.latency_ms)
+    token_url = f'http://127.0.0.1:{server.server_address[1]}/token'
+    cache_dir = tempfile.mkdtemp(prefix='bench_token_startup_')
+    cache_file = os.path.join(cache_dir, 'ba_oauth_token.json')
+
+    print(f"workers={args.workers} latency={args.latency_ms:.0f}ms")
+    print(f"{'round':>9} {'avg ms':>9} {'max ms':>9} {'refreshes':>10} {'tokens':>7}")
+    try:
+        for name, round_cache_file in (('no-cache', ''), ('cold', cache_file), ('warm', cache_file)):
+            before = counter['requests']
+            results = run_round(args.workers, token_url, round_cache_file)
+            timings = [elapsed for elapsed, _ in results]
+            tokens = {token for _, token in results}
+            if None in tokens:
+                print(f"❌ {name}: some workers got no token")
+            print(f"{name:>9} {sum(timings) / len(timings) * 1000:>9.1f} {max(timings) * 1000:>9.1f} "
+                  f"{counter['requests'] - before:>10} {len(tokens):>7}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
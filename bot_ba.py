@@ -1,8 +1,10 @@
 # bot_ba.py - Bot Berita Acara Pro Wifi (FIXED)
 import os
 import re
+import io
 import asyncio
 import logging
+import contextvars
 import tempfile
 from datetime import datetime
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
@@ -18,8 +20,9 @@ from telegram.ext import (
 from PIL import Image as PILImage, ImageDraw
 from PIL import Image
 
-from services.google_ba_service import GoogleBAService
-from services.session_ba_service import SessionBAService
+from services.google_ba_service import GoogleBAService, warm_template_caches
+from services.google_ba_async import AsyncGoogleBAService
+from services.session_ba_service import create_session_service
 from services.photo_handler import PhotoHandler
 from config.ba_config import BeritaAcaraConfig
 
@@ -48,10 +51,27 @@ class BeritaAcaraBot:
             if not self.google_services[form_type].authenticate():
                 raise Exception(f"Failed to authenticate Google APIs for {form_type}")
         
-        self.session_service = SessionBAService()
+        # Isi cache template di background supaya generate pertama tidak menunggu download
+        warm_template_caches(list(self.google_services.values()))
+        
+        for form_type in form_configs:
+            # Handler hanya memakai facade async, call Drive berjalan di executor
+            self.google_services[form_type] = AsyncGoogleBAService(self.google_services[form_type])
+        
+        self.session_service = create_session_service()
         self.ba_config = BeritaAcaraConfig()
         self.photo_handler = PhotoHandler(self.google_services, self.session_service)
         
+        # Session sweeper: hapus session kadaluarsa sedikit demi sedikit di event loop bot
+        self.session_ttl_days = int(os.environ.get('SESSION_TTL_DAYS', '7'))
+        self.session_sweep_interval = float(os.environ.get('SESSION_SWEEP_INTERVAL', '300'))
+        self.session_sweep_batch = int(os.environ.get('SESSION_SWEEP_BATCH', '50'))
+        self._sweeper_task = None
+        
+        # Folder laporan yang disiapkan di background selama form diisi, per user
+        self._provisioning_tasks = {}
+        self._provisioning_requests = set()
+        self._background_tasks = set()
 
     async def initialize_application(self):
         """Initialize Telegram Application"""
@@ -68,6 +88,10 @@ class BeritaAcaraBot:
             logger.info("Initializing Telegram Application...")
             await self.application.initialize()
             
+            # Start background session sweeper
+            if self._sweeper_task is None:
+                self._sweeper_task = asyncio.create_task(self.run_session_sweeper())
+            
             logger.info("Telegram Application initialized successfully")
             return True
             
@@ -75,6 +99,138 @@ class BeritaAcaraBot:
             logger.error(f"Failed to initialize Telegram Application: {e}")
             return False
 
+    async def run_session_sweeper(self):
+        """Evict expired sessions in small batches, forever"""
+        logger.info(f"🧹 Session sweeper started (TTL {self.session_ttl_days} days, every {self.session_sweep_interval}s)")
+        while True:
+            try:
+                await asyncio.sleep(self.session_sweep_interval)
+                
+                # Batch penuh berarti masih ada sisa; lanjutkan tanpa menunggu interval berikutnya
+                while True:
+                    expired = []
+                    removed = await asyncio.to_thread(
+                        self.session_service.sweep_expired_sessions,
+                        self.session_ttl_days,
+                        self.session_sweep_batch,
+                        lambda user_id, session: expired.append(session)
+                    )
+                    if removed:
+                        logger.info(f"🧹 Session sweeper removed {removed} expired sessions")
+                    
+                    # Form yang ditinggalkan: folder yang sudah disiapkan ikut dihapus
+                    for session in expired:
+                        await self.discard_provisioned_folders(session)
+                    if removed < self.session_sweep_batch:
+                        break
+                    
+            except asyncio.CancelledError:
+                logger.info("Session sweeper stopped")
+                raise
+            except Exception as e:
+                logger.error(f"Error in session sweeper: {e}")
+
+    def _has_filename_inputs(self, form_data):
+        """Nama folder/file hanya stabil kalau JENIS LAYANAN dan NO WO / AO sudah diisi"""
+        return bool(
+            (form_data.get('tanggal_layanan') or {}).get('JENIS LAYANAN', '').strip()
+            and (form_data.get('identitas') or {}).get('NO WO / AO', '').strip()
+        )
+
+    def request_folder_provisioning(self, user_id):
+        """Prepare the report folders once this update's session changes are committed"""
+        self._provisioning_requests.add(user_id)
+
+    def schedule_folder_provisioning(self, user_id):
+        """Start preparing the report folders in the background"""
+        previous = self._provisioning_tasks.get(user_id)
+        
+        async def provision():
+            # Satu provisioning per user pada satu waktu, urut sesuai perubahan data
+            if previous is not None:
+                await asyncio.wait([previous])
+            return await self.provision_report_folders(user_id)
+        
+        # Context baru: task ini tidak boleh memakai unit of work milik update yang memicunya
+        task = asyncio.create_task(provision(), context=contextvars.Context())
+        self._provisioning_tasks[user_id] = task
+        task.add_done_callback(
+            lambda done: self._provisioning_tasks.pop(user_id, None) if self._provisioning_tasks.get(user_id) is done else None
+        )
+
+    async def provision_report_folders(self, user_id, provisioned=None):
+        """Create or rename the report folders for the current form data, returns the provisioned info
+
+        ``provisioned``: hasil provisioning yang belum terlihat di session yang sedang dibaca.
+        """
+        try:
+            session = self.session_service.get_session(user_id)
+            if not session or session.get('excel_generated'):
+                return None
+            
+            form_data = session.get('form_data', {})
+            if not self._has_filename_inputs(form_data):
+                return None
+            
+            folder_name = self._generate_filename(form_data)
+            google_service = self.google_services.get(session.get('form_type', 'wifi'))
+            provisioned = provisioned or session.get('provisioned_folders')
+            
+            if provisioned and provisioned.get('name') == folder_name:
+                return provisioned
+            
+            if provisioned:
+                # Nama berubah (JENIS LAYANAN / NO WO diedit): cukup rename folder utama
+                if await google_service.rename_file(
+                    provisioned['report_folder_id'], folder_name, identity=provisioned.get('drive_identity')
+                ):
+                    provisioned['name'] = folder_name
+                else:
+                    await self.discard_provisioned_folders(session)
+                    provisioned = None
+            
+            if not provisioned:
+                report_folder_id, evidence_folder_id, ba_form_folder_id = await google_service.create_folder_structure(folder_name)
+                if not report_folder_id:
+                    return None
+                provisioned = {
+                    'name': folder_name,
+                    'report_folder_id': report_folder_id,
+                    'evidence_folder_id': evidence_folder_id,
+                    'ba_form_folder_id': ba_form_folder_id,
+                    # Generate Excel dan upload ke folder ini memakai identitas OAuth yang sama
+                    'drive_identity': google_service.folder_identity(report_folder_id)
+                }
+            
+            # Session bisa di-reset (/start) atau dihapus selama folder dibuat
+            current = self.session_service.get_session(user_id)
+            if not current or current.get('created_at') != session.get('created_at') or current.get('excel_generated'):
+                await self.discard_provisioned_folders({'provisioned_folders': provisioned, 'form_type': session.get('form_type')})
+                return None
+            
+            self.session_service.update_session(user_id, {'provisioned_folders': provisioned})
+            logger.info(f"📁 Report folders provisioned for user {user_id}: {folder_name}")
+            return provisioned
+            
+        except Exception as e:
+            logger.error(f"Error provisioning report folders for user {user_id}: {e}")
+            return None
+
+    async def discard_provisioned_folders(self, session):
+        """Delete folders provisioned for a form that never generated its Excel"""
+        provisioned = (session or {}).get('provisioned_folders')
+        if not provisioned or session.get('excel_generated'):
+            return False
+        
+        google_service = self.google_services.get(session.get('form_type') or 'wifi')
+        # Subfolder ikut terhapus bersama folder utama
+        deleted = await google_service.delete_folder(
+            provisioned['report_folder_id'], identity=provisioned.get('drive_identity')
+        )
+        if deleted:
+            logger.info(f"🗑️ Discarded provisioned folder {provisioned.get('name')}")
+        return deleted
+
     def _generate_filename(self, form_data):
         """Generate filename based on form data"""
         try:
@@ -394,8 +550,17 @@ class BeritaAcaraBot:
             user_id = update.effective_user.id if update.effective_user else 'Unknown'
             logger.info(f"Processing update for user: {user_id}")
             
-            # Process the update
-            await self.application.process_update(update)
+            # Process the update; session dibaca sekali dan ditulis sekali per update
+            if update.effective_user:
+                with self.session_service.unit_of_work(user_id):
+                    await self.application.process_update(update)
+                
+                # Provisioning membaca session dari store, jadi baru dimulai setelah commit
+                if user_id in self._provisioning_requests:
+                    self._provisioning_requests.discard(user_id)
+                    self.schedule_folder_provisioning(user_id)
+            else:
+                await self.application.process_update(update)
             logger.info("Update processed successfully")
             
         except Exception as e:
@@ -417,6 +582,13 @@ class BeritaAcaraBot:
             user_id = update.effective_user.id
             logger.info(f"User {user_id} started bot")
             
+            # Folder yang disiapkan untuk form sebelumnya (belum di-generate) tidak dipakai lagi
+            previous_session = self.session_service.get_session(user_id)
+            if previous_session and previous_session.get('provisioned_folders'):
+                task = asyncio.create_task(self.discard_provisioned_folders(previous_session))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+            
             # Create new session
             self.session_service.create_session(user_id)
             
@@ -771,6 +943,9 @@ class BeritaAcaraBot:
                     "Data telah disimpan ke formulir."
                 )
                 
+                if current_section in ('tanggal_layanan', 'identitas'):
+                    self.request_folder_provisioning(user_id)
+                
                 # Clear context
                 context.user_data.pop('current_section', None)
                 context.user_data.pop('current_field', None)
@@ -907,20 +1082,22 @@ class BeritaAcaraBot:
             
             # Hapus folder dari Google Drive jika ada
             folder_ids = [
-                session.get('evidence_folder_id'),
-                session.get('ba_form_folder_id'), 
-                session.get('report_folder_id')
+                (session.get('evidence_folder_id'), session.get('drive_identity')),
+                (session.get('ba_form_folder_id'), session.get('drive_identity')),
+                (session.get('report_folder_id'), session.get('drive_identity'))
             ]
+            provisioned = session.get('provisioned_folders')
+            if provisioned and not session.get('excel_generated'):
+                folder_ids.append((provisioned['report_folder_id'], provisioned.get('drive_identity')))
             
             deleted_count = 0
-            for folder_id in folder_ids:
+            for folder_id, identity in folder_ids:
                 if folder_id:
-                    try:
-                        google_service.service_drive.files().delete(fileId=folder_id).execute()
+                    if await google_service.delete_folder(folder_id, identity=identity):
                         deleted_count += 1
                         logger.info(f"🗑️ Deleted folder: {folder_id}")
-                    except Exception as e:
-                        logger.warning(f"⚠️ Could not delete folder {folder_id}: {e}")
+                    else:
+                        logger.warning(f"⚠️ Could not delete folder {folder_id}")
             
             # Hapus session
             self.session_service.delete_session(user_id)
@@ -1163,93 +1340,80 @@ class BeritaAcaraBot:
             photo = update.message.photo[-1]
             file = await context.bot.get_file(photo.file_id)
             
-            # Create temporary file with proper cleanup handling
-            temp_file = None
-            try:
-                # Create temporary file
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-                await file.download_to_drive(temp_file.name)
-                temp_file.close()
+            # Download langsung ke memory, tanpa file sementara
+            image_data = await file.download_as_bytearray()
+            
+            # Process and resize the signature image
+            processed_path = await self.process_signature_image(io.BytesIO(image_data))
+            
+            if processed_path:
+                # Get existing signature data
+                existing_data = self.session_service.get_form_section(user_id, 'tanda_tangan') or {}
                 
-                # Process and resize the signature image
-                processed_path = await self.process_signature_image(temp_file.name)
+                # Add new signature
+                existing_data[signature_type] = f"SIGNATURE_IMAGE:{processed_path}"
                 
-                if processed_path:
-                    # Get existing signature data
-                    existing_data = self.session_service.get_form_section(user_id, 'tanda_tangan') or {}
+                # Save to session
+                success = self.session_service.update_form_section(
+                    user_id, 'tanda_tangan', existing_data
+                )
+                
+                if success:
+                    # PERBAIKAN: Beri tahu jika masih ada tanda tangan yang belum diisi
+                    current_data = self.session_service.get_form_section(user_id, 'tanda_tangan') or {}
+                    has_teknisi = bool(current_data.get('TTD TEKNISI'))
+                    has_pelanggan = bool(current_data.get('TTD PELANGGAN'))
                     
-                    # Add new signature
-                    existing_data[signature_type] = f"SIGNATURE_IMAGE:{processed_path}"
+                    completion_message = ""
+                    if not has_teknisi or not has_pelanggan:
+                        missing = []
+                        if not has_teknisi:
+                            missing.append("TTD Teknisi")
+                        if not has_pelanggan:
+                            missing.append("TTD Pelanggan")
+                        completion_message = f"\n\n⚠️ Masih perlu: {', '.join(missing)}"
+                    # Update processing message
+                    if processing_msg:
+                        await self.safe_edit_message(
+                            None,  # Tidak ada query di sini, jadi None
+                            f"✅ Tanda tangan {signature_type} berhasil disimpan!{completion_message}\n\n"
+                            "Silakan lanjutkan mengisi form atau pilih 'Lihat Form' untuk melanjutkan.",
+                            chat_id=update.effective_chat.id,
+                            message_id=processing_msg.message_id
+                        )
                     
-                    # Save to session
-                    success = self.session_service.update_form_section(
-                        user_id, 'tanda_tangan', existing_data
-                    )
+                    # Clear temp data
+                    context.user_data.pop('current_signature_type', None)
                     
-                    if success:
-                        # PERBAIKAN: Beri tahu jika masih ada tanda tangan yang belum diisi
-                        current_data = self.session_service.get_form_section(user_id, 'tanda_tangan') or {}
-                        has_teknisi = bool(current_data.get('TTD TEKNISI'))
-                        has_pelanggan = bool(current_data.get('TTD PELANGGAN'))
-                        
-                        completion_message = ""
-                        if not has_teknisi or not has_pelanggan:
-                            missing = []
-                            if not has_teknisi:
-                                missing.append("TTD Teknisi")
-                            if not has_pelanggan:
-                                missing.append("TTD Pelanggan")
-                            completion_message = f"\n\n⚠️ Masih perlu: {', '.join(missing)}"
-                        # Update processing message
-                        if processing_msg:
-                            await self.safe_edit_message(
-                                None,  # Tidak ada query di sini, jadi None
-                                f"✅ Tanda tangan {signature_type} berhasil disimpan!{completion_message}\n\n"
-                                "Silakan lanjutkan mengisi form atau pilih 'Lihat Form' untuk melanjutkan.",
-                                chat_id=update.effective_chat.id,
-                                message_id=processing_msg.message_id
-                            )
-                        
-                        # Clear temp data
-                        context.user_data.pop('current_signature_type', None)
-                        
-                        # Show form menu
-                        return await self.show_form_menu(update, context)
-                    else:
-                        if processing_msg:
-                            await self.safe_edit_message(
-                                None,
-                                "❌ Gagal menyimpan tanda tangan. Silakan coba lagi.",
-                                chat_id=update.effective_chat.id,
-                                message_id=processing_msg.message_id
-                            )
+                    # Show form menu
+                    return await self.show_form_menu(update, context)
                 else:
                     if processing_msg:
                         await self.safe_edit_message(
                             None,
-                            "❌ Gagal memproses gambar tanda tangan. Pastikan gambar jelas dan terang.",
+                            "❌ Gagal menyimpan tanda tangan. Silakan coba lagi.",
                             chat_id=update.effective_chat.id,
                             message_id=processing_msg.message_id
                         )
-                    
-            finally:
-                # Always clean up the original temp file
-                try:
-                    if temp_file and os.path.exists(temp_file.name):
-                        os.remove(temp_file.name)
-                except Exception as cleanup_error:
-                    logger.warning(f"⚠️ Could not clean up temp file: {cleanup_error}")
+            else:
+                if processing_msg:
+                    await self.safe_edit_message(
+                        None,
+                        "❌ Gagal memproses gambar tanda tangan. Pastikan gambar jelas dan terang.",
+                        chat_id=update.effective_chat.id,
+                        message_id=processing_msg.message_id
+                    )
                     
         except Exception as e:
             logger.error(f"Error processing signature image: {e}")
             await self.safe_send_message(context, update.effective_chat.id, "❌ Terjadi kesalahan saat memproses tanda tangan.")
             return SIGNATURE_UPLOAD
 
-    async def process_signature_image(self, image_path):
-        """Process signature image with specific resolution requirements"""
+    async def process_signature_image(self, image_source):
+        """Process signature image (path or file-like) with specific resolution requirements"""
         try:
             # Open and process the image
-            with Image.open(image_path) as img:
+            with Image.open(image_source) as img:
                 # Convert to RGB if necessary
                 if img.mode != 'RGB':
                     img = img.convert('RGB')
@@ -1316,16 +1480,12 @@ class BeritaAcaraBot:
                 return INPUT_DATA
             
             # Save data to session
-            session = self.session_service.get_session(user_id)
             if not session:
                 await update.message.reply_text("❌ Session error. Silakan /start ulang.")
                 return ConversationHandler.END
             
-            # Update form data
-            form_data = session.get('form_data', {})
-            form_data[current_section] = parsed_data
-            
-            self.session_service.update_session(user_id, {'form_data': form_data})
+            # Update form data (section yang tidak berubah tidak ditulis ulang)
+            self.session_service.update_form_section(user_id, current_section, parsed_data)
             
             # Show confirmation
             return await self.show_section_confirmation(update, context, current_section, parsed_data)
@@ -1407,6 +1567,10 @@ class BeritaAcaraBot:
                 section_id = data.replace("save_", "")
                 await self.safe_edit_message(query, "✅ Data berhasil disimpan!")
                 
+                # Nama laporan sudah diketahui: siapkan folder Drive sebelum generate
+                if section_id in ('tanggal_layanan', 'identitas'):
+                    self.request_folder_provisioning(update.effective_user.id)
+                
                 # Clear current section from context
                 context.user_data.pop('current_section', None)
                 
@@ -1606,11 +1770,22 @@ class BeritaAcaraBot:
             # Generate filename from form data
             filename = self._generate_filename(form_data)
             
+            # Pakai folder yang sudah disiapkan selama form diisi (tunggu kalau masih dibuat)
+            # Session update ini dibaca sebelum task selesai, jadi hasil task dipakai langsung
+            pending = self._provisioning_tasks.get(user_id)
+            provisioned = await asyncio.shield(pending) if pending is not None else None
+            provisioned = await self.provision_report_folders(user_id, provisioned)
+            folders = None
+            identity = None
+            if provisioned:
+                folders = (provisioned['report_folder_id'], provisioned['evidence_folder_id'], provisioned['ba_form_folder_id'])
+                identity = provisioned.get('drive_identity')
+            
             # Process Excel with organized folder structure
             google_service = self.get_current_google_service(user_id)
             form_type = session.get('form_type', 'wifi')
             success, result = await google_service.process_excel_only(
-                form_data, filename, self.ba_config, form_type
+                form_data, filename, self.ba_config, form_type, folders, identity=identity
             )
             
             if success:
@@ -1632,7 +1807,9 @@ class BeritaAcaraBot:
                     'evidence_folder_id': result_info.get('evidence_folder_id'),
                     'report_folder_id': result_info.get('report_folder_id'),
                     'ba_form_folder_id': result_info.get('ba_form_folder_id'),
+                    'drive_identity': result_info.get('drive_identity'),
                     'excel_generated': True,  # Flag bahwa Excel sudah digenerate
+                    'provisioned_folders': None,  # Sudah menjadi folder laporan
                     'form_data': form_data  # Jangan hapus form data, simpan untuk referensi
                 })
                 
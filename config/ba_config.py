@@ -5,7 +5,8 @@ import os
 import tempfile
 from PIL import Image, ImageDraw
 from dataclasses import dataclass
-from typing import Dict, Optional
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Mapping, Optional, Tuple
 
 @dataclass
 class FieldConfig:
@@ -24,7 +25,37 @@ class SectionConfig:
     required: bool = False
     is_signature: bool = False
 
+@dataclass(frozen=True)
+class FieldPlan:
+    """Salinan FieldConfig yang read-only, dipakai di FormPlan"""
+    wifi_coordinate: Optional[str] = None
+    datin_coordinate: Optional[str] = None
+    field_type: str = 'text'
+    required: bool = False
+    options: Optional[Tuple[str, ...]] = None
+
+@dataclass(frozen=True)
+class SectionPlan:
+    """Salinan SectionConfig yang read-only, fields hanya yang ada di form type ini"""
+    name: str
+    fields: Mapping[str, FieldPlan]
+    required: bool = False
+    is_signature: bool = False
+
+@dataclass(frozen=True)
+class FormPlan:
+    """Lookup yang sudah di-compile untuk satu form type (read-only)"""
+    form_type: str
+    sections: Mapping[str, SectionPlan]  # Section yang tersedia, fields sudah difilter
+    coordinates: Mapping[str, Mapping[str, str]]  # {section_id: {field_name: koordinat}}
+    excel_coordinates: Tuple[str, ...]  # Semua koordinat yang bisa diisi, termasuk HARI/TANGGAL
+    required_sections: FrozenSet[str]
+    dropdowns: Mapping[Tuple[str, str], Mapping[str, str]]  # {(section_id, field): {OPSI UPPER: opsi}}
+    signature_coordinates: Mapping[str, str]  # {field tanda tangan: koordinat}
+
 class BeritaAcaraConfig:
+    FORM_TYPES = ('wifi', 'datin')
+
     def __init__(self):
         # Definisi semua section formulir untuk Wifi dan Datin
         self.sections = {
@@ -414,31 +445,92 @@ class BeritaAcaraConfig:
             )
         }
 
-    def get_sections_for_form_type(self, form_type):
-        """Get sections yang tersedia untuk tipe form tertentu"""
-        available_sections = {}
-        
+        # Plan per form type di-compile sekali; semua lookup di bawah cukup akses dict
+        self.plans = {form_type: self._compile_plan(form_type) for form_type in self.FORM_TYPES}
+
+    def _compile_plan(self, form_type):
+        """Build the frozen lookups for one form type from self.sections
+
+        Section dan field di plan adalah salinan frozen (SectionPlan/FieldPlan), jadi plan
+        tidak bisa diubah lewat object yang dikembalikan, dan perubahan self.sections setelah
+        compile tidak ikut mengubah plan.
+        """
+        sections = {}
+        coordinates = {}
+        dropdowns = {}
+        signature_coordinates = {}
+        excel_coordinates = ['O4', 'S4']  # HARI dan TANGGAL (diisi otomatis)
+
         for section_id, section_config in self.sections.items():
             # Filter fields berdasarkan tipe form
             available_fields = {}
-            
+            field_coordinates = {}
             for field_name, field_config in section_config.fields.items():
                 coordinate = self.get_coordinate_for_form_type(field_config, form_type)
-                if coordinate:  # Jika field tersedia untuk form type ini
-                    available_fields[field_name] = field_config
-            
-            # Jika ada field yang tersedia, masukkan section
+                if not coordinate:  # Field tidak ada di form type ini
+                    continue
+                available_fields[field_name] = FieldPlan(
+                    wifi_coordinate=field_config.wifi_coordinate,
+                    datin_coordinate=field_config.datin_coordinate,
+                    field_type=field_config.field_type,
+                    required=field_config.required,
+                    options=tuple(field_config.options) if field_config.options is not None else None
+                )
+                field_coordinates[field_name] = coordinate
+                excel_coordinates.append(coordinate)
+
+                if field_config.field_type == 'dropdown' and field_config.options:
+                    options = {}
+                    for option in field_config.options:
+                        options.setdefault(option.strip().upper(), option)
+                    dropdowns[(section_id, field_name)] = MappingProxyType(options)
+                if section_config.is_signature:
+                    signature_coordinates[field_name] = coordinate
+
             if available_fields:
-                # Create new section config with filtered fields
-                filtered_section = SectionConfig(
+                sections[section_id] = SectionPlan(
                     name=section_config.name,
-                    fields=available_fields,
+                    fields=MappingProxyType(available_fields),
                     required=section_config.required,
                     is_signature=section_config.is_signature
                 )
-                available_sections[section_id] = filtered_section
-        
-        return available_sections
+                coordinates[section_id] = MappingProxyType(field_coordinates)
+
+        return FormPlan(
+            form_type=form_type,
+            sections=MappingProxyType(sections),
+            coordinates=MappingProxyType(coordinates),
+            excel_coordinates=tuple(dict.fromkeys(excel_coordinates)),
+            required_sections=frozenset(
+                section_id for section_id, section_config in sections.items() if section_config.required
+            ),
+            dropdowns=MappingProxyType(dropdowns),
+            signature_coordinates=MappingProxyType(signature_coordinates)
+        )
+
+    def get_plan(self, form_type):
+        """Compiled FormPlan untuk form type (form type tidak dikenal mendapat plan kosong)"""
+        plan = self.plans.get(form_type)
+        if plan is None:
+            # Plan kosong juga disimpan supaya tidak di-compile ulang setiap call
+            plan = self.plans.setdefault(form_type, self._compile_plan(form_type))
+        return plan
+
+    def get_sections_for_form_type(self, form_type):
+        """Get sections yang tersedia untuk tipe form tertentu (read-only, dari plan)"""
+        return self.get_plan(form_type).sections
+
+    def field_registry(self):
+        """Semua section ID dan nama field sesuai urutan definisi (tanpa duplikat)"""
+        registry = []
+        for section_id, section_config in self.sections.items():
+            registry.append(section_id)
+            registry.extend(section_config.fields.keys())
+        return list(dict.fromkeys(registry))
+
+    def excel_coordinates(self, form_type):
+        """Semua koordinat yang bisa diisi prepare_excel_data untuk form type ini"""
+        return list(self.get_plan(form_type).excel_coordinates)
 
     def get_coordinate_for_form_type(self, field_config, form_type):
         """Get koordinat Excel berdasarkan tipe form"""
@@ -537,13 +629,14 @@ class BeritaAcaraConfig:
             import logging
             logger = logging.getLogger(__name__)
             
-            available_sections = self.get_sections_for_form_type(form_type)
+            plan = self.get_plan(form_type)
             
-            if section_id not in available_sections:
+            if section_id not in plan.sections:
                 logger.error(f"Section {section_id} not found in available sections for {form_type}")
                 return None
             
-            section_config = available_sections[section_id]
+            section_config = plan.sections[section_id]
+            field_coordinates = plan.coordinates[section_id]
             parsed_data = {}
             
             logger.info(f"Parsing section {section_id} for form type {form_type}")
@@ -611,27 +704,26 @@ class BeritaAcaraConfig:
                             break
                     
                     if matched_field_name and matched_field_config:
-                        coordinate = self.get_coordinate_for_form_type(matched_field_config, form_type)
+                        coordinate = field_coordinates.get(matched_field_name)
                         
                         logger.info(f"Field {matched_field_name} has coordinate: {coordinate}")
                         
                         if coordinate:  # Hanya proses jika ada koordinat untuk form type ini
                             # Validasi khusus untuk field dropdown
-                            if matched_field_config.field_type == 'dropdown' and matched_field_config.options:
+                            dropdown_options = plan.dropdowns.get((section_id, matched_field_name))
+                            if dropdown_options is not None:
                                 logger.info(f"Processing dropdown field {matched_field_name} with options: {matched_field_config.options}")
                                 
-                                # Normalisasi input dan options untuk perbandingan case-insensitive
+                                # Normalisasi input untuk perbandingan case-insensitive dengan options
                                 normalized_value = field_value.strip().upper()
-                                normalized_options = [opt.strip().upper() for opt in matched_field_config.options]
                                 
-                                logger.info(f"Normalized value: {normalized_value}, options: {normalized_options}")
+                                logger.info(f"Normalized value: {normalized_value}, options: {list(dropdown_options)}")
                                 
                                 # Cek apakah input valid (case-insensitive)
-                                if normalized_value in normalized_options:
+                                if normalized_value in dropdown_options:
                                     # Simpan dengan format original dari options
-                                    original_index = normalized_options.index(normalized_value)
-                                    parsed_data[matched_field_name] = matched_field_config.options[original_index]
-                                    logger.info(f"✅ Dropdown field {matched_field_name} saved: {matched_field_config.options[original_index]}")
+                                    parsed_data[matched_field_name] = dropdown_options[normalized_value]
+                                    logger.info(f"✅ Dropdown field {matched_field_name} saved: {dropdown_options[normalized_value]}")
                                 else:
                                     # Input tidak valid untuk dropdown
                                     if field_value.strip():  # Jika ada value tapi tidak valid
@@ -651,10 +743,7 @@ class BeritaAcaraConfig:
             
             # Initialize hanya fields yang tersedia untuk form type ini dan BELUM terisi
             for field_name in section_config.fields.keys():
-                field_config = section_config.fields[field_name]
-                coordinate = self.get_coordinate_for_form_type(field_config, form_type)
-                
-                if coordinate and field_name not in parsed_data:
+                if field_name not in parsed_data:
                     parsed_data[field_name] = ""
                     logger.info(f"🔄 Initialized empty field: {field_name}")
             
@@ -664,19 +753,15 @@ class BeritaAcaraConfig:
 
     def get_excel_coordinates(self, section_id, field_name, form_type):
         """Get Excel coordinate untuk field tertentu berdasarkan form type"""
-        available_sections = self.get_sections_for_form_type(form_type)
-        
-        if section_id in available_sections:
-            section_config = available_sections[section_id]
-            if field_name in section_config.fields:
-                field_config = section_config.fields[field_name]
-                return self.get_coordinate_for_form_type(field_config, form_type)
-        return None
+        field_coordinates = self.get_plan(form_type).coordinates.get(section_id)
+        if field_coordinates is None:
+            return None
+        return field_coordinates.get(field_name)
 
     def prepare_excel_data(self, form_data, form_type):
         """Prepare data untuk Excel insertion berdasarkan coordinates dan form type"""
         excel_data = {}
-        available_sections = self.get_sections_for_form_type(form_type)
+        plan = self.get_plan(form_type)
         
         # TAMBAHAN: Isi data otomatis untuk HARI dan TANGGAL
         auto_data = self.get_auto_filled_data()
@@ -690,29 +775,28 @@ class BeritaAcaraConfig:
             excel_data['S4'] = auto_data['TANGGAL']
         
         for section_id, section_data in form_data.items():
-            if section_id in available_sections:
-                section_config = available_sections[section_id]
-                
+            field_coordinates = plan.coordinates.get(section_id)
+            if field_coordinates is not None:
                 for field_name, field_value in section_data.items():
-                    if field_name in section_config.fields:
-                        field_config = section_config.fields[field_name]
-                        coordinate = self.get_coordinate_for_form_type(field_config, form_type)
-                        
-                        if coordinate and field_value:
-                            # Untuk tanda tangan, akan ditangani secara khusus
-                            if section_id == 'tanda_tangan' and field_value.startswith('SIGNATURE_IMAGE:'):
-                                excel_data[coordinate] = "Tanda Tangan"
-                            else:
-                                excel_data[coordinate] = str(field_value).strip()
+                    coordinate = field_coordinates.get(field_name)
+                    
+                    if coordinate and field_value:
+                        # Untuk tanda tangan, akan ditangani secara khusus
+                        if section_id == 'tanda_tangan' and field_value.startswith('SIGNATURE_IMAGE:'):
+                            excel_data[coordinate] = "Tanda Tangan"
+                        else:
+                            excel_data[coordinate] = str(field_value).strip()
         
         return excel_data
 
     def validate_required_sections(self, form_data, form_type):
         """Check apakah required sections terisi berdasarkan form type"""
-        available_sections = self.get_sections_for_form_type(form_type)
+        plan = self.get_plan(form_type)
+        available_sections = plan.sections
+        # Urutan definisi section dipertahankan untuk pesan section yang kurang
         required_sections = [
-            section_id for section_id, section_config in available_sections.items() 
-            if section_config.required
+            section_id for section_id in available_sections
+            if section_id in plan.required_sections
         ]
         
         missing_sections = []
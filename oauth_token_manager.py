@@ -1,111 +1,451 @@
 import os
+import json
+import asyncio
+import hashlib
 import requests
+import tempfile
 import time
 import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+try:
+    import fcntl
+except ImportError:  # Windows: refresh hanya single-flight di dalam satu process
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
-# Global cache untuk access_token
-_token_cache = {
-    'access_token': None,
-    'expires_at': None
-}
+TOKEN_URL = "https://oauth2.googleapis.com/token"
+
+# Token dianggap expired 5 menit sebelum waktunya
+TOKEN_EXPIRY_BUFFER = timedelta(minutes=5)
+
+# Refresh di background sekian detik sebelum token masuk buffer di atas
+TOKEN_REFRESH_AHEAD = float(os.environ.get('TOKEN_REFRESH_AHEAD', '300'))
+
+# Jeda sebelum refresh background dicoba lagi setelah gagal (detik)
+TOKEN_RETRY_INTERVAL = float(os.environ.get('TOKEN_RETRY_INTERVAL', '30'))
+
+# Timeout request ke token endpoint (detik)
+TOKEN_REQUEST_TIMEOUT = 30
+
+# Cool-off (detik) untuk identitas yang kena rate limit, dobel untuk setiap rate limit berturut-turut
+RATE_LIMIT_COOL_OFF = float(os.environ.get('RATE_LIMIT_COOL_OFF', '60'))
+RATE_LIMIT_COOL_OFF_MAX = 900
+
+# Token cache di disk, dipakai bersama oleh semua worker dan restart berikutnya ('' = nonaktif)
+TOKEN_CACHE_FILE = os.environ.get('TOKEN_CACHE_FILE', os.path.join(tempfile.gettempdir(), 'ba_oauth_token.json'))
+
+
+class OAuthTokenManager:
+    """Access token OAuth yang di-refresh dari REFRESH_TOKEN, aman dipakai dari banyak thread dan event loop.
+
+    Refresh bersifat single-flight: caller yang datang saat refresh sedang berjalan menunggu
+    hasil refresh yang sama. Setelah refresh berhasil, refresh berikutnya dijadwalkan di
+    background sebelum token masuk buffer 5 menit, jadi caller biasanya langsung mendapat
+    token dari cache. Request ke token endpoint memakai satu ``requests.Session``.
+
+    Token juga disimpan di ``cache_file`` (mode 0600, hanya dibaca kalau milik user ini dan
+    tidak bisa dibaca user lain). Refresh memegang flock di ``cache_file + '.lock'`` dan membaca
+    file itu dulu, jadi worker yang start bersamaan atau restart memakai token yang sudah ada.
+    """
+
+    def __init__(self, cache_file=None, name='default', refresh_token=None):
+        self.name = name
+        self.refresh_token = refresh_token  # None = REFRESH_TOKEN dari environment
+        self.cache_file = TOKEN_CACHE_FILE if cache_file is None else cache_file
+        self._lock = threading.Lock()
+        self._access_token = None
+        self._expires_at = None
+        self._inflight = None  # Future refresh yang sedang berjalan
+        self._timer = None  # Timer refresh background berikutnya
+        self._session = requests.Session()
+        self._stats = {'refreshes': 0, 'failures': 0, 'joined': 0, 'cache_hits': 0}
+
+    def _valid_token(self):
+        with self._lock:
+            if (self._access_token and
+                    self._expires_at and
+                    datetime.now() < self._expires_at - TOKEN_EXPIRY_BUFFER):
+                return self._access_token
+        return None
+
+    def _start_refresh(self):
+        """Return the in-flight refresh, starting one if none is running"""
+        with self._lock:
+            if self._inflight is not None:
+                self._stats['joined'] += 1
+                return self._inflight
+            future = self._inflight = Future()
+        threading.Thread(target=self._refresh, args=(future,), name='oauth-refresh', daemon=True).start()
+        return future
+
+    def _refresh(self, future):
+        """Runs in the refresh thread; resolves ``future`` with the new token or None"""
+        token = None
+        try:
+            with self._cache_lock():
+                token = self._load_cached_token() or self._request_token()
+        finally:
+            with self._lock:
+                self._inflight = None
+                self._stats['refreshes' if token else 'failures'] += 1
+                if token:
+                    self._schedule(max(
+                        (self._expires_at - TOKEN_EXPIRY_BUFFER - datetime.now()).total_seconds() - TOKEN_REFRESH_AHEAD,
+                        TOKEN_RETRY_INTERVAL
+                    ))
+                elif self._access_token and self._expires_at and datetime.now() < self._expires_at:
+                    # Token lama masih berlaku, coba lagi di background
+                    self._schedule(TOKEN_RETRY_INTERVAL)
+            future.set_result(token)
+
+    def _schedule(self, delay):
+        """Schedule the next background refresh (dipanggil dengan lock dipegang)"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._start_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_token(self):
+        return self.refresh_token or os.environ.get('REFRESH_TOKEN')
+
+    def _cache_key(self):
+        """Identitas credentials, supaya token dari REFRESH_TOKEN lain tidak dipakai"""
+        credentials = f"{os.environ.get('CLIENT_ID')}:{self._refresh_token()}"
+        return hashlib.sha256(credentials.encode()).hexdigest()[:16]
+
+    @contextmanager
+    def _cache_lock(self):
+        """Exclusive flock on the cache lock file, shared by worker processes"""
+        handle = None
+        if self.cache_file and fcntl is not None:
+            try:
+                handle = os.fdopen(os.open(self.cache_file + '.lock', os.O_RDWR | os.O_CREAT, 0o600), 'r+')
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            except OSError as e:
+                logger.warning(f"⚠️ Could not lock token cache: {e}")
+                if handle is not None:
+                    handle.close()
+                handle = None
+        try:
+            yield
+        finally:
+            if handle is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+                handle.close()
+
+    def _load_cached_token(self):
+        """Token dari cache file yang ditulis worker lain atau run sebelumnya, atau None"""
+        if not self.cache_file:
+            return None
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                status = os.fstat(f.fileno())
+                # Jangan pakai file yang bisa diubah/dibaca user lain
+                if (hasattr(os, 'getuid') and status.st_uid != os.getuid()) or status.st_mode & 0o077:
+                    logger.warning(f"⚠️ Ignoring token cache {self.cache_file}: not private to this user")
+                    return None
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if cached.get('key') != self._cache_key() or not cached.get('access_token'):
+            return None
+        expires_at = datetime.fromtimestamp(cached['expires_at'])
+        now = datetime.now()
+        if now >= expires_at - TOKEN_EXPIRY_BUFFER:
+            return None
+
+        with self._lock:
+            # Token yang sudah kita pegang dan sudah waktunya di-refresh tidak dipakai lagi
+            due = now >= expires_at - TOKEN_EXPIRY_BUFFER - timedelta(seconds=TOKEN_REFRESH_AHEAD)
+            if due and cached['access_token'] == self._access_token:
+                return None
+            self._access_token = cached['access_token']
+            self._expires_at = expires_at
+            self._stats['cache_hits'] += 1
+
+        logger.info(f"Using access_token from token cache, expires at: {expires_at}")
+        return cached['access_token']
+
+    def _save_cached_token(self, access_token, expires_at):
+        if not self.cache_file:
+            return
+        try:
+            cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+            os.makedirs(cache_dir, exist_ok=True)
+            # mkstemp membuat file dengan mode 0600
+            fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix='.ba_oauth_token_', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'key': self._cache_key(),
+                    'access_token': access_token,
+                    'expires_at': expires_at.timestamp()
+                }, f)
+            os.replace(temp_path, self.cache_file)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not write token cache: {e}")
+
+    def _request_token(self):
+        """POST the refresh token to the token endpoint; returns the access token or None"""
+        try:
+            # Ambil credentials dari environment
+            client_id = os.environ.get('CLIENT_ID')
+            client_secret = os.environ.get('CLIENT_SECRET')
+            refresh_token = self._refresh_token()
+
+            if not all([client_id, client_secret, refresh_token]):
+                logger.error("Missing OAuth credentials in environment variables")
+                return None
+
+            logger.info(f"Refreshing access_token ({self.name})...")
+            started = time.perf_counter()
+
+            data = {
+                'client_id': client_id,
+                'client_secret': client_secret,
+                'refresh_token': refresh_token,
+                'grant_type': 'refresh_token'
+            }
+
+            now = datetime.now()
+            response = self._session.post(TOKEN_URL, data=data, timeout=TOKEN_REQUEST_TIMEOUT)
+
+            if response.status_code == 200:
+                token_data = response.json()
+
+                # Extract access_token dan expires_in
+                access_token = token_data.get('access_token')
+                expires_in = token_data.get('expires_in', 3600)  # default 1 jam
+
+                if access_token:
+                    # Simpan ke cache dengan waktu expired
+                    with self._lock:
+                        self._access_token = access_token
+                        self._expires_at = now + timedelta(seconds=expires_in)
+                    self._save_cached_token(access_token, self._expires_at)
+
+                    logger.info(f"Access token refreshed successfully in {time.perf_counter() - started:.2f}s, "
+                                f"expires at: {self._expires_at}")
+                    return access_token
+                else:
+                    logger.error("No access_token in response")
+                    return None
+            else:
+                logger.error(f"Token refresh failed: {response.status_code} - {response.text}")
+                return None
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Network error during token refresh: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected error during token refresh: {e}")
+            return None
+
+    def get_access_token(self):
+        """Valid access token (blocking sampai refresh selesai kalau cache kosong/expired), atau None"""
+        token = self._valid_token()
+        if token:
+            logger.debug("Using cached access_token")
+            return token
+        try:
+            return self._start_refresh().result(TOKEN_REQUEST_TIMEOUT + 5)
+        except Exception as e:
+            logger.error(f"Timeout waiting for access_token refresh: {e}")
+            return None
+
+    async def get_access_token_async(self):
+        """Awaitable get_access_token: refresh berjalan di thread refresh, event loop tidak ter-block"""
+        token = self._valid_token()
+        if token:
+            return token
+        try:
+            # shield: timeout satu caller tidak membatalkan refresh yang ditunggu caller lain
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(self._start_refresh())), TOKEN_REQUEST_TIMEOUT + 5
+            )
+        except asyncio.TimeoutError:
+            logger.error("Timeout waiting for access_token refresh")
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._access_token = None
+            self._expires_at = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if self.cache_file:
+            try:
+                os.remove(self.cache_file)
+            except OSError:
+                pass
+
+    def info(self):
+        with self._lock:
+            if self._access_token:
+                return {
+                    'has_token': True,
+                    'expires_at': self._expires_at,
+                    'is_expired': datetime.now() > self._expires_at if self._expires_at else True,
+                    'refreshing': self._inflight is not None,
+                    **self._stats
+                }
+            return {
+                'has_token': False,
+                'expires_at': None,
+                'is_expired': True,
+                'refreshing': self._inflight is not None,
+                **self._stats
+            }
+
+
+class CredentialPool:
+    """Beberapa identitas OAuth (refresh token) untuk membagi quota Drive per user.
+
+    ``reserve`` memilih identitas dengan request aktif paling sedikit (round-robin kalau sama),
+    melewati identitas yang sedang cool-off setelah kena rate limit (403 userRateLimitExceeded
+    / 429). Caller yang sudah terikat ke satu identitas (mis. folder laporan yang dibuat dengan
+    identitas itu) meminta nama identitasnya dan tetap mendapatkannya, walaupun sedang cool-off.
+    """
+
+    def __init__(self, managers):
+        self.managers = dict(managers)  # {nama identitas: OAuthTokenManager}, urutan = prioritas
+        self._lock = threading.Lock()
+        self._names = list(self.managers)
+        self._next = 0  # Awal putaran round-robin berikutnya
+        self._active = {name: 0 for name in self._names}
+        self._cool_until = {name: 0.0 for name in self._names}
+        self._strikes = {name: 0 for name in self._names}
+        self._stats = {name: {'requests': 0, 'rate_limited': 0} for name in self._names}
+
+    @property
+    def default(self):
+        return self._names[0]
+
+    def _pick(self):
+        """Least-loaded identity that is not cooling off (dipanggil dengan lock dipegang)"""
+        now = time.monotonic()
+        order = self._names[self._next:] + self._names[:self._next]
+        self._next = (self._next + 1) % len(self._names)
+        available = [name for name in order if self._cool_until[name] <= now]
+        if not available:
+            # Semua sedang cool-off: pakai yang paling cepat selesai
+            return min(order, key=lambda name: self._cool_until[name])
+        return min(available, key=lambda name: self._active[name])
+
+    def reserve(self, name=None):
+        """Reserve an identity for one unit of work; returns its name (lepas dengan ``release``)"""
+        with self._lock:
+            if name is not None and name not in self.managers:
+                logger.warning(f"⚠️ Unknown OAuth identity {name}, scheduling on the pool")
+                name = None
+            if name is None:
+                name = self._pick()
+            self._active[name] += 1
+            self._stats[name]['requests'] += 1
+        return name
+
+    def release(self, name):
+        with self._lock:
+            self._active[name] -= 1
+
+    def cool_off(self, name, retry_after=None):
+        """Stop scheduling new work on ``name`` for a while after a rate limit response"""
+        with self._lock:
+            if name not in self.managers:
+                return
+            self._strikes[name] += 1
+            self._stats[name]['rate_limited'] += 1
+            # Retry-After kalau ada, kalau tidak backoff dobel per rate limit berturut-turut
+            seconds = retry_after or min(RATE_LIMIT_COOL_OFF * 2 ** (self._strikes[name] - 1), RATE_LIMIT_COOL_OFF_MAX)
+            self._cool_until[name] = max(self._cool_until[name], time.monotonic() + seconds)
+        logger.warning(f"⚠️ OAuth identity {name} rate limited, cooling off for {seconds:.0f}s")
+
+    def record_success(self, name):
+        """Reset the rate limit backoff of ``name`` after a successful response"""
+        if self._strikes.get(name):
+            with self._lock:
+                self._strikes[name] = 0
+
+    def get_access_token(self, name=None):
+        return self.managers[name or self.default].get_access_token()
+
+    async def get_access_token_async(self, name=None):
+        return await self.managers[name or self.default].get_access_token_async()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    'active': self._active[name],
+                    'cooling_off_s': max(self._cool_until[name] - now, 0.0),
+                    **self._stats[name]
+                }
+                for name in self._names
+            }
+
+
+# Satu token manager per process
+_token_manager = OAuthTokenManager()
+
+_credential_pool = None
+_credential_pool_lock = threading.Lock()
+
+
+def get_token_manager():
+    return _token_manager
+
+
+def get_credential_pool():
+    """Pool identitas OAuth: REFRESH_TOKEN ('default') ditambah EXTRA_REFRESH_TOKENS (pool1, pool2, ...)"""
+    global _credential_pool
+    with _credential_pool_lock:
+        if _credential_pool is None:
+            managers = {'default': _token_manager}
+            extra_tokens = [token.strip() for token in os.environ.get('EXTRA_REFRESH_TOKENS', '').split(',') if token.strip()]
+            for index, refresh_token in enumerate(extra_tokens, start=1):
+                name = f'pool{index}'
+                cache_file = ''
+                if TOKEN_CACHE_FILE:
+                    root, ext = os.path.splitext(TOKEN_CACHE_FILE)
+                    cache_file = f"{root}.{name}{ext}"
+                managers[name] = OAuthTokenManager(cache_file, name=name, refresh_token=refresh_token)
+            _credential_pool = CredentialPool(managers)
+            logger.info(f"🔑 OAuth credential pool: {len(managers)} identities")
+        return _credential_pool
+
 
 def get_access_token():
     """
     Mendapatkan access_token yang selalu valid dengan otomatis refresh jika diperlukan
-    
+
     Environment variables yang diperlukan:
     - CLIENT_ID: OAuth client ID
-    - CLIENT_SECRET: OAuth client secret  
+    - CLIENT_SECRET: OAuth client secret
     - REFRESH_TOKEN: OAuth refresh token
-    
+
     Returns:
         str: Valid access_token atau None jika gagal
     """
-    try:
-        # Ambil credentials dari environment
-        client_id = os.environ.get('CLIENT_ID')
-        client_secret = os.environ.get('CLIENT_SECRET')
-        refresh_token = os.environ.get('REFRESH_TOKEN')
-        
-        if not all([client_id, client_secret, refresh_token]):
-            logger.error("Missing OAuth credentials in environment variables")
-            return None
-        
-        # Cek apakah token masih valid (buffer 5 menit sebelum expired)
-        now = datetime.now()
-        if (_token_cache['access_token'] and 
-            _token_cache['expires_at'] and 
-            now < _token_cache['expires_at'] - timedelta(minutes=5)):
-            
-            logger.info("Using cached access_token")
-            return _token_cache['access_token']
-        
-        # Token expired atau belum ada, lakukan refresh
-        logger.info("Refreshing access_token...")
-        
-        # Request ke OAuth endpoint
-        token_url = "https://oauth2.googleapis.com/token"
-        
-        data = {
-            'client_id': client_id,
-            'client_secret': client_secret,
-            'refresh_token': refresh_token,
-            'grant_type': 'refresh_token'
-        }
-        
-        response = requests.post(token_url, data=data, timeout=30)
-        
-        if response.status_code == 200:
-            token_data = response.json()
-            
-            # Extract access_token dan expires_in
-            access_token = token_data.get('access_token')
-            expires_in = token_data.get('expires_in', 3600)  # default 1 jam
-            
-            if access_token:
-                # Simpan ke cache dengan waktu expired
-                _token_cache['access_token'] = access_token
-                _token_cache['expires_at'] = now + timedelta(seconds=expires_in)
-                
-                logger.info(f"Access token refreshed successfully, expires at: {_token_cache['expires_at']}")
-                return access_token
-            else:
-                logger.error("No access_token in response")
-                return None
-        else:
-            logger.error(f"Token refresh failed: {response.status_code} - {response.text}")
-            return None
-            
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Network error during token refresh: {e}")
-        return None
-    except Exception as e:
-        logger.error(f"Unexpected error during token refresh: {e}")
-        return None
+    return _token_manager.get_access_token()
+
+async def get_access_token_async():
+    """Versi awaitable dari get_access_token untuk handler di event loop"""
+    return await _token_manager.get_access_token_async()
 
 def clear_token_cache():
     """Clear token cache (berguna untuk testing atau reset manual)"""
-    global _token_cache
-    _token_cache = {
-        'access_token': None,
-        'expires_at': None
-    }
+    for manager in get_credential_pool().managers.values():
+        manager.clear()
     logger.info("Token cache cleared")
 
 def get_token_info():
     """Get informasi tentang token yang sedang di-cache"""
-    if _token_cache['access_token']:
-        return {
-            'has_token': True,
-            'expires_at': _token_cache['expires_at'],
-            'is_expired': datetime.now() > _token_cache['expires_at'] if _token_cache['expires_at'] else True
-        }
-    else:
-        return {
-            'has_token': False,
-            'expires_at': None,
-            'is_expired': True
-        }
\ No newline at end of file
+    return _token_manager.info()
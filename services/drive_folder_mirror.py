@@ -0,0 +1,200 @@
+# services/drive_folder_mirror.py - Mirror lokal folder Google Drive lewat changes feed
+import os
+import json
+import logging
+import tempfile
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+FILE_FIELDS = "id, name, mimeType, md5Checksum, modifiedTime, parents, trashed"
+
+
+class DriveFolderMirror:
+    """Salinan lokal isi beberapa folder Drive, di-update dengan changes.list.
+
+    Sync pertama membaca page token awal lalu me-list setiap folder yang di-watch; sync
+    berikutnya hanya membaca perubahan sejak page token terakhir, jadi lookup file cukup
+    baca dict lokal. Page token dan isi mirror disimpan di ``state_file`` supaya restart
+    bisa lanjut dari token terakhir.
+
+    ``drive`` cukup object dengan ``files().list()`` dan ``changes().getStartPageToken()`` /
+    ``changes().list()`` seperti client googleapiclient, sehingga bisa diuji dengan fake lokal.
+    """
+
+    def __init__(self, state_file=None, poll_interval=60):
+        self.state_file = state_file or os.path.join(tempfile.gettempdir(), 'ba_drive_mirror.json')
+        self.poll_interval = poll_interval
+
+        self._lock = threading.RLock()
+        self._page_token = None
+        self._folders = {}  # {folder_id: {file_id: metadata}}
+        self._unlisted = set()  # Folder yang belum pernah di-list penuh
+        self._last_sync = None
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self._page_token = state.get('page_token')
+            self._folders = state.get('folders', {})
+            logger.info(f"📂 Drive mirror loaded ({len(self._folders)} folders)")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load Drive mirror state: {e}")
+
+    def _save_state(self):
+        try:
+            state_dir = os.path.dirname(self.state_file)
+            os.makedirs(state_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=state_dir, prefix='.ba_drive_mirror_', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'page_token': self._page_token, 'folders': self._folders}, f, ensure_ascii=False)
+            os.replace(temp_path, self.state_file)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not save Drive mirror state: {e}")
+
+    def watch(self, folder_id):
+        """Start mirroring a folder (di-list penuh pada sync berikutnya)"""
+        with self._lock:
+            if folder_id not in self._folders:
+                self._folders[folder_id] = {}
+                self._unlisted.add(folder_id)
+
+    def files_in(self, folder_id):
+        """Mirrored files of a folder, sorted by name (local read, tanpa API call)"""
+        with self._lock:
+            files = list(self._folders.get(folder_id, {}).values())
+        return sorted(files, key=lambda item: item.get('name', ''))
+
+    def sync_if_due(self, drive):
+        """Sync if poll_interval has passed since the last sync"""
+        with self._lock:
+            due = (
+                self._last_sync is None
+                or self._unlisted
+                or time.monotonic() - self._last_sync >= self.poll_interval
+            )
+        if due:
+            return self.sync(drive)
+        return True
+
+    def sync(self, drive):
+        """Apply pending changes; returns False if Drive could not be reached"""
+        with self._lock:
+            try:
+                if self._page_token is None:
+                    # Token diambil sebelum listing, supaya perubahan selama listing ikut di-replay
+                    self._page_token = drive.changes().getStartPageToken(supportsAllDrives=True).execute()['startPageToken']
+                    self._unlisted.update(self._folders)
+                    changed = True
+                else:
+                    changed = self._apply_changes(drive)
+
+                for folder_id in list(self._unlisted):
+                    self._list_folder(drive, folder_id)
+                    self._unlisted.discard(folder_id)
+                    changed = True
+
+                if changed:
+                    self._save_state()
+                self._last_sync = time.monotonic()
+                return True
+
+            except HttpError as e:
+                if e.resp.status in (400, 404, 410):
+                    # Page token tidak berlaku lagi: mulai ulang dengan listing penuh
+                    logger.warning(f"⚠️ Drive changes token rejected ({e.resp.status}), resyncing folders")
+                    self._page_token = None
+                    self._unlisted.update(self._folders)
+                else:
+                    logger.error(f"❌ Error syncing Drive mirror: {e}")
+                return False
+
+            except Exception as e:
+                logger.error(f"❌ Error syncing Drive mirror: {e}")
+                return False
+
+    def _list_folder(self, drive, folder_id):
+        """Full listing of one folder"""
+        files = {}
+        page_token = None
+        while True:
+            response = drive.files().list(
+                q=f"'{folder_id}' in parents and trashed = false",
+                fields=f"nextPageToken, files({FILE_FIELDS})",
+                pageToken=page_token,
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True
+            ).execute()
+
+            for item in response.get('files', []):
+                files[item['id']] = item
+
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        self._folders[folder_id] = files
+        logger.info(f"📂 Drive mirror listed folder {folder_id} ({len(files)} files)")
+
+    def _apply_changes(self, drive):
+        """Replay changes since the saved page token; returns True if a watched folder changed"""
+        changed = False
+        page_token = self._page_token
+        while page_token:
+            response = drive.changes().list(
+                pageToken=page_token,
+                fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))",
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+                pageSize=1000
+            ).execute()
+
+            for change in response.get('changes', []):
+                changed = self._apply_change(change) or changed
+
+            if 'newStartPageToken' in response:
+                self._page_token = response['newStartPageToken']
+                changed = changed or page_token != self._page_token
+                break
+            page_token = response.get('nextPageToken')
+
+        return changed
+
+    def _apply_change(self, change):
+        """Update the mirror for one change (file bisa pindah folder, di-trash atau dihapus)"""
+        file_id = change.get('fileId')
+        item = change.get('file') or {}
+        removed = change.get('removed') or item.get('trashed')
+        parents = set() if removed else set(item.get('parents', []))
+
+        changed = False
+        for folder_id, files in self._folders.items():
+            if folder_id in parents:
+                if files.get(file_id) != item:
+                    files[file_id] = item
+                    changed = True
+            elif files.pop(file_id, None) is not None:
+                changed = True
+        return changed
+
+
+# Satu mirror per process: folder template wifi dan datin berbagi satu changes feed
+_shared_mirror = None
+_shared_mirror_lock = threading.Lock()
+
+
+def get_template_mirror():
+    """Process-wide mirror untuk folder template"""
+    global _shared_mirror
+    with _shared_mirror_lock:
+        if _shared_mirror is None:
+            poll_interval = float(os.environ.get('DRIVE_CHANGES_POLL_INTERVAL', '60'))
+            _shared_mirror = DriveFolderMirror(poll_interval=poll_interval)
+        return _shared_mirror
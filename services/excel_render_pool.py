@@ -0,0 +1,226 @@
+# services/excel_render_pool.py - Render Excel di process pool supaya tidak berebut GIL
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Jumlah worker process (0 = render di thread pemanggil seperti sebelumnya)
+EXCEL_RENDER_PROCESSES = int(os.environ.get('EXCEL_RENDER_PROCESSES', str(min(4, os.cpu_count() or 1))))
+
+# Maksimum job yang sedang jalan + antri; di atas ini render langsung ditolak
+EXCEL_RENDER_QUEUE_LIMIT = int(os.environ.get('EXCEL_RENDER_QUEUE_LIMIT', '16'))
+
+# Timeout (detik) menunggu hasil satu render
+EXCEL_RENDER_TIMEOUT = float(os.environ.get('EXCEL_RENDER_TIMEOUT', '60'))
+
+
+class ExcelRenderQueueFull(Exception):
+    """Terlalu banyak render yang sedang antri"""
+
+
+class ExcelRenderTimeout(ExcelRenderQueueFull):
+    """Render tidak selesai dalam timeout; job-nya masih berjalan di worker"""
+
+
+# State di dalam worker process
+_worker_renderer = None
+_worker_config = None
+
+
+def _init_worker(templates, log_level):
+    """Worker initializer: import openpyxl dan index/parse template sebelum job pertama datang"""
+    global _worker_renderer, _worker_config
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=log_level
+    )
+    from config.ba_config import BeritaAcaraConfig
+    from services.excel_renderer import ExcelRenderer
+
+    _worker_renderer = ExcelRenderer()
+    _worker_config = BeritaAcaraConfig()
+    for template_key, template_content, form_types in templates:
+        for form_type in form_types:
+            try:
+                _worker_renderer.get_xlsx_template(template_key, template_content, _worker_config, form_type)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not preload template {template_key} ({form_type}): {e}")
+        if _worker_renderer.engine == 'openpyxl':
+            try:
+                _worker_renderer.preload_workbook(template_key, template_content)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not preload workbook {template_key}: {e}")
+
+
+def _ping():
+    return os.getpid()
+
+
+def _render_job(template_key, template_content, form_data, form_type):
+    """Runs in a worker; returns (xlsx bytes or None, pid, render seconds, workbook pool bytes)"""
+    started = time.perf_counter()
+    content = _worker_renderer.render(template_key, template_content, form_data, _worker_config, form_type)
+    render_seconds = time.perf_counter() - started
+    return content, os.getpid(), render_seconds, _worker_renderer.workbook_pool.stats()['memory_bytes']
+
+
+class ExcelRenderPool:
+    """Bounded ProcessPoolExecutor untuk render Excel.
+
+    Worker di-spawn (bukan fork, process bot punya banyak thread) dan di-warm saat ``start``:
+    openpyxl sudah di-import dan template yang dikenal sudah di-index. Job membawa bytes
+    template-nya sendiri, jadi versi template baru cukup di-index sekali per worker.
+    Jumlah job yang antri dibatasi ``queue_limit`` (slot baru dilepas saat job di worker selesai,
+    juga kalau pemanggil sudah berhenti menunggu); setiap job mencatat waktu antri dan render.
+    """
+
+    def __init__(self, workers=None, queue_limit=None):
+        self.workers = EXCEL_RENDER_PROCESSES if workers is None else workers
+        self.queue_limit = EXCEL_RENDER_QUEUE_LIMIT if queue_limit is None else queue_limit
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._templates = {}  # {(file id, versi): (content, form types)} untuk worker baru
+        self._slots = threading.BoundedSemaphore(self.queue_limit)
+        self._stats = {'jobs': 0, 'failed': 0, 'rejected': 0, 'timed_out': 0, 'queued_total': 0.0, 'render_total': 0.0}
+        self._workbook_pool_bytes = {}  # {pid: memory workbook pool di worker itu}
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def preload(self, template_key, template_content, form_types):
+        """Register a template so newly started workers index it in their initializer"""
+        with self._lock:
+            self._templates = {
+                key: value for key, value in self._templates.items() if key[0] != template_key[0]
+            }
+            self._templates[template_key] = (template_content, tuple(form_types))
+
+    def start(self):
+        """Spawn and warm all workers (dipanggil sekali saat startup, aman dipanggil ulang)"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self._executor is not None:
+                return True
+            templates = [(key, content, form_types) for key, (content, form_types) in self._templates.items()]
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                # Worker memakai level logging yang sama dengan process utama
+                initargs=(templates, logging.getLogger().getEffectiveLevel())
+            )
+            executor = self._executor
+
+        # Setiap submit tanpa worker idle men-spawn worker baru, jadi semua worker langsung hidup
+        started = time.perf_counter()
+        try:
+            pids = {future.result() for future in [executor.submit(_ping) for _ in range(self.workers)]}
+            logger.info(f"✅ Excel render pool ready: {len(pids)} workers in {time.perf_counter() - started:.1f}s")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error starting Excel render pool: {e}")
+            self._reset(executor)
+            return False
+
+    def _reset(self, executor):
+        """Drop a broken executor; the next render starts a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self._workbook_pool_bytes = {}
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def render(self, template_key, template_content, form_data, form_type, timeout=None):
+        """Render in a worker process (blocking).
+
+        Raises ExcelRenderQueueFull when the queue is full, ExcelRenderTimeout when the job does
+        not finish within ``timeout`` (job tetap jalan di worker, jangan render ulang di sini).
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise ExcelRenderQueueFull(f"{self.queue_limit} Excel renders already queued")
+
+        try:
+            if self._executor is None:
+                self.start()
+            with self._lock:
+                executor = self._executor
+            if executor is None:
+                raise BrokenProcessPool("Excel render pool could not be started")
+
+            submitted = time.perf_counter()
+            future = executor.submit(_render_job, template_key, template_content, form_data, form_type)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Slot dipegang sampai worker selesai, bukan sampai pemanggil berhenti menunggu
+        future.add_done_callback(lambda _: self._slots.release())
+
+        timeout = EXCEL_RENDER_TIMEOUT if timeout is None else timeout
+        try:
+            content, pid, render_seconds, workbook_pool_bytes = future.result(timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._stats['timed_out'] += 1
+            raise ExcelRenderTimeout(f"Excel render ({form_type}) did not finish within {timeout:.0f}s")
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise
+        total_seconds = time.perf_counter() - submitted
+        queued_seconds = max(total_seconds - render_seconds, 0.0)
+
+        with self._lock:
+            self._stats['jobs'] += 1
+            self._stats['failed'] += content is None
+            self._stats['queued_total'] += queued_seconds
+            self._stats['render_total'] += render_seconds
+            self._workbook_pool_bytes[pid] = workbook_pool_bytes
+        logger.info(f"⏱️ Excel render job ({form_type}) on worker {pid}: "
+                    f"queued {queued_seconds * 1000:.0f}ms, render {render_seconds * 1000:.0f}ms")
+        return content
+
+    def stats(self):
+        """Job counters and average queue/render time (ms)"""
+        with self._lock:
+            stats = dict(self._stats)
+            workbook_pool_bytes = sum(self._workbook_pool_bytes.values())
+        done = stats['jobs'] or 1
+        return {
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'jobs': stats['jobs'],
+            'failed': stats['failed'],
+            'rejected': stats['rejected'],
+            'timed_out': stats['timed_out'],
+            'avg_queued_ms': stats['queued_total'] / done * 1000,
+            'avg_render_ms': stats['render_total'] / done * 1000,
+            'workbook_pool_bytes': workbook_pool_bytes,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Process-wide render pool, dipakai bersama oleh service wifi dan datin"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ExcelRenderPool()
+        return _render_pool
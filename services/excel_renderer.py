@@ -0,0 +1,327 @@
+# services/excel_renderer.py - Isi template Excel BA (tanpa Drive, bisa jalan di worker process)
+import os
+import io
+import logging
+import threading
+from contextlib import contextmanager
+import openpyxl
+from openpyxl.drawing.image import Image as XLImage
+from PIL import Image as PILImage
+from services.xlsx_patcher import XlsxTemplate, XlsxPatchError
+from services.workbook_pool import WorkbookPool
+
+logger = logging.getLogger(__name__)
+
+# 'xml' = patch XML template langsung (openpyxl hanya fallback), 'openpyxl' = load/save workbook
+EXCEL_RENDER_ENGINE = os.environ.get('EXCEL_RENDER_ENGINE', 'xml')
+
+
+class ExcelRenderer:
+    """Render form data + signatures ke xlsx bytes dari template bytes"""
+
+    def __init__(self, engine=None):
+        self.engine = engine or EXCEL_RENDER_ENGINE
+        
+        # Template yang sudah di-index untuk XlsxTemplate: {(file id, versi, form type): XlsxTemplate}
+        self._xlsx_templates = {}
+        self._xlsx_lock = threading.Lock()
+        
+        # Workbook openpyxl yang sudah di-parse, untuk engine openpyxl dan fallback
+        self.workbook_pool = WorkbookPool()
+
+    def render(self, template_key, template_content, form_data, ba_config, form_type='wifi'):
+        """Filled xlsx bytes (patch XML; openpyxl kalau template tidak bisa di-patch), None on error"""
+        if self.engine == 'xml':
+            try:
+                template = self.get_xlsx_template(template_key, template_content, ba_config, form_type)
+                return self.render_excel_template(template, form_data, ba_config, form_type)
+            except XlsxPatchError as e:
+                logger.warning(f"⚠️ Template cannot be patched, using openpyxl: {e}")
+            except Exception as e:
+                logger.warning(f"⚠️ XML render failed, using openpyxl: {e}")
+        return self.fill_excel_template(
+            io.BytesIO(template_content), form_data, ba_config, form_type, template_key=template_key
+        )
+
+    def preload_workbook(self, template_key, template_content):
+        """Parse the template into the workbook pool ahead of the first render"""
+        with self._open_workbook(io.BytesIO(template_content), template_key, ()):
+            pass
+
+    @contextmanager
+    def _open_workbook(self, template_path, template_key, coordinates):
+        if template_key is None:
+            yield openpyxl.load_workbook(template_path)
+            return
+        
+        def load():
+            if hasattr(template_path, 'seek'):
+                template_path.seek(0)
+            return openpyxl.load_workbook(template_path)
+        
+        if hasattr(template_path, 'getbuffer'):
+            template_size = template_path.getbuffer().nbytes
+        else:
+            template_size = os.path.getsize(template_path)
+        with self.workbook_pool.lease(template_key, coordinates, load, template_size) as workbook:
+            yield workbook
+
+    def fill_excel_template(self, template_path, form_data, ba_config, form_type='wifi', template_key=None):
+        """Fill Excel template (path or file-like) with form data and signature images, returns the xlsx bytes
+
+        Dengan ``template_key`` workbook dipinjam dari workbook pool; template_path hanya di-load
+        kalau pool untuk versi template itu masih kosong.
+        """
+        try:
+            logger.info("📋 Filling Excel template with form data and signatures...")
+            
+            # Prepare Excel data using ba_config
+            excel_data = ba_config.prepare_excel_data(form_data, form_type)
+            
+            # Cell yang akan ditulis (termasuk anchor tanda tangan), dipulihkan kalau workbook dari pool
+            touched = list(excel_data) + [
+                coordinate for coordinate in (
+                    ba_config.get_plan(form_type).signature_coordinates.get(field_name)
+                    for field_name in form_data.get('tanda_tangan', {})
+                ) if coordinate
+            ]
+            
+            # Load workbook (atau pinjam yang sudah di-parse dari pool)
+            with self._open_workbook(template_path, template_key, touched) as workbook:
+                worksheet = workbook.active
+                
+                # Fill data into cells
+                for coordinate, value in excel_data.items():
+                    try:
+                        worksheet[coordinate] = value
+                        logger.debug(f"📝 Filled {coordinate}: {value}")
+                    except Exception as e:
+                        logger.warning(f"⚠️ Could not fill cell {coordinate}: {e}")
+                
+                # Handle signature images dengan ukuran yang pas di dalam sel
+                tanda_tangan_section = form_data.get('tanda_tangan', {})
+                
+                if tanda_tangan_section:
+                    for field_name, image_path in tanda_tangan_section.items():
+                        if image_path and image_path.startswith('SIGNATURE_IMAGE:'):
+                            actual_path = image_path.replace('SIGNATURE_IMAGE:', '')
+                            coordinate = ba_config.get_plan(form_type).signature_coordinates.get(field_name)
+                            
+                            if coordinate and os.path.exists(actual_path):
+                                try:
+                                    # PERBAIKAN: Fit gambar ke dalam sel dengan ukuran yang tepat
+                                    cell = worksheet[coordinate]
+                                    
+                                    # Dapatkan ukuran sel dalam pixels menggunakan helper method
+                                    cell_width_px, cell_height_px = self._calculate_cell_dimensions(worksheet, coordinate)
+                                    
+                                    # Load image
+                                    img = XLImage(actual_path)
+                                    
+                                    # Set ukuran gambar
+                                    final_width, final_height, scale_ratio = self._fit_signature(
+                                        cell_width_px, cell_height_px, img.width, img.height
+                                    )
+                                    img.width = int(final_width)
+                                    img.height = int(final_height)
+                                    
+                                    # Set anchor di koordinat sel
+                                    img.anchor = coordinate
+                                    
+                                    # Add image ke worksheet
+                                    worksheet.add_image(img)
+                                    
+                                    logger.info(f"✅ Added signature image at {coordinate} "
+                                            f"(final size: {int(final_width)}x{int(final_height)}px, "
+                                            f"scale ratio: {scale_ratio:.3f})")
+                                            
+                                except Exception as e:
+                                    logger.error(f"❌ Error adding signature image: {e}")
+                                    # Fallback: add image dengan ukuran default yang disesuaikan
+                                    try:
+                                        img = XLImage(actual_path)
+                                        # Fallback size yang disesuaikan dengan signature 365x380
+                                        fallback_width = 100  # CUSTOM: ubah fallback width
+                                        fallback_height = 52   # CUSTOM: ubah fallback height (mempertahankan rasio 365:380)
+                                        
+                                        img.width = fallback_width
+                                        img.height = fallback_height
+                                        img.anchor = coordinate
+                                        worksheet.add_image(img)
+                                        logger.warning(f"⚠️ Added signature with fallback size at {coordinate} "
+                                                    f"({fallback_width}x{fallback_height}px)")
+                                    except Exception as fallback_error:
+                                        logger.error(f"❌ Fallback failed: {fallback_error}")
+                
+                # Simpan ke memory, langsung di-upload tanpa file sementara
+                output = io.BytesIO()
+                workbook.save(output)
+                logger.info(f"✅ Filled template saved ({output.tell()} bytes)")
+            
+            return output.getvalue()
+            
+        except Exception as e:
+            logger.error(f"❌ Error filling Excel template: {e}")
+            return None
+
+    def get_xlsx_template(self, template_key, template_content, ba_config, form_type):
+        """XlsxTemplate for a template version (di-index sekali per versi dan form type)
+
+        ``template_key``: (file id, versi) template di Drive.
+        """
+        key = (*template_key, form_type)
+        with self._xlsx_lock:
+            template = self._xlsx_templates.get(key)
+        if template is None:
+            template = XlsxTemplate(template_content, ba_config.excel_coordinates(form_type))
+            with self._xlsx_lock:
+                # Index untuk versi template lama tidak dipakai lagi
+                self._xlsx_templates = {
+                    cached_key: cached for cached_key, cached in self._xlsx_templates.items()
+                    if cached_key[:2] == key[:2]
+                }
+                self._xlsx_templates[key] = template
+        return template
+
+    def render_excel_template(self, template, form_data, ba_config, form_type='wifi'):
+        """Same result as fill_excel_template, but patches the template XML instead of load/save openpyxl.
+
+        Error tidak ditelan supaya caller bisa fallback ke fill_excel_template.
+        """
+        logger.info("📋 Rendering Excel template with form data and signatures...")
+        excel_data = ba_config.prepare_excel_data(form_data, form_type)
+        
+        images = []
+        for field_name, image_path in form_data.get('tanda_tangan', {}).items():
+            if not (image_path and image_path.startswith('SIGNATURE_IMAGE:')):
+                continue
+            actual_path = image_path.replace('SIGNATURE_IMAGE:', '')
+            coordinate = ba_config.get_plan(form_type).signature_coordinates.get(field_name)
+            if not (coordinate and os.path.exists(actual_path)):
+                continue
+            
+            with open(actual_path, 'rb') as f:
+                image_data = f.read()
+            with PILImage.open(io.BytesIO(image_data)) as image:
+                img_width, img_height = image.size
+                image_format = (image.format or 'png').lower()
+                if image_format not in ('png', 'jpeg', 'gif'):
+                    # openpyxl juga menyimpan format lain sebagai PNG
+                    output = io.BytesIO()
+                    image.save(output, format='png')
+                    image_data, image_format = output.getvalue(), 'png'
+            
+            cell_width_px, cell_height_px = self._cell_pixels(*template.cell_dimensions(coordinate))
+            final_width, final_height, scale_ratio = self._fit_signature(
+                cell_width_px, cell_height_px, img_width, img_height
+            )
+            images.append((coordinate, image_data, int(final_width), int(final_height), image_format))
+            logger.info(f"✅ Added signature image at {coordinate} "
+                    f"(final size: {int(final_width)}x{int(final_height)}px, "
+                    f"scale ratio: {scale_ratio:.3f})")
+        
+        content, skipped = template.render(excel_data, images)
+        for coordinate in skipped:
+            logger.warning(f"⚠️ Could not fill cell {coordinate}: merged cell or illegal characters")
+        logger.info(f"✅ Filled template rendered ({len(content)} bytes)")
+        return content
+
+    def _fit_signature(self, cell_width_px, cell_height_px, original_img_width, original_img_height):
+        """Signature size that fits the cell, returns (final_width, final_height, scale_ratio)"""
+        # BAGIAN PENGATURAN SKALA - CUSTOM DISINI
+        # =============================================
+        # Margin dari tepi sel (dalam pixels)
+        margin = 0.5  # CUSTOM: ubah nilai ini untuk mengatur jarak dari tepi sel
+        
+        # Faktor skala custom (0.1 = 10%, 1.0 = 100%, 1.5 = 150%)
+        custom_scale_factor = 1.4  # CUSTOM: ubah nilai ini untuk memperbesar/memperkecil gambar secara keseluruhan
+        
+        # Ukuran maksimum yang tersedia dalam sel (dikurangi margin)
+        available_width = max(cell_width_px - (margin * 2), 50)  # minimal 50px
+        available_height = max(cell_height_px - (margin * 2), 30)  # minimal 30px
+        
+        # Terapkan custom scale factor ke ukuran yang tersedia
+        target_width = available_width * custom_scale_factor
+        target_height = available_height * custom_scale_factor
+        
+        # Dimensi asli gambar signature (365x380 px dan 301 DPI)
+        logger.info(f"📏 Original image dimensions: {original_img_width}x{original_img_height}px")
+        logger.info(f"📐 Cell dimensions: {cell_width_px}x{cell_height_px}px")
+        logger.info(f"🎯 Target dimensions: {target_width}x{target_height}px")
+        
+        # Hitung rasio skala untuk mempertahankan aspect ratio
+        width_ratio = target_width / original_img_width
+        height_ratio = target_height / original_img_height
+        
+        # Ambil rasio yang lebih kecil agar gambar tidak keluar dari area target
+        scale_ratio = min(width_ratio, height_ratio)
+        
+        # Hitung ukuran final
+        final_width = original_img_width * scale_ratio
+        final_height = original_img_height * scale_ratio
+        
+        # FINE-TUNING: Manual override untuk ukuran tertentu (opsional)
+        # Uncomment dan sesuaikan jika ingin ukuran fixed
+        # final_width = 120   # CUSTOM: ukuran lebar fixed dalam pixels
+        # final_height = 60   # CUSTOM: ukuran tinggi fixed dalam pixels
+        # =============================================
+        # AKHIR BAGIAN PENGATURAN SKALA
+        
+        return final_width, final_height, scale_ratio
+
+    # Helper method untuk menghitung ukuran sel yang lebih akurat
+    def _calculate_cell_dimensions(self, worksheet, coordinate):
+        """Calculate cell dimensions in pixels more accurately"""
+        try:
+            from openpyxl.utils.cell import coordinate_from_string
+            
+            col_letter, row_num = coordinate_from_string(coordinate)
+            
+            # Get column width (dalam character units)
+            col_dim = worksheet.column_dimensions.get(col_letter)
+            
+            # Get row height (dalam point units)  
+            row_dim = worksheet.row_dimensions.get(row_num)
+            
+            return self._cell_pixels(col_dim.width if col_dim else None, row_dim.height if row_dim else None)
+            
+        except Exception as e:
+            logger.warning(f"Could not calculate cell dimensions: {e}")
+            # Fallback dimensions yang disesuaikan dengan signature 365x380
+            return 120, 80  # fallback dimensions yang lebih proporsional
+
+    def _cell_pixels(self, col_width_chars, row_height_points):
+        """Cell size in pixels from column width (characters) and row height (points)"""
+        col_width_chars = col_width_chars or 8.43  # Excel default
+        row_height_points = row_height_points or 15  # Excel default
+        try:
+            # Konversi ke pixels dengan faktor konversi yang akurat untuk DPI 301
+            # Disesuaikan dengan resolusi signature image 301 DPI
+            # 1 character width ≈ 7.5 pixels (untuk font default Excel)
+            # 1 point ≈ 1.33 pixels
+            cell_width_px = col_width_chars * 7.5
+            cell_height_px = row_height_points * 1.33
+            
+            return int(cell_width_px), int(cell_height_px)
+            
+        except Exception as e:
+            logger.warning(f"Could not calculate cell dimensions: {e}")
+            # Fallback dimensions yang disesuaikan dengan signature 365x380
+            return 120, 80  # fallback dimensions yang lebih proporsional
+
+    def remove_signature_files(self, form_data):
+        """Delete the signature temp files of a form (dipanggil caller setelah Excel ter-upload)
+
+        Renderer sendiri tidak menghapusnya: render di worker yang timeout masih bisa berjalan,
+        dan render ulang setelah itu tetap butuh file signature.
+        """
+        for field_name, image_path in (form_data.get('tanda_tangan') or {}).items():
+            if not (isinstance(image_path, str) and image_path.startswith('SIGNATURE_IMAGE:')):
+                continue
+            sig_file = image_path.replace('SIGNATURE_IMAGE:', '')
+            try:
+                if os.path.exists(sig_file):
+                    os.remove(sig_file)
+                    logger.info(f"🗑️ Cleaned up signature file: {sig_file}")
+            except Exception as e:
+                logger.warning(f"⚠️ Could not clean up signature file {sig_file}: {e}")
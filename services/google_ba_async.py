@@ -0,0 +1,144 @@
+# services/google_ba_async.py - Async facade untuk GoogleBAService
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Batas thread untuk semua call Drive/Sheets; request di atas batas ini antri di executor
+DRIVE_EXECUTOR_WORKERS = int(os.environ.get('DRIVE_EXECUTOR_WORKERS', '8'))
+
+# Timeout (detik) per call biasa dan untuk seluruh proses generate Excel
+DRIVE_CALL_TIMEOUT = float(os.environ.get('DRIVE_CALL_TIMEOUT', '60'))
+DRIVE_PROCESS_TIMEOUT = float(os.environ.get('DRIVE_PROCESS_TIMEOUT', '180'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_drive_executor():
+    """Process-wide bounded executor untuk blocking Google API calls"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DRIVE_EXECUTOR_WORKERS, thread_name_prefix='drive-io')
+        return _executor
+
+
+class AsyncGoogleBAService:
+    """Jalankan method GoogleBAService di executor supaya event loop bot tidak ikut ter-block.
+
+    Setiap call dibatasi timeout; kalau lewat, handler langsung mendapat hasil gagal yang
+    sama seperti method sync-nya. Call yang sudah berjalan tetap selesai di thread executor,
+    jadi identitas OAuth dan file sementara baru dilepas saat call itu benar-benar selesai.
+
+    Setiap call berjalan di bawah satu identitas OAuth dari credential pool service. Call
+    untuk folder laporan memakai identitas pembuat folder itu (``identity``, disimpan di
+    session, atau yang diingat service), supaya satu tree laporan tidak tercampur identitas.
+    """
+
+    def __init__(self, service, executor=None, timeout=None):
+        self.service = service
+        self.executor = executor or get_drive_executor()
+        self.timeout = DRIVE_CALL_TIMEOUT if timeout is None else timeout
+
+    async def run(self, func, *args, timeout=None, identity=None, on_done=None, **kwargs):
+        """Run a blocking callable in the executor with a timeout, under one OAuth identity
+
+        ``on_done()`` dipanggil setelah call di executor selesai (atau batal sebelum mulai),
+        bukan saat await-nya timeout.
+        """
+        credential_pool = self.service.credential_pool
+        name = credential_pool.reserve(identity)
+        try:
+            # Tunggu token di event loop dulu, jadi ensure_valid_token di thread executor cukup baca cache
+            await credential_pool.get_access_token_async(name)
+            future = self.executor.submit(self.service.run_as, name, func, *args, **kwargs)
+        except BaseException:
+            credential_pool.release(name)
+            if on_done is not None:
+                on_done()
+            raise
+        
+        def done(_):
+            credential_pool.release(name)
+            if on_done is not None:
+                on_done()
+        
+        future.add_done_callback(done)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout if timeout is None else timeout)
+
+    def folder_identity(self, folder_id):
+        # Tidak ada API call, cukup langsung
+        return self.service.folder_identity(folder_id)
+
+    async def process_excel_only(self, form_data, filename, ba_config, form_type='wifi', folders=None, identity=None):
+        try:
+            return await self.run(
+                self.service.process_excel_only, form_data, filename, ba_config, form_type, folders,
+                timeout=DRIVE_PROCESS_TIMEOUT,
+                identity=identity or (self.service.folder_identity(folders[0]) if folders else None)
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Timeout generating Excel {filename} after {DRIVE_PROCESS_TIMEOUT}s")
+            return False, "Google Drive tidak merespon, silakan coba lagi"
+
+    async def create_folder_structure(self, folder_name):
+        """Report/Evidence/Form BA folders di result folder (identitasnya lewat folder_identity)"""
+        try:
+            return await self.run(self.service.create_folder_structure, self.service.result_folder_id, folder_name)
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Timeout creating folder structure {folder_name}")
+            return None, None, None
+
+    async def rename_file(self, file_id, name, identity=None):
+        try:
+            return await self.run(
+                self.service.rename_file, file_id, name,
+                identity=identity or self.service.folder_identity(file_id)
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Timeout renaming {file_id}")
+            return False
+
+    async def upload_photo_evidence(self, photo_path, filename, folder_id, identity=None, remove_after=False):
+        """``remove_after``: hapus ``photo_path`` setelah upload selesai (juga kalau await-nya timeout)"""
+        def remove():
+            try:
+                if os.path.exists(photo_path):
+                    os.remove(photo_path)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not clean up temp file {photo_path}: {e}")
+        
+        try:
+            return await self.run(
+                self.service.upload_photo_evidence, photo_path, filename, folder_id,
+                identity=identity or self.service.folder_identity(folder_id),
+                on_done=remove if remove_after else None
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Timeout uploading photo {filename}")
+            return None
+
+    async def delete_file(self, file_id, identity=None):
+        try:
+            return await self.run(self.service.delete_file, file_id, identity=identity)
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Timeout deleting file {file_id}")
+            return False
+
+    async def delete_folder(self, folder_id, identity=None):
+        try:
+            return await self.run(
+                self.service.delete_folder, folder_id,
+                identity=identity or self.service.folder_identity(folder_id)
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Timeout deleting folder {folder_id}")
+            return False
+
+    def get_folder_link(self, folder_id):
+        # Tidak ada API call, cukup langsung
+        return self.service.get_folder_link(folder_id)
@@ -6,18 +6,19 @@ import logging
 import io
 import tempfile
 import shutil
+import threading
+import time
 from datetime import datetime, timedelta
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
+from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload, MediaFileUpload
 from googleapiclient.errors import HttpError
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
-from openpyxl.drawing.image import Image as XLImage
-from PIL import Image as PILImage
-from oauth_token_manager import get_access_token
+from services.drive_folder_mirror import get_template_mirror
+from services.google_drive_client import get_drive_client
+from services.excel_renderer import ExcelRenderer
+from services.excel_render_pool import get_render_pool, ExcelRenderQueueFull
 
 logger = logging.getLogger(__name__)
 
@@ -27,22 +28,83 @@ SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets'
 ]
 
+XLSX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+EXCEL_MIME_TYPES = (
+    XLSX_MIME_TYPE,
+    'application/vnd.ms-excel'
+)
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# Maksimum sub-request per batch request Drive
+DRIVE_BATCH_LIMIT = 100
+
+# Form type yang di-index di worker render untuk setiap template
+RENDER_FORM_TYPES = ('wifi', 'datin')
+
+# Cache template Excel di disk, dipakai bersama oleh semua worker
+TEMPLATE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'ba_template_cache')
+
+# Maksimum folder yang diingat identitas pembuatnya (folder paling lama dilupakan dulu)
+FOLDER_IDENTITY_LIMIT = 5000
+
+def warm_template_caches(services):
+    """Fill every service's template cache, then start the shared render pool (background, saat startup)"""
+    def refresh(service):
+        try:
+            service.refresh_template_cache()
+        except Exception as e:
+            logger.error(f"❌ Error refreshing template cache: {e}")
+    
+    def run():
+        threads = [
+            threading.Thread(target=refresh, args=(service,), name='template-cache-warm', daemon=True)
+            for service in services
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Worker di-spawn setelah template semua form type ter-register, supaya semuanya langsung ter-index
+        get_render_pool().start()
+    
+    threading.Thread(target=run, name='render-pool-warm', daemon=True).start()
+
+
 class GoogleBAService:
     def __init__(self, template_folder_id, result_folder_id):
         self.template_folder_id = template_folder_id
         self.result_folder_id = result_folder_id
         self.oauth_client_config = os.environ.get('GOOGLE_OAUTH_CLIENT_CONFIG')
         
-        # Services
-        self.service_drive = None
-        self.service_sheets = None
-        self.credentials = None
+        # Drive client, credentials dan transport HTTP dipakai bersama oleh semua form type
+        self.drive_client = get_drive_client()
+        self.credential_pool = self.drive_client.credential_pool
+        
+        # Identitas OAuth pembuat setiap folder laporan
+        self._folder_identities = {}
+        self._folder_identities_lock = threading.Lock()
         
         # Token management
         self.token_file = 'token.json'
         
+        # Template cache: {'file', 'version', 'content', 'checked_at'}; versi di Drive dicek paling sering tiap interval
+        self.template_check_interval = float(os.environ.get('TEMPLATE_CHECK_INTERVAL', '600'))
+        self._template_cache = None
+        self._template_lock = threading.Lock()
+        self._template_refreshing = False
+        
+        # Render Excel (tanpa Drive) di process pool bersama; renderer lokal kalau pool tidak aktif
+        self.renderer = ExcelRenderer()
+        self.render_pool = get_render_pool()
+        
         # Validate environment
         self._validate_environment()
+        
+        # Isi folder template dibaca dari mirror lokal yang di-update lewat Drive changes feed
+        self.template_mirror = get_template_mirror()
+        self.template_mirror.watch(self.template_folder_id)
 
     def _validate_environment(self):
         """Validate required environment variables"""
@@ -64,9 +126,8 @@ class GoogleBAService:
             if not self.ensure_valid_token():
                 return False
             
-            # Build services dengan credentials yang sudah ada
-            self.service_drive = build('drive', 'v3', credentials=self.credentials)
-            self.service_sheets = build('sheets', 'v4', credentials=self.credentials)
+            # Drive client bersama dibuat sekali (service form type berikutnya langsung memakainya)
+            self.service_drive
             
             logger.info("✅ Google APIs authenticated successfully with OAuth")
             return True
@@ -75,45 +136,56 @@ class GoogleBAService:
             logger.error(f"❌ Failed to authenticate Google APIs: {e}")
             return False
 
+    @property
+    def service_drive(self):
+        return self.drive_client.service
+
+    def current_identity(self):
+        """Identitas OAuth untuk call di thread ini (default kalau tidak di dalam run_as)"""
+        return self.drive_client.current_identity()
+
+    def run_as(self, identity, func, *args, **kwargs):
+        """Run ``func`` with every Drive request made under OAuth ``identity``"""
+        return self.drive_client.run_as(identity, func, *args, **kwargs)
+
+    def folder_identity(self, folder_id):
+        """Identitas yang membuat folder ini di process ini, atau None kalau tidak diketahui"""
+        with self._folder_identities_lock:
+            return self._folder_identities.get(folder_id)
+
+    def _bind_folders(self, folder_ids):
+        """Remember which identity created these folders, so the whole tree stays under it"""
+        identity = self.current_identity()
+        with self._folder_identities_lock:
+            for folder_id in folder_ids:
+                self._folder_identities.pop(folder_id, None)
+                self._folder_identities[folder_id] = identity
+            while len(self._folder_identities) > FOLDER_IDENTITY_LIMIT:
+                del self._folder_identities[next(iter(self._folder_identities))]
+
     def ensure_valid_token(self):
-        """Ensure we have a valid token, refresh if needed"""
-        token = get_access_token()
-        if token:
-            # Update credentials object dengan token baru
-            if self.credentials:
-                self.credentials.token = token
-                return True
-            else:
-                # Buat credentials baru jika belum ada
-                from google.oauth2.credentials import Credentials
-                self.credentials = Credentials(token=token)
-                
-                # Rebuild services dengan credentials baru
-                self.service_drive = build('drive', 'v3', credentials=self.credentials)
-                self.service_sheets = build('sheets', 'v4', credentials=self.credentials)
-                return True
-        
-        logger.error("Failed to get valid access token")
-        return False
+        """Ensure we have a valid token for the current identity, refresh if needed"""
+        return self.drive_client.ensure_valid_token()
 
     # Semua method lainnya tetap sama, tapi tambahkan ensure_valid_token() di awal setiap method yang menggunakan API
 
     def find_excel_template(self):
-        """Find Excel template file in template folder"""
+        """Find Excel template file in template folder (dari mirror lokal)"""
         try:
-            if not self.ensure_valid_token():
+            # Page token changes feed milik satu user, jadi sync selalu memakai identitas default
+            # walaupun call ini berjalan di bawah identitas pool lain (run_as)
+            default = self.credential_pool.default
+            if not self.drive_client.ensure_valid_token(default):
                 return None
-                
-            # Search for Excel files in template folder
-            query = f"'{self.template_folder_id}' in parents and (mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' or mimeType='application/vnd.ms-excel')"
             
-            results = self.service_drive.files().list(
-                q=query,
-                fields="files(id, name, mimeType)",
-                supportsAllDrives=True
-            ).execute()
+            # Hanya perubahan sejak poll terakhir yang memakai API call
+            self.run_as(default, self.template_mirror.sync_if_due, self.service_drive)
             
-            files = results.get('files', [])
+            # Search for Excel files in template folder
+            files = [
+                item for item in self.template_mirror.files_in(self.template_folder_id)
+                if item.get('mimeType') in EXCEL_MIME_TYPES
+            ]
             
             if not files:
                 logger.error("❌ No Excel template found in template folder")
@@ -129,189 +201,164 @@ class GoogleBAService:
             logger.error(f"❌ Error finding template: {e}")
             return None
 
-    # Tambahkan ensure_valid_token() di semua method yang menggunakan Google API
-    # Contoh untuk method download_excel_template:
-    def download_excel_template(self, file_id):
-        """Download Excel template to temporary file"""
+    def download_template_bytes(self, file_id):
+        """Download Excel template into memory"""
         try:
             if not self.ensure_valid_token():
                 return None
-                
-            # Download file
-            request = self.service_drive.files().get_media(fileId=file_id)
             
-            # Create temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
+            request = self.service_drive.files().get_media(fileId=file_id)
+            buffer = io.BytesIO()
             
-            downloader = MediaIoBaseDownload(temp_file, request)
+            downloader = MediaIoBaseDownload(buffer, request)
             done = False
             
             while done is False:
                 status, done = downloader.next_chunk()
-                
-            temp_file.close()
             
-            logger.info(f"✅ Template downloaded to: {temp_file.name}")
-            return temp_file.name
+            logger.info(f"✅ Template downloaded: {file_id} ({buffer.tell()} bytes)")
+            return buffer.getvalue()
             
         except Exception as e:
             logger.error(f"❌ Error downloading template: {e}")
             return None
 
+    def _template_version(self, template_file):
+        """Version key of a Drive file (md5Checksum, atau modifiedTime jika tidak ada)"""
+        return template_file.get('md5Checksum') or template_file.get('modifiedTime') or ''
+
+    def _template_cache_path(self, file_id, version):
+        safe_version = ''.join(ch for ch in version if ch.isalnum())
+        return os.path.join(TEMPLATE_CACHE_DIR, f"{file_id}_{safe_version}.xlsx")
+
+    def _read_template_from_disk(self, file_id, version):
+        """Template bytes cached by another worker or a previous run"""
+        try:
+            with open(self._template_cache_path(file_id, version), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_template_to_disk(self, file_id, version, content):
+        try:
+            os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+            cache_path = self._template_cache_path(file_id, version)
+            fd, temp_path = tempfile.mkstemp(dir=TEMPLATE_CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, cache_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not write template cache: {e}")
+
+    def refresh_template_cache(self):
+        """Check the template version on Drive and download only if it changed.
+
+        Returns (template_file, content); the previous cache is kept if Drive is unreachable.
+        """
+        with self._template_lock:
+            cached = self._template_cache
+        
+        template_file = self.find_excel_template()
+        if not template_file:
+            return (cached['file'], cached['content']) if cached else (None, None)
+        
+        version = self._template_version(template_file)
+        if cached and cached['file']['id'] == template_file['id'] and cached['version'] == version:
+            with self._template_lock:
+                cached['checked_at'] = time.monotonic()
+            logger.info(f"✅ Template unchanged: {template_file['name']}")
+            return cached['file'], cached['content']
+        
+        content = self._read_template_from_disk(template_file['id'], version)
+        if content is None:
+            content = self.download_template_bytes(template_file['id'])
+            if content is None:
+                return (cached['file'], cached['content']) if cached else (template_file, None)
+            self._write_template_to_disk(template_file['id'], version, content)
+        
+        with self._template_lock:
+            self._template_cache = {
+                'file': template_file,
+                'version': version,
+                'content': content,
+                'checked_at': time.monotonic()
+            }
+        logger.info(f"📦 Template cached: {template_file['name']} (version {version})")
+        self.render_pool.preload((template_file['id'], version), content, RENDER_FORM_TYPES)
+        self.renderer.workbook_pool.invalidate(template_file['id'])
+        return template_file, content
+
+    def _refresh_template_in_background(self):
+        """Start one background refresh at a time"""
+        with self._template_lock:
+            if self._template_refreshing:
+                return
+            self._template_refreshing = True
+        
+        def run():
+            try:
+                self.refresh_template_cache()
+            except Exception as e:
+                logger.error(f"❌ Error refreshing template cache: {e}")
+            finally:
+                with self._template_lock:
+                    self._template_refreshing = False
+        
+        threading.Thread(target=run, name='template-cache-refresh', daemon=True).start()
+
+    def get_template(self):
+        """Template (file metadata, bytes) from the cache.
+
+        Tanpa round trip ke Drive selama cache ada; jika sudah lewat template_check_interval,
+        versi baru dicek di background dan cache lama tetap dipakai untuk request ini.
+        """
+        with self._template_lock:
+            cached = self._template_cache
+        
+        if cached is None:
+            return self.refresh_template_cache()
+        
+        if time.monotonic() - cached['checked_at'] >= self.template_check_interval:
+            self._refresh_template_in_background()
+        return cached['file'], cached['content']
+
     # Lakukan hal yang sama untuk semua method yang menggunakan Google API:
     # convert_excel_to_pdf, upload_pdf_result, create_evidence_folder, 
     # upload_photo_evidence, get_drive_info, dll.
 
-    def fill_excel_template(self, template_path, form_data, ba_config, form_type='wifi'):
-        """Fill Excel template with form data, including signature images that fit properly in cells"""
-        temp_files_to_cleanup = []
-        
+    def delete_file(self, file_id):
+        """Delete a Google Drive file"""
         try:
-            logger.info("📋 Filling Excel template with form data and signatures...")
-            
-            # Load workbook
-            workbook = openpyxl.load_workbook(template_path)
-            worksheet = workbook.active
+            if not self.ensure_valid_token():
+                return False
             
-            # Prepare Excel data using ba_config
-            excel_data = ba_config.prepare_excel_data(form_data, form_type)
+            self.service_drive.files().delete(fileId=file_id).execute()
+            logger.info(f"✅ File deleted: {file_id}")
+            return True
             
-            # Fill data into cells
-            for coordinate, value in excel_data.items():
-                try:
-                    worksheet[coordinate] = value
-                    logger.debug(f"📝 Filled {coordinate}: {value}")
-                except Exception as e:
-                    logger.warning(f"⚠️ Could not fill cell {coordinate}: {e}")
-            
-            # Handle signature images dengan ukuran yang pas di dalam sel
-            tanda_tangan_section = form_data.get('tanda_tangan', {})
-            signature_files = []
-            
-            if tanda_tangan_section:
-                for field_name, image_path in tanda_tangan_section.items():
-                    if image_path and image_path.startswith('SIGNATURE_IMAGE:'):
-                        actual_path = image_path.replace('SIGNATURE_IMAGE:', '')
-                        coordinate = ba_config.get_excel_coordinates('tanda_tangan', field_name, form_type)
-                        
-                        if coordinate and os.path.exists(actual_path):
-                            try:
-                                # PERBAIKAN: Fit gambar ke dalam sel dengan ukuran yang tepat
-                                cell = worksheet[coordinate]
-                                
-                                # Dapatkan ukuran sel dalam pixels menggunakan helper method
-                                cell_width_px, cell_height_px = self._calculate_cell_dimensions(worksheet, coordinate)
-                                
-                                # Load image
-                                img = XLImage(actual_path)
-                                
-                                # BAGIAN PENGATURAN SKALA - CUSTOM DISINI
-                                # =============================================
-                                # Margin dari tepi sel (dalam pixels)
-                                margin = 0.5  # CUSTOM: ubah nilai ini untuk mengatur jarak dari tepi sel
-                                
-                                # Faktor skala custom (0.1 = 10%, 1.0 = 100%, 1.5 = 150%)
-                                custom_scale_factor = 1.4  # CUSTOM: ubah nilai ini untuk memperbesar/memperkecil gambar secara keseluruhan
-                                
-                                # Ukuran maksimum yang tersedia dalam sel (dikurangi margin)
-                                available_width = max(cell_width_px - (margin * 2), 50)  # minimal 50px
-                                available_height = max(cell_height_px - (margin * 2), 30)  # minimal 30px
-                                
-                                # Terapkan custom scale factor ke ukuran yang tersedia
-                                target_width = available_width * custom_scale_factor
-                                target_height = available_height * custom_scale_factor
-                                
-                                # Dapatkan dimensi asli gambar signature
-                                # Untuk gambar dengan dimensi 365x380 px dan 301 DPI
-                                original_img_width = img.width
-                                original_img_height = img.height
-                                
-                                logger.info(f"📏 Original image dimensions: {original_img_width}x{original_img_height}px")
-                                logger.info(f"📐 Cell dimensions: {cell_width_px}x{cell_height_px}px")
-                                logger.info(f"🎯 Target dimensions: {target_width}x{target_height}px")
-                                
-                                # Hitung rasio skala untuk mempertahankan aspect ratio
-                                width_ratio = target_width / original_img_width
-                                height_ratio = target_height / original_img_height
-                                
-                                # Ambil rasio yang lebih kecil agar gambar tidak keluar dari area target
-                                scale_ratio = min(width_ratio, height_ratio)
-                                
-                                # Hitung ukuran final
-                                final_width = original_img_width * scale_ratio
-                                final_height = original_img_height * scale_ratio
-                                
-                                # FINE-TUNING: Manual override untuk ukuran tertentu (opsional)
-                                # Uncomment dan sesuaikan jika ingin ukuran fixed
-                                # final_width = 120   # CUSTOM: ukuran lebar fixed dalam pixels
-                                # final_height = 60   # CUSTOM: ukuran tinggi fixed dalam pixels
-                                
-                                # Set ukuran gambar
-                                img.width = int(final_width)
-                                img.height = int(final_height)
-                                # =============================================
-                                # AKHIR BAGIAN PENGATURAN SKALA
-                                
-                                # Set anchor di koordinat sel
-                                img.anchor = coordinate
-                                
-                                # Add image ke worksheet
-                                worksheet.add_image(img)
-                                signature_files.append(actual_path)
-                                
-                                logger.info(f"✅ Added signature image at {coordinate} "
-                                        f"(final size: {int(final_width)}x{int(final_height)}px, "
-                                        f"scale ratio: {scale_ratio:.3f})")
-                                        
-                            except Exception as e:
-                                logger.error(f"❌ Error adding signature image: {e}")
-                                # Fallback: add image dengan ukuran default yang disesuaikan
-                                try:
-                                    img = XLImage(actual_path)
-                                    # Fallback size yang disesuaikan dengan signature 365x380
-                                    fallback_width = 100  # CUSTOM: ubah fallback width
-                                    fallback_height = 52   # CUSTOM: ubah fallback height (mempertahankan rasio 365:380)
-                                    
-                                    img.width = fallback_width
-                                    img.height = fallback_height
-                                    img.anchor = coordinate
-                                    worksheet.add_image(img)
-                                    signature_files.append(actual_path)
-                                    logger.warning(f"⚠️ Added signature with fallback size at {coordinate} "
-                                                f"({fallback_width}x{fallback_height}px)")
-                                except Exception as fallback_error:
-                                    logger.error(f"❌ Fallback failed: {fallback_error}")
-            
-            # Save filled template to temporary file
-            temp_dir = tempfile.gettempdir()
-            filled_filename = f"filled_ba_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            filled_path = os.path.join(temp_dir, filled_filename)
-            
-            workbook.save(filled_path)
-            logger.info(f"✅ Filled template saved: {filled_path}")
-            
-            # Clean up signature files after adding to Excel
-            for sig_file in signature_files:
-                try:
-                    if os.path.exists(sig_file):
-                        os.remove(sig_file)
-                        logger.info(f"🗑️ Cleaned up signature file: {sig_file}")
-                except Exception as e:
-                    logger.warning(f"⚠️ Could not clean up signature file {sig_file}: {e}")
+        except Exception as e:
+            logger.error(f"❌ Error deleting file {file_id}: {e}")
+            return False
+
+    def rename_file(self, file_id, name):
+        """Rename a Google Drive file or folder"""
+        try:
+            if not self.ensure_valid_token():
+                return False
             
-            return filled_path
+            self.service_drive.files().update(
+                fileId=file_id,
+                body={'name': name},
+                fields='id',
+                supportsAllDrives=True
+            ).execute()
+            logger.info(f"✏️ Renamed {file_id} -> {name}")
+            return True
             
         except Exception as e:
-            logger.error(f"❌ Error filling Excel template: {e}")
-            
-            # Clean up any created files on error
-            for file_path in temp_files_to_cleanup:
-                try:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                except:
-                    pass
-                
+            logger.error(f"❌ Error renaming {file_id}: {e}")
+            return False
+
     def delete_folder(self, folder_id):
         """Delete a Google Drive folder"""
         try:
@@ -326,39 +373,42 @@ class GoogleBAService:
             logger.error(f"❌ Error deleting folder {folder_id}: {e}")
             return False
 
-    # Helper method untuk menghitung ukuran sel yang lebih akurat
-    def _calculate_cell_dimensions(self, worksheet, coordinate):
-        """Calculate cell dimensions in pixels more accurately"""
-        try:
-            from openpyxl.utils import coordinate_from_string, column_index_from_string, get_column_letter
-            
-            col_letter, row_num = coordinate_from_string(coordinate)
-            col_index = column_index_from_string(col_letter)
-            
-            # Get column width (dalam character units)
-            col_dim = worksheet.column_dimensions.get(col_letter)
-            col_width_chars = col_dim.width if col_dim and col_dim.width else 8.43  # Excel default
-            
-            # Get row height (dalam point units)  
-            row_dim = worksheet.row_dimensions.get(row_num)
-            row_height_points = row_dim.height if row_dim and row_dim.height else 15  # Excel default
-            
-            # Konversi ke pixels dengan faktor konversi yang akurat untuk DPI 301
-            # Disesuaikan dengan resolusi signature image 301 DPI
-            # 1 character width ≈ 7.5 pixels (untuk font default Excel)
-            # 1 point ≈ 1.33 pixels
-            cell_width_px = col_width_chars * 7.5
-            cell_height_px = row_height_points * 1.33
-            
-            return int(cell_width_px), int(cell_height_px)
-            
-        except Exception as e:
-            logger.warning(f"Could not calculate cell dimensions: {e}")
-            # Fallback dimensions yang disesuaikan dengan signature 365x380
-            return 120, 80  # fallback dimensions yang lebih proporsional
+    def render_excel(self, template_key, template_content, form_data, ba_config, form_type='wifi'):
+        """Filled xlsx bytes, rendered in the process pool (di thread ini kalau pool tidak aktif/rusak)
 
-    def upload_excel_result(self, excel_path, filename, folder_id=None):
-        """Upload final Excel to specific folder (default: result folder)"""
+        Antrian penuh atau timeout tidak di-render ulang di sini: job yang timeout masih jalan di
+        worker, render kedua hanya menambah beban saat pool sedang penuh.
+        """
+        if self.render_pool.enabled:
+            try:
+                return self.render_pool.render(template_key, template_content, form_data, form_type)
+            except ExcelRenderQueueFull:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Excel render pool failed, rendering in-process: {e}")
+        return self.renderer.render(template_key, template_content, form_data, ba_config, form_type)
+
+    def find_child(self, parent_id, name, mime_type=None):
+        """ID of a non-trashed file named ``name`` directly in ``parent_id``, None if there is none"""
+        escaped = name.replace('\\', '\\\\').replace("'", "\\'")
+        query = f"name = '{escaped}' and '{parent_id}' in parents and trashed = false"
+        if mime_type:
+            query += f" and mimeType = '{mime_type}'"
+        files = self.service_drive.files().list(
+            q=query,
+            fields='files(id)',
+            pageSize=1,
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True
+        ).execute().get('files', [])
+        return files[0]['id'] if files else None
+
+    def upload_excel_result(self, excel_content, filename, folder_id=None):
+        """Upload final Excel bytes to specific folder (default: result folder)
+
+        Kalau file dengan nama yang sama sudah ada di folder itu (mis. upload dari percobaan
+        sebelumnya yang timeout tetap selesai), isinya diganti, bukan dibuat file kedua.
+        """
         try:
             if not self.ensure_valid_token():
                 return None
@@ -366,130 +416,183 @@ class GoogleBAService:
             logger.info(f"📤 Uploading Excel result: {filename}")
             
             # Use provided folder or default result folder
-            parents = [folder_id] if folder_id else [self.result_folder_id]
-            
-            file_metadata = {
-                'name': f"{filename}.xlsx",
-                'parents': parents
-            }
+            parent_id = folder_id or self.result_folder_id
             
-            media = MediaFileUpload(excel_path, 
-                                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 
-                                resumable=True)
+            # File BA kecil: multipart upload satu request, tanpa sesi resumable
+            media = MediaIoBaseUpload(io.BytesIO(excel_content), mimetype=XLSX_MIME_TYPE, resumable=False)
             
-            uploaded_file = self.service_drive.files().create(
-                body=file_metadata,
-                media_body=media,
-                supportsAllDrives=True
-            ).execute()
-            
-            file_id = uploaded_file.get('id')
+            file_id = self.find_child(parent_id, f"{filename}.xlsx")
+            if file_id:
+                self.service_drive.files().update(
+                    fileId=file_id,
+                    media_body=media,
+                    supportsAllDrives=True
+                ).execute()
+                logger.info(f"♻️ Excel already in folder, content replaced: {file_id}")
+            else:
+                file_metadata = {
+                    'name': f"{filename}.xlsx",
+                    'parents': [parent_id]
+                }
+                uploaded_file = self.service_drive.files().create(
+                    body=file_metadata,
+                    media_body=media,
+                    supportsAllDrives=True
+                ).execute()
+                file_id = uploaded_file.get('id')
+                logger.info(f"✅ Excel uploaded successfully: {file_id}")
             
             # Generate shareable link
             link = f"https://drive.google.com/file/d/{file_id}/view"
-            
-            logger.info(f"✅ Excel uploaded successfully: {file_id}")
             return link
             
         except Exception as e:
             logger.error(f"❌ Error uploading Excel: {e}")
             return None
 
-    def create_folder_structure(self, base_folder_id, folder_name):
-        """Create organized folder structure for reports"""
+    def find_folder_structure(self, base_folder_id, folder_name):
+        """Existing (report, evidence, form BA) folder ids for ``folder_name``, or None"""
         try:
             if not self.ensure_valid_token():
-                return None, None, None
-
-            # Create main report folder
-            report_folder_metadata = {
-                'name': folder_name,
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [base_folder_id]
-            }
-            
-            report_folder = self.service_drive.files().create(
-                body=report_folder_metadata,
-                supportsAllDrives=True
-            ).execute()
-            
-            report_folder_id = report_folder.get('id')
-            
-            # Create subfolders
-            evidence_folder_metadata = {
-                'name': 'Evidence',
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [report_folder_id]
-            }
-            
-            evidence_folder = self.service_drive.files().create(
-                body=evidence_folder_metadata,
-                supportsAllDrives=True
-            ).execute()
-            
-            evidence_folder_id = evidence_folder.get('id')
-            
-            # Create BA Form folder
-            ba_form_folder_metadata = {
-                'name': 'Form BA',
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [report_folder_id]
-            }
-            
-            ba_form_folder = self.service_drive.files().create(
-                body=ba_form_folder_metadata,
-                supportsAllDrives=True
-            ).execute()
-            
-            ba_form_folder_id = ba_form_folder.get('id')
+                return None
             
-            logger.info(f"📁 Folder structure created: {folder_name}")
+            report_folder_id = self.find_child(base_folder_id, folder_name, FOLDER_MIME_TYPE)
+            if not report_folder_id:
+                return None
+            evidence_folder_id = self.find_child(report_folder_id, 'Evidence', FOLDER_MIME_TYPE)
+            ba_form_folder_id = self.find_child(report_folder_id, 'Form BA', FOLDER_MIME_TYPE)
+            if not (evidence_folder_id and ba_form_folder_id):
+                return None
             return report_folder_id, evidence_folder_id, ba_form_folder_id
-                
+            
         except Exception as e:
-            logger.error(f"❌ Error creating folder structure: {e}")
+            logger.error(f"❌ Error looking up folder structure {folder_name}: {e}")
+            return None
+
+    def create_folder_tree(self, parent_id, tree):
+        """Create nested folders with one Drive round trip per tree level.
+
+        ``tree`` berupa ``{name: {child_name: {...}}}``. Hasilnya ``{path: folder_id}`` dengan
+        path berupa tuple nama folder dari root tree, mis. ``('Laporan', 'Evidence')``.
+        """
+        try:
+            if not self.ensure_valid_token():
+                return None
+
+            folder_ids = {}
+            level = [((name,), parent_id, subtree) for name, subtree in tree.items()]
+            while level:
+                created = self._create_folders([(path[-1], parent) for path, parent, _ in level])
+                next_level = []
+                for (path, _, subtree), folder_id in zip(level, created):
+                    folder_ids[path] = folder_id
+                    next_level.extend((path + (name,), folder_id, child) for name, child in subtree.items())
+                level = next_level
+
+            self._bind_folders(folder_ids.values())
+            return folder_ids
+
+        except Exception as e:
+            logger.error(f"❌ Error creating folder tree: {e}")
+            return None
+
+    def _folder_create_request(self, name, parent_id):
+        return self.service_drive.files().create(
+            body={'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [parent_id]},
+            fields='id',
+            supportsAllDrives=True
+        )
+
+    def _create_folders(self, folders):
+        """Create [(name, parent_id), ...] in one batch request; returns folder ids in order"""
+        if len(folders) == 1:
+            return [self._folder_create_request(*folders[0]).execute().get('id')]
+
+        folder_ids = [None] * len(folders)
+        errors = {}
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                errors[int(request_id)] = exception
+            else:
+                folder_ids[int(request_id)] = response.get('id')
+
+        for start in range(0, len(folders), DRIVE_BATCH_LIMIT):
+            batch = self.service_drive.new_batch_http_request(callback=on_response)
+            for index in range(start, min(start + DRIVE_BATCH_LIMIT, len(folders))):
+                batch.add(self._folder_create_request(*folders[index]), request_id=str(index))
+            batch.execute()
+
+        # Sub-request yang gagal (mis. rate limit) dicoba ulang satu per satu dengan backoff
+        for index, error in errors.items():
+            logger.warning(f"⚠️ Batch folder create failed for {folders[index][0]}, retrying: {error}")
+            folder_ids[index] = self._folder_create_request(*folders[index]).execute(num_retries=3).get('id')
+
+        return folder_ids
+
+    def create_folder_structure(self, base_folder_id, folder_name):
+        """Create organized folder structure for reports"""
+        folder_ids = self.create_folder_tree(base_folder_id, {
+            folder_name: {'Evidence': {}, 'Form BA': {}}
+        })
+        if not folder_ids:
             return None, None, None
 
-    async def process_excel_only(self, form_data, filename, ba_config, form_type='wifi'):
-        """Complete process with organized folder structure"""
-        temp_files = []
-        
+        logger.info(f"📁 Folder structure created: {folder_name}")
+        return (
+            folder_ids[(folder_name,)],
+            folder_ids[(folder_name, 'Evidence')],
+            folder_ids[(folder_name, 'Form BA')]
+        )
+
+    def process_excel_only(self, form_data, filename, ba_config, form_type='wifi', folders=None):
+        """Complete process with organized folder structure (blocking; pakai AsyncGoogleBAService dari event loop)
+
+        ``folders``: (report, evidence, form BA) folder ids yang sudah dibuat lebih dulu, kalau ada.
+        """
         try:
             logger.info("🚀 Starting Excel processing with organized folders...")
             
-            # Step 1: Find Excel template
-            template_file = self.find_excel_template()
+            # Step 1-2: Template dari cache (tanpa round trip Drive selama versinya masih sama)
+            template_file, template_content = self.get_template()
             if not template_file:
                 return False, "Template Excel tidak ditemukan di folder template"
             
-            # Step 2: Download template
-            template_path = self.download_excel_template(template_file['id'])
-            if not template_path:
+            if not template_content:
                 return False, "Gagal download template Excel"
             
-            temp_files.append(template_path)
-            
             # Step 3: Fill template with data
-            filled_path = self.fill_excel_template(template_path, form_data, ba_config, form_type)
-            if not filled_path:
+            template_key = (template_file['id'], self._template_version(template_file))
+            try:
+                filled_content = self.render_excel(template_key, template_content, form_data, ba_config, form_type)
+            except ExcelRenderQueueFull as e:
+                logger.warning(f"⚠️ {e}")
+                return False, "Server sedang sibuk membuat laporan lain, silakan coba lagi sebentar lagi"
+            if not filled_content:
                 return False, "Gagal mengisi template Excel"
             
-            temp_files.append(filled_path)
-            
-            # Step 4: Create organized folder structure
-            folder_name = filename  # Use the generated filename as folder name
-            report_folder_id, evidence_folder_id, ba_form_folder_id = self.create_folder_structure(
-                self.result_folder_id, folder_name
-            )
+            # Step 4: Create organized folder structure (kecuali sudah disiapkan selama form diisi)
+            if folders:
+                report_folder_id, evidence_folder_id, ba_form_folder_id = folders
+            else:
+                folder_name = filename  # Use the generated filename as folder name
+                # Retry setelah timeout memakai tree yang dibuat percobaan sebelumnya
+                report_folder_id, evidence_folder_id, ba_form_folder_id = (
+                    self.find_folder_structure(self.result_folder_id, folder_name) or
+                    self.create_folder_structure(self.result_folder_id, folder_name)
+                )
             
             if not all([report_folder_id, evidence_folder_id, ba_form_folder_id]):
                 return False, "Gagal membuat struktur folder"
             
             # Step 5: Upload Excel to Form BA folder
-            result_link = self.upload_excel_result(filled_path, filename, ba_form_folder_id)
+            result_link = self.upload_excel_result(filled_content, filename, ba_form_folder_id)
             if not result_link:
                 return False, "Gagal upload Excel result"
             
+            # File signature baru dihapus setelah Excel ter-upload, supaya retry masih bisa render
+            self.renderer.remove_signature_files(form_data)
+            
             # Step 6: Store folder IDs for evidence uploads
             result_info = {
                 'excel_link': result_link,
@@ -498,21 +601,15 @@ class GoogleBAService:
                 'ba_form_folder_id': ba_form_folder_id,
                 'report_folder_link': self.get_folder_link(report_folder_id),
                 'evidence_folder_link': self.get_folder_link(evidence_folder_id),
-                'ba_form_folder_link': self.get_folder_link(ba_form_folder_id)
+                'ba_form_folder_link': self.get_folder_link(ba_form_folder_id),
+                'drive_identity': self.current_identity()  # Upload ke folder ini harus memakai identitas yang sama
             }
             
-            # Cleanup temp files
-            self.cleanup_temp_files(*temp_files)
-            
             logger.info("✅ Excel processing with organized folders completed successfully!")
             return True, result_info
             
         except Exception as e:
             logger.error(f"❌ Error in process_excel_only: {e}")
-            
-            # Cleanup temp files on error
-            self.cleanup_temp_files(*temp_files)
-            
             return False, f"Terjadi kesalahan: {str(e)}"
 
 
@@ -584,26 +681,6 @@ class GoogleBAService:
         """Get shareable link for Google Drive file"""
         return f"https://drive.google.com/file/d/{file_id}/view"
 
-    def cleanup_temp_files(self, *file_paths):
-        """Clean up temporary files with retry logic"""
-        import time
-        for file_path in file_paths:
-            try:
-                if file_path and os.path.exists(file_path):
-                    # Try multiple times with delay
-                    for attempt in range(3):
-                        try:
-                            os.remove(file_path)
-                            logger.debug(f"🗑️ Cleaned up: {file_path}")
-                            break
-                        except PermissionError:
-                            if attempt < 2:  # Don't wait on last attempt
-                                time.sleep(0.1)
-                            continue
-            except Exception as e:
-                logger.warning(f"⚠️ Could not clean up {file_path}: {e}")
-
-
     def _has_photos_in_form(self, form_data):
         """Check if form data indicates photos will be uploaded"""
         # This is a placeholder - in practice, photos would be handled separately
@@ -713,13 +790,13 @@ class GoogleBAService:
                 return False, "Template file not found"
             
             # Try to download template
-            template_path = self.download_excel_template(template_file['id'])
-            if not template_path:
+            template_content = self.download_template_bytes(template_file['id'])
+            if not template_content:
                 return False, "Cannot download template"
             
             # Try to open with openpyxl
             try:
-                workbook = openpyxl.load_workbook(template_path)
+                workbook = openpyxl.load_workbook(io.BytesIO(template_content))
                 worksheet = workbook.active
                 logger.info("✅ Template can be opened with openpyxl")
             except Exception as e:
@@ -728,13 +805,9 @@ class GoogleBAService:
             # Test writing to a coordinate
             try:
                 worksheet['A1'] = 'Test'
-                test_path = template_path.replace('.xlsx', '_test.xlsx')
-                workbook.save(test_path)
+                workbook.save(io.BytesIO())
                 logger.info("✅ Template can be modified and saved")
                 
-                # Cleanup test files
-                self.cleanup_temp_files(template_path, test_path)
-                
             except Exception as e:
                 return False, f"Cannot modify template: {e}"
             
@@ -0,0 +1,229 @@
+# services/google_drive_client.py - Satu Drive API client dan pool HTTP transport untuk semua form type
+import os
+import json
+import logging
+import threading
+import contextvars
+
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+from google.oauth2.credentials import Credentials
+import google_auth_httplib2
+import httplib2
+
+from oauth_token_manager import get_credential_pool
+
+logger = logging.getLogger(__name__)
+
+# Timeout socket per request Drive (detik)
+DRIVE_HTTP_TIMEOUT = float(os.environ.get('DRIVE_HTTP_TIMEOUT', '60'))
+
+# Maksimum transport idle per identitas OAuth (default: sebanyak thread executor Drive)
+DRIVE_HTTP_POOL_SIZE = int(os.environ.get('DRIVE_HTTP_POOL_SIZE', os.environ.get('DRIVE_EXECUTOR_WORKERS', '8')))
+
+# Discovery document yang ikut di repo; client dibuat tanpa membaca discovery dari package/jaringan
+DISCOVERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'discovery')
+
+# Reason error Drive yang berarti quota identitas OAuth ini sedang habis
+RATE_LIMIT_REASONS = (b'userRateLimitExceeded', b'rateLimitExceeded')
+
+# Identitas OAuth untuk unit of work yang sedang berjalan di thread ini (lihat run_as)
+_drive_identity = contextvars.ContextVar('drive_identity', default=None)
+
+_discovery_documents = {}
+_discovery_lock = threading.Lock()
+
+
+def load_discovery_document(api, version):
+    """Bundled discovery document, parsed once per process (build_from_document tidak mengubahnya)"""
+    with _discovery_lock:
+        document = _discovery_documents.get((api, version))
+        if document is None:
+            with open(os.path.join(DISCOVERY_DIR, f'{api}.{version}.json'), 'r', encoding='utf-8') as f:
+                document = _discovery_documents[(api, version)] = json.load(f)
+        return document
+
+
+class IdentityHttp(google_auth_httplib2.AuthorizedHttp):
+    """AuthorizedHttp untuk satu identitas OAuth; response rate limit membuat identitas itu cool-off"""
+
+    def __init__(self, credentials, credential_pool, identity, **kwargs):
+        super().__init__(credentials, **kwargs)
+        self.credential_pool = credential_pool
+        self.identity = identity
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        response, content = super().request(uri, method, body=body, headers=headers, **kwargs)
+        rate_limited = response.status == 429 or (
+            response.status == 403 and isinstance(content, bytes) and
+            any(reason in content for reason in RATE_LIMIT_REASONS)
+        )
+        if rate_limited:
+            retry_after = response.get('retry-after')
+            self.credential_pool.cool_off(
+                self.identity, float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        elif response.status < 400:
+            self.credential_pool.record_success(self.identity)
+        return response, content
+
+
+class PooledHttp:
+    """Pengganti httplib2.Http untuk googleapiclient: setiap request meminjam transport dari pool.
+
+    httplib2.Http tidak thread-safe, jadi satu transport hanya dipakai satu request pada
+    satu waktu; object ini sendiri boleh dipakai bersama oleh semua thread.
+    """
+
+    def __init__(self, client, identity):
+        self.client = client
+        self.identity = identity
+
+    @property
+    def credentials(self):
+        # Dibaca googleapiclient untuk batch request
+        return self.client.credentials_for(self.identity)
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        http = self.client.checkout(self.identity)
+        try:
+            response = http.request(uri, method, body=body, headers=headers, **kwargs)
+        except Exception:
+            # State koneksi tidak jelas setelah error socket, transport tidak dikembalikan
+            self.client.discard(http)
+            raise
+        self.client.checkin(http)
+        return response
+
+    def close(self):
+        pass
+
+
+class GoogleDriveClient:
+    """Drive API client bersama untuk semua GoogleBAService.
+
+    Client dibuat dari discovery document di ``DISCOVERY_DIR`` saat pertama dipakai. Request
+    dari semua form type meminjam transport dari pool per identitas OAuth (maksimum
+    ``pool_size`` idle), jadi jumlah koneksi mengikuti jumlah request bersamaan, bukan
+    jumlah form type x thread.
+    """
+
+    def __init__(self, credential_pool=None, pool_size=None):
+        self.credential_pool = credential_pool or get_credential_pool()
+        self.pool_size = DRIVE_HTTP_POOL_SIZE if pool_size is None else pool_size
+
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # build() membaca credentials lewat PooledHttp, jadi tidak di bawah _lock
+        self._service = None
+        self._credentials = {}  # {identity: Credentials}
+        self._http = {}  # {identity: PooledHttp}
+        self._idle = {}  # {identity: [IdentityHttp]}
+        self._stats = {'created': 0, 'in_use': 0}
+
+    def current_identity(self):
+        """Identitas OAuth untuk call di thread ini (default kalau tidak di dalam run_as)"""
+        return _drive_identity.get() or self.credential_pool.default
+
+    def run_as(self, identity, func, *args, **kwargs):
+        """Run ``func`` with every Drive request made under OAuth ``identity``"""
+        token = _drive_identity.set(identity)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _drive_identity.reset(token)
+
+    def ensure_valid_token(self, identity=None):
+        """Ensure the identity (default: current) has a valid token, refresh if needed"""
+        identity = identity or self.current_identity()
+        token = self.credential_pool.get_access_token(identity)
+        if not token:
+            logger.error(f"Failed to get valid access token ({identity})")
+            return False
+
+        with self._lock:
+            credentials = self._credentials.get(identity)
+            if credentials is None:
+                self._credentials[identity] = Credentials(token=token)
+            else:
+                credentials.token = token
+        return True
+
+    def credentials_for(self, identity):
+        with self._lock:
+            return self._credentials.get(identity)
+
+    @property
+    def service(self):
+        """Drive v3 client, dibuat saat pertama dipakai"""
+        with self._build_lock:
+            if self._service is None:
+                with self._lock:
+                    http = self._http_for(self.credential_pool.default)
+                self._service = build_from_document(
+                    load_discovery_document('drive', 'v3'), http=http, requestBuilder=self._build_request
+                )
+                logger.info("✅ Shared Drive client built")
+            return self._service
+
+    def _http_for(self, identity):
+        """PooledHttp for an identity (dipanggil dengan lock dipegang)"""
+        http = self._http.get(identity)
+        if http is None:
+            http = self._http[identity] = PooledHttp(self, identity)
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        """requestBuilder for googleapiclient: request memakai transport pool identitas yang sedang aktif"""
+        with self._lock:
+            pooled = self._http_for(self.current_identity())
+        return HttpRequest(pooled, *args, **kwargs)
+
+    def checkout(self, identity):
+        """Borrow an idle transport for ``identity`` or create a new one"""
+        with self._lock:
+            credentials = self._credentials.get(identity)
+            idle = self._idle.setdefault(identity, [])
+            # Transport dengan credentials lama tidak dipakai lagi
+            while idle:
+                http = idle.pop()
+                if http.credentials is credentials:
+                    self._stats['in_use'] += 1
+                    return http
+            self._stats['created'] += 1
+            self._stats['in_use'] += 1
+        return IdentityHttp(credentials, self.credential_pool, identity, http=httplib2.Http(timeout=DRIVE_HTTP_TIMEOUT))
+
+    def checkin(self, http):
+        with self._lock:
+            self._stats['in_use'] -= 1
+            idle = self._idle.setdefault(http.identity, [])
+            if len(idle) < self.pool_size:
+                idle.append(http)
+                return
+        http.http.close()
+
+    def discard(self, http):
+        with self._lock:
+            self._stats['in_use'] -= 1
+        http.http.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'transports_created': self._stats['created'],
+                'transports_in_use': self._stats['in_use'],
+                'transports_idle': sum(len(idle) for idle in self._idle.values()),
+            }
+
+
+_drive_client = None
+_drive_client_lock = threading.Lock()
+
+
+def get_drive_client():
+    """Process-wide Drive client, dipakai bersama oleh service wifi dan datin"""
+    global _drive_client
+    with _drive_client_lock:
+        if _drive_client is None:
+            _drive_client = GoogleDriveClient()
+        return _drive_client
@@ -180,15 +180,14 @@ class PhotoHandler:
                 filename = f"evidence_{photo_count}_{timestamp}.jpg"
                 
                 # Upload to Google Drive evidence folder
+                # Temp file dihapus oleh facade setelah upload selesai, walaupun await-nya timeout
                 google_service = self.get_current_google_service(user_id)
-                file_id = google_service.upload_photo_evidence(
-                    temp_file.name, filename, evidence_folder_id,
+                photo_path, temp_file = temp_file.name, None
+                file_id = await google_service.upload_photo_evidence(
+                    photo_path, filename, evidence_folder_id,
+                    identity=session.get('drive_identity'), remove_after=True
                 )
                 
-                # Clean up temp file
-                if temp_file and os.path.exists(temp_file.name):
-                    os.remove(temp_file.name)
-                
                 if file_id:
                     # Save photo info to session
                     photo_info = {
@@ -509,15 +508,13 @@ class PhotoHandler:
             
             # Delete individual photos from Drive
             for photo in photos:
-                try:
-                    file_id = photo.get('file_id')
-                    if file_id:
-                        google_service.service_drive.files().delete(fileId=file_id).execute()
-
+                file_id = photo.get('file_id')
+                if file_id:
+                    if await google_service.delete_file(file_id, identity=session.get('drive_identity')):
                         deleted_count += 1
                         logger.info(f"🗑️ Deleted photo: {photo.get('filename')}")
-                except Exception as e:
-                    logger.warning(f"⚠️ Could not delete photo {photo.get('filename')}: {e}")
+                    else:
+                        logger.warning(f"⚠️ Could not delete photo {photo.get('filename')}")
             
             # Clear photos from session
             self.session_service.clear_photos(user_id)
@@ -1,46 +1,601 @@
 # services/session_ba_service.py - Session Management untuk Berita Acara (FIXED)
+import copy
+import contextvars
+import hashlib
+import heapq
 import json
 import os
 import logging
 import tempfile
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from services.session_codec import EncodedSessions, SessionCodec
+
+try:
+    import fcntl
+except ImportError:  # Windows: hanya lock antar thread
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
-class SessionBAService:
+# Unit of work aktif untuk update Telegram yang sedang diproses (per asyncio task)
+_current_unit = contextvars.ContextVar('session_unit_of_work', default=None)
+
+
+def _section_digest(section_data):
+    """Content hash of one form section"""
+    payload = json.dumps(section_data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).digest()
+
+
+def _top_level_keys(changed):
+    """Changed keys -> top-level session keys (('form_data', section_id) menjadi 'form_data')"""
+    return list(dict.fromkeys(key[0] if isinstance(key, tuple) else key for key in changed))
+
+
+def _form_section_mutation(section_id, section_data, updated_at, on_result=None):
+    digest = _section_digest(section_data)
+    
+    def apply(session):
+        # Initialize form_data if not exists
+        if 'form_data' not in session:
+            session['form_data'] = {}
+        
+        # Section yang isinya sama tidak ditulis ulang
+        current = session['form_data'].get(section_id)
+        if current is not None and _section_digest(current) == digest:
+            if on_result:
+                on_result(False)
+            return []
+        
+        # Update section data
+        session['form_data'][section_id] = section_data
+        session['updated_at'] = updated_at
+        if on_result:
+            on_result(True)
+        return [('form_data', section_id), 'updated_at']
+    return apply
+
+
+def _temp_value_mutation(key, value, updated_at):
+    def apply(session):
+        if 'temp_data' not in session:
+            session['temp_data'] = {}
+        
+        session['temp_data'][key] = value
+        session['updated_at'] = updated_at
+        return ['temp_data', 'updated_at']
+    return apply
+
+
+def _photo_mutation(photo_data, updated_at):
+    def apply(session):
+        if 'photos' not in session:
+            session['photos'] = []
+        
+        session['photos'].append(photo_data)
+        session['updated_at'] = updated_at
+        return ['photos', 'updated_at']
+    return apply
+
+
+def _signature_files(session):
+    """Paths of SIGNATURE_IMAGE: temp files referenced by a session"""
+    tanda_tangan = (session.get('form_data') or {}).get('tanda_tangan') or {}
+    return [
+        file_path.replace('SIGNATURE_IMAGE:', '')
+        for file_path in tanda_tangan.values()
+        if isinstance(file_path, str) and file_path.startswith('SIGNATURE_IMAGE:')
+    ]
+
+
+def _remove_signature_files(session):
+    """Delete a session's signature temp files, returns how many were removed"""
+    cleaned_files = 0
+    for actual_path in _signature_files(session):
+        try:
+            if os.path.exists(actual_path):
+                os.remove(actual_path)
+                cleaned_files += 1
+                logger.info(f"🗑️ Cleaned up signature file: {actual_path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not clean up signature file {actual_path}: {e}")
+    return cleaned_files
+
+
+def _pop_expired(sessions, user_ids, cutoff):
+    """Pop sessions whose stored updated_at is still at or before cutoff (ISO string).
+
+    Returns ({user_id: removed session}, {user_id: updated_at} for sessions updated since)
+    """
+    removed = {}
+    alive = {}
+    for user_id in user_ids:
+        session = sessions.get(str(user_id))
+        if session is None:
+            continue
+        
+        updated_at = session.get('updated_at')
+        if updated_at and updated_at <= cutoff:
+            removed[str(user_id)] = sessions.pop(str(user_id))
+        elif updated_at:
+            alive[str(user_id)] = updated_at
+    return removed, alive
+
+
+class SessionStats:
+    """Counter statistik session yang di-update per perubahan, sehingga dibaca O(1)"""
+
     def __init__(self):
+        self.counts = {
+            'total_sessions': 0,
+            'active_sessions': 0,
+            'completed_sessions': 0,
+            'total_form_sections': 0,
+            'total_photos': 0
+        }
+
+    @classmethod
+    def from_sessions(cls, sessions):
+        """Build counters with one pass over {user_id: session}"""
+        stats = cls()
+        for session_data in sessions.values():
+            stats.apply(None, cls.contribution(session_data))
+        return stats
+
+    @staticmethod
+    def contribution(session):
+        """(status, section count, photo count) of one session, None if it does not exist"""
+        if session is None:
+            return None
+        return (
+            session.get('status', 'active'),
+            len(session.get('form_data') or {}),
+            len(session.get('photos') or [])
+        )
+
+    def apply(self, before, after):
+        """Move the counters from one contribution to another"""
+        for sign, contribution in ((-1, before), (1, after)):
+            if contribution is None:
+                continue
+            
+            status, sections, photos = contribution
+            self.counts['total_sessions'] += sign
+            if status == 'active':
+                self.counts['active_sessions'] += sign
+            elif status == 'completed':
+                self.counts['completed_sessions'] += sign
+            self.counts['total_form_sections'] += sign * sections
+            self.counts['total_photos'] += sign * photos
+
+    def snapshot(self):
+        return dict(self.counts)
+
+
+class SessionUnitOfWork:
+    """Session cache untuk satu update: paling banyak satu read, lalu satu read-modify-write ke store.
+
+    Mutasi diterapkan ke salinan di memory (supaya read berikutnya di update yang sama melihatnya)
+    dan dicatat; commit memutar ulang mutasi itu ke session terbaru di store. Update lain untuk
+    user yang sama yang berjalan bersamaan (mis. beberapa foto album) tidak saling menimpa.
+    """
+
+    def __init__(self, service, user_id):
+        self.service = service
+        self.user_id = str(user_id)
+        self.session = None
+        self.loaded = False
+        self.mutations = []  # Mutasi yang diputar ulang saat commit
+        self.replaced = False
+        self.deleted = False
+
+    def _load(self):
+        if not self.loaded:
+            self.session = self.service._read_session(self.user_id)
+            self.loaded = True
+        return self.session
+
+    def read(self):
+        """Copy of the cached session (None if not found)"""
+        session = self._load()
+        return copy.deepcopy(session) if session is not None else None
+
+    def mutate(self, mutate, replay=None):
+        """Apply a mutation in memory; returns False if session not found
+
+        ``replay`` (default: ``mutate``) diterapkan ke session di store saat commit.
+        """
+        session = self._load()
+        if session is None:
+            return False
+        
+        if mutate(session) and not self.replaced:
+            self.mutations.append(replay or mutate)
+        return True
+
+    def put(self, session_data):
+        """Replace the whole session"""
+        self.session = copy.deepcopy(session_data)
+        self.loaded = True
+        self.replaced = True
+        self.deleted = False
+        self.mutations.clear()
+
+    def delete(self):
+        """Delete the session; returns False if it did not exist"""
+        if self._load() is None:
+            return False
+        
+        self.session = None
+        self.deleted = True
+        self.replaced = False
+        self.mutations.clear()
+        return True
+
+    def commit(self):
+        """Write all changes to the store in one operation"""
+        if self.deleted:
+            self.service._remove_sessions([self.user_id])
+        elif self.replaced:
+            self.service._insert_session(self.user_id, self.session)
+        elif self.mutations and self.session is not None:
+            mutations = self.mutations
+            
+            def replay(session):
+                changed = []
+                for mutate in mutations:
+                    changed.extend(mutate(session) or [])
+                return list(dict.fromkeys(changed))
+            
+            self.service._mutate_session(self.user_id, replay)
+        else:
+            return False
+        
+        self.mutations = []
+        self.replaced = self.deleted = False
+        return True
+
+
+class SessionBAService:
+    def __init__(self, session_file=None):
         # Use temp directory for session file to avoid permission issues
-        temp_dir = tempfile.gettempdir()
-        self.session_file = os.path.join(temp_dir, 'ba_user_sessions.json')
+        if not session_file:
+            temp_dir = tempfile.gettempdir()
+            session_file = os.path.join(temp_dir, 'ba_user_sessions.json')
+        self.session_file = session_file
         logger.info(f"Session file location: {self.session_file}")
+        
+        # Encoding ringkas (key table dari BeritaAcaraConfig); file JSON lama tetap bisa dibaca
+        self.codec = SessionCodec.from_config()
+        
+        # last_accessed dicatat di memory dan ditulis per batch, supaya get_session tidak menulis ke disk
+        self.access_flush_interval = 60
+        self._access_times = {}
+        self._access_lock = threading.Lock()
+        self._last_access_flush = time.monotonic()
+        
+        # Lock file terpisah supaya beberapa worker gunicorn tidak saling menimpa session file
+        self.lock_file = f"{self.session_file}.lock"
+        self._file_mutex = threading.RLock()
+        self._lock_depth = 0
+        self._lock_handle = None
+        self._lock_pid = None
+        
+        # Expiry index (heap berisi (updated_at, user_id), lazy deletion), dibangun saat sweep pertama.
+        # Dibangun ulang berkala supaya session yang ditulis worker lain ikut terindeks.
+        self.expiry_rebuild_interval = 3600
+        self._expiry_heap = None
+        self._expiry_index = {}
+        self._expiry_lock = threading.Lock()
+        self._expiry_built_at = 0
+        self._expiry_pending = None  # {user_id: updated_at} selama index dibangun ulang
+        
+        # Metric dirty tracking: berapa kali update_form_section benar-benar menulis / dilewati
+        self._section_writes = {'written': 0, 'skipped': 0}
+        self._section_writes_lock = threading.Lock()
+        
+        # Counter statistik; hanya dipakai selama session file masih hasil tulisan proses ini
+        self._stats = None
+        self._stats_signature = None
+        self._stats_lock = threading.Lock()
+    
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock for read-modify-write, shared by threads and worker processes"""
+        with self._file_mutex:
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1 and fcntl is not None:
+                    # Handle dibuka ulang setelah fork, karena flock berlaku per open file
+                    if self._lock_handle is None or self._lock_pid != os.getpid():
+                        os.makedirs(os.path.dirname(self.lock_file), exist_ok=True)
+                        self._lock_handle = open(self.lock_file, 'a')
+                        self._lock_pid = os.getpid()
+                    fcntl.flock(self._lock_handle, fcntl.LOCK_EX)
+                yield
+            finally:
+                if self._lock_depth == 1 and fcntl is not None and self._lock_handle is not None:
+                    fcntl.flock(self._lock_handle, fcntl.LOCK_UN)
+                self._lock_depth -= 1
     
     def _load_sessions(self):
-        """Load sessions from file"""
+        """Load sessions from file (EncodedSessions: hanya session yang dibaca yang di-decode)"""
         if os.path.exists(self.session_file):
             try:
                 with open(self.session_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    return self.codec.loads(f.read())
             except Exception as e:
                 logger.error(f"Error loading sessions: {e}")
-                return {}
-        return {}
+                return EncodedSessions(self.codec)
+        return EncodedSessions(self.codec)
     
     def _save_sessions(self, sessions):
         """Save sessions to file"""
         try:
             # Ensure directory exists
-            os.makedirs(os.path.dirname(self.session_file), exist_ok=True)
+            session_dir = os.path.dirname(self.session_file)
+            os.makedirs(session_dir, exist_ok=True)
             
-            with open(self.session_file, 'w', encoding='utf-8') as f:
-                json.dump(sessions, f, indent=2, ensure_ascii=False)
+            # Tulis ke file sementara lalu os.replace, supaya proses lain tidak pernah membaca JSON setengah jadi
+            fd, temp_path = tempfile.mkstemp(dir=session_dir, prefix='.ba_sessions_', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(self.codec.dumps(sessions))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.session_file)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            return True
         except Exception as e:
             logger.error(f"Error saving sessions: {e}")
+            return False
+
+    def _file_signature(self):
+        """Identity of the current session file; berubah setiap kali file diganti os.replace"""
+        try:
+            stat = os.stat(self.session_file)
+            return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _save_and_count(self, sessions, changes):
+        """Save sessions and apply [(before, after)] stat contributions (caller holds _file_lock)"""
+        with self._stats_lock:
+            in_sync = self._stats is not None and self._stats_signature == self._file_signature()
+        
+        saved = self._save_sessions(sessions)
+        
+        with self._stats_lock:
+            if in_sync and saved:
+                for before, after in changes:
+                    self._stats.apply(before, after)
+                self._stats_signature = self._file_signature()
+            else:
+                # Worker lain menulis file ini; counter dibangun ulang saat dibaca
+                self._stats = None
+
+    # Storage primitives - backend lain (journal, sqlite) cukup override method di bawah ini
+    def _read_session(self, user_id):
+        """Read one session record (None if not found)"""
+        return self._load_sessions().get(str(user_id))
+
+    def _insert_session(self, user_id, session_data):
+        """Insert or replace one session record"""
+        with self._file_lock():
+            sessions = self._load_sessions()
+            before = SessionStats.contribution(sessions.get(str(user_id)))
+            sessions[str(user_id)] = session_data
+            self._save_and_count(sessions, [(before, SessionStats.contribution(session_data))])
+
+    def _mutate_session(self, user_id, mutate):
+        """Read-modify-write one session; mutate(session) changes it in place and returns changed keys"""
+        with self._file_lock():
+            sessions = self._load_sessions()
+            session = sessions.get(str(user_id))
+            if session is None:
+                return False
+            
+            before = SessionStats.contribution(session)
+            if mutate(session):
+                sessions[str(user_id)] = session
+                self._save_and_count(sessions, [(before, SessionStats.contribution(session))])
+            return True
+
+    def _remove_sessions(self, user_ids):
+        """Remove session records, returns the user IDs actually removed"""
+        with self._file_lock():
+            sessions = self._load_sessions()
+            removed = [str(user_id) for user_id in user_ids if str(user_id) in sessions]
+            changes = []
+            
+            for user_id in removed:
+                changes.append((SessionStats.contribution(sessions.pop(user_id)), None))
+            
+            if removed:
+                self._save_and_count(sessions, changes)
+            return removed
+
+    def _all_sessions(self):
+        """Read all session records as {user_id: session}"""
+        return dict(self._load_sessions())
+
+    def _set_form_section(self, user_id, section_id, section_data, updated_at):
+        """Write one form section (no write if the section content is unchanged)"""
+        return self._mutate_session(
+            user_id, _form_section_mutation(section_id, section_data, updated_at, self._record_section_write)
+        )
+
+    def _set_temp_value(self, user_id, key, value, updated_at):
+        """Write one temp_data key"""
+        return self._mutate_session(user_id, _temp_value_mutation(key, value, updated_at))
+
+    def _append_photo(self, user_id, photo_data, updated_at):
+        """Append one photo entry"""
+        return self._mutate_session(user_id, _photo_mutation(photo_data, updated_at))
+
+    def _write_access_times(self, access_times):
+        """Persist a batch of {user_id: last_accessed} in one write"""
+        with self._file_lock():
+            sessions = self._load_sessions()
+            changed = False
+            
+            for user_id, last_accessed in access_times.items():
+                session = sessions.get(user_id)
+                if session is not None:
+                    session['last_accessed'] = last_accessed
+                    sessions[user_id] = session
+                    changed = True
+            
+            if changed:
+                self._save_and_count(sessions, [])
+
+    def _expired_user_ids(self, cutoff, limit=None):
+        """User IDs whose updated_at is at or before cutoff, oldest first"""
+        cutoff = cutoff.isoformat()
+        expired = []
+        
+        with self._expiry_lock:
+            rebuild = self._expiry_pending is None and (
+                self._expiry_heap is None or time.monotonic() - self._expiry_built_at >= self.expiry_rebuild_interval
+            )
+            if rebuild:
+                # Update yang terjadi selama scan dicatat di sini, lalu diterapkan di atas index baru
+                self._expiry_pending = {}
+        
+        if rebuild:
+            self._build_expiry_index()
+        
+        with self._expiry_lock:
+            while self._expiry_heap and (limit is None or len(expired) < limit):
+                updated_at, user_id = self._expiry_heap[0]
+                if updated_at > cutoff:
+                    break
+                
+                heapq.heappop(self._expiry_heap)
+                # Entry lama dari sebelum update berikutnya dilewati
+                if self._expiry_index.get(user_id) == updated_at:
+                    del self._expiry_index[user_id]
+                    expired.append(user_id)
+        
+        return expired
+
+    def _build_expiry_index(self):
+        """Rebuild the expiry heap from the store.
+
+        Scan (decode semua session) berjalan tanpa _expiry_lock, supaya _track_expiry dari jalur
+        tulis tidak menunggu; hasilnya dipasang di bawah lock bersama update selama scan.
+        """
+        index = {}
+        
+        try:
+            for user_id, session_data in self._all_sessions().items():
+                try:
+                    # Check last update time
+                    updated_at = session_data.get('updated_at', '')
+                    datetime.fromisoformat(updated_at)
+                    index[user_id] = updated_at
+                        
+                except Exception as e:
+                    logger.warning(f"Error checking session age for user {user_id}: {e}")
+        except Exception:
+            with self._expiry_lock:
+                self._expiry_pending = None
+            raise
+        
+        with self._expiry_lock:
+            for user_id, updated_at in self._expiry_pending.items():
+                if updated_at is None:
+                    index.pop(user_id, None)
+                else:
+                    index[user_id] = updated_at
+            self._expiry_pending = None
+            
+            self._expiry_index = index
+            self._expiry_heap = [(updated_at, user_id) for user_id, updated_at in index.items()]
+            heapq.heapify(self._expiry_heap)
+            self._expiry_built_at = time.monotonic()
+
+    def _track_expiry(self, user_id, updated_at):
+        """Record a new updated_at in the expiry index (no-op until the index is built)"""
+        with self._expiry_lock:
+            user_id = str(user_id)
+            if self._expiry_pending is not None:
+                self._expiry_pending[user_id] = updated_at
+            
+            if self._expiry_heap is None:
+                return
+            
+            if updated_at is None:
+                self._expiry_index.pop(user_id, None)
+            elif self._expiry_index.get(user_id) != updated_at:
+                self._expiry_index[user_id] = updated_at
+                heapq.heappush(self._expiry_heap, (updated_at, user_id))
+
+    def _remove_expired(self, user_ids, cutoff):
+        """Remove sessions that are still expired in the store (lihat _pop_expired)"""
+        with self._file_lock():
+            sessions = self._load_sessions()
+            removed, alive = _pop_expired(sessions, user_ids, cutoff.isoformat())
+            
+            if removed:
+                self._save_and_count(sessions, [
+                    (SessionStats.contribution(session_data), None) for session_data in removed.values()
+                ])
+            return removed, alive
+
+    def _session_stats(self):
+        """Aggregate counters over all sessions"""
+        with self._stats_lock:
+            if self._stats is not None and self._stats_signature == self._file_signature():
+                return self._stats.snapshot()
+        
+        # Counter belum ada atau file ditulis worker lain: hitung ulang sekali
+        with self._file_lock():
+            sessions = self._load_sessions()
+            with self._stats_lock:
+                self._stats = SessionStats.from_sessions(sessions)
+                self._stats_signature = self._file_signature()
+                return self._stats.snapshot()
+    
+    @contextmanager
+    def unit_of_work(self, user_id):
+        """Cache session user selama satu update dan commit semua perubahan sekali di akhir"""
+        unit = SessionUnitOfWork(self, user_id)
+        token = _current_unit.set(unit)
+        try:
+            yield unit
+        finally:
+            _current_unit.reset(token)
+            try:
+                unit.commit()
+            except Exception as e:
+                logger.error(f"Error committing session for user {user_id}: {e}")
+
+    def _unit_for(self, user_id):
+        """Active unit of work for this user, if any"""
+        unit = _current_unit.get()
+        if unit is not None and unit.service is self and unit.user_id == str(user_id):
+            return unit
+        return None
+
+    def _read(self, user_id):
+        unit = self._unit_for(user_id)
+        return unit.read() if unit is not None else self._read_session(user_id)
+
+    def _mutate(self, user_id, mutate):
+        unit = self._unit_for(user_id)
+        return unit.mutate(mutate) if unit is not None else self._mutate_session(user_id, mutate)
     
     def create_session(self, user_id):
         """Create new session for user"""
         try:
-            sessions = self._load_sessions()
-            
             session_data = {
                 'user_id': user_id,
                 'form_data': {},  # Will store data for each section
@@ -53,9 +608,14 @@ class SessionBAService:
                 'status': 'active'
             }
             
-            sessions[str(user_id)] = session_data
-            self._save_sessions(sessions)
+            unit = self._unit_for(user_id)
+            if unit is not None:
+                unit.put(session_data)
+            else:
+                self._insert_session(user_id, session_data)
             
+            self._track_expiry(user_id, session_data['updated_at'])
+            self._maybe_flush_access_times()
             logger.info(f"Session created for user {user_id}")
             return session_data
             
@@ -93,21 +653,8 @@ class SessionBAService:
             if not session:
                 return False
                 
-            form_data = session.get('form_data', {})
-            tanda_tangan = form_data.get('tanda_tangan', {})
-            cleaned_files = 0
-            
             # Clean up signature files
-            for field_name, file_path in tanda_tangan.items():
-                if file_path and file_path.startswith('SIGNATURE_IMAGE:'):
-                    actual_path = file_path.replace('SIGNATURE_IMAGE:', '')
-                    try:
-                        if os.path.exists(actual_path):
-                            os.remove(actual_path)
-                            cleaned_files += 1
-                            logger.info(f"🗑️ Cleaned up signature file: {actual_path}")
-                    except Exception as e:
-                        logger.warning(f"⚠️ Could not clean up signature file {actual_path}: {e}")
+            cleaned_files = _remove_signature_files(session)
             
             # Clear signature data from session
             if cleaned_files > 0:
@@ -121,16 +668,16 @@ class SessionBAService:
             return False
     
     def get_session(self, user_id):
-        """Get current session for user"""
+        """Get current session for user (read-only, tidak menulis ke disk)"""
         try:
-            sessions = self._load_sessions()
-            session = sessions.get(str(user_id))
+            session = self._read(user_id)
             
             if session:
-                # Update last access time
-                session['last_accessed'] = datetime.now().isoformat()
-                sessions[str(user_id)] = session
-                self._save_sessions(sessions)
+                # Update last access time (di memory, ditulis oleh flush_access_times)
+                last_accessed = datetime.now().isoformat()
+                session['last_accessed'] = last_accessed
+                with self._access_lock:
+                    self._access_times[str(user_id)] = last_accessed
             
             return session
             
@@ -138,21 +685,46 @@ class SessionBAService:
             logger.error(f"Error getting session for user {user_id}: {e}")
             return None
     
+    def flush_access_times(self):
+        """Write pending last_accessed timestamps in one batch"""
+        with self._access_lock:
+            pending, self._access_times = self._access_times, {}
+            self._last_access_flush = time.monotonic()
+        
+        if not pending:
+            return 0
+        
+        try:
+            self._write_access_times(pending)
+            logger.debug(f"Flushed last_accessed for {len(pending)} sessions")
+            return len(pending)
+            
+        except Exception as e:
+            logger.error(f"Error flushing session access times: {e}")
+            return 0
+    
+    def _maybe_flush_access_times(self):
+        """Flush access times if the flush interval has passed (dipanggil dari jalur tulis)"""
+        if time.monotonic() - self._last_access_flush >= self.access_flush_interval:
+            self.flush_access_times()
+    
     def update_session(self, user_id, update_data):
         """Update session data"""
         try:
-            sessions = self._load_sessions()
+            updated_at = datetime.now().isoformat()
             
-            if str(user_id) in sessions:
+            def apply(session):
                 # Update specific fields
                 for key, value in update_data.items():
-                    sessions[str(user_id)][key] = value
+                    session[key] = value
                 
                 # Update timestamp
-                sessions[str(user_id)]['updated_at'] = datetime.now().isoformat()
-                
-                self._save_sessions(sessions)
-                
+                session['updated_at'] = updated_at
+                return list(update_data.keys()) + ['updated_at']
+            
+            self._maybe_flush_access_times()
+            if self._mutate(user_id, apply):
+                self._track_expiry(user_id, updated_at)
                 logger.info(f"Session updated for user {user_id}")
                 return True
             else:
@@ -166,19 +738,21 @@ class SessionBAService:
     def update_form_section(self, user_id, section_id, section_data):
         """Update specific form section data"""
         try:
-            sessions = self._load_sessions()
+            updated_at = datetime.now().isoformat()
+            unit = self._unit_for(user_id)
             
-            if str(user_id) in sessions:
-                # Initialize form_data if not exists
-                if 'form_data' not in sessions[str(user_id)]:
-                    sessions[str(user_id)]['form_data'] = {}
-                
-                # Update section data
-                sessions[str(user_id)]['form_data'][section_id] = section_data
-                sessions[str(user_id)]['updated_at'] = datetime.now().isoformat()
-                
-                self._save_sessions(sessions)
-                
+            self._maybe_flush_access_times()
+            if unit is not None:
+                # Metric section write hanya dihitung sekali, bukan lagi saat commit
+                found = unit.mutate(
+                    _form_section_mutation(section_id, section_data, updated_at, self._record_section_write),
+                    replay=_form_section_mutation(section_id, section_data, updated_at)
+                )
+            else:
+                found = self._set_form_section(user_id, section_id, section_data, updated_at)
+            
+            if found:
+                self._track_expiry(user_id, updated_at)
                 logger.info(f"Section '{section_id}' updated for user {user_id}")
                 return True
             else:
@@ -204,25 +778,25 @@ class SessionBAService:
     def add_photo(self, user_id, photo_info):
         """Add photo info to session"""
         try:
-            sessions = self._load_sessions()
+            # Add photo info
+            photo_data = {
+                'filename': photo_info.get('filename'),
+                'file_id': photo_info.get('file_id'),
+                'description': photo_info.get('description', ''),
+                'uploaded_at': datetime.now().isoformat()
+            }
             
-            if str(user_id) in sessions:
-                if 'photos' not in sessions[str(user_id)]:
-                    sessions[str(user_id)]['photos'] = []
-                
-                # Add photo info
-                photo_data = {
-                    'filename': photo_info.get('filename'),
-                    'file_id': photo_info.get('file_id'),
-                    'description': photo_info.get('description', ''),
-                    'uploaded_at': datetime.now().isoformat()
-                }
-                
-                sessions[str(user_id)]['photos'].append(photo_data)
-                sessions[str(user_id)]['updated_at'] = datetime.now().isoformat()
-                
-                self._save_sessions(sessions)
-                
+            updated_at = datetime.now().isoformat()
+            unit = self._unit_for(user_id)
+            
+            self._maybe_flush_access_times()
+            if unit is not None:
+                found = unit.mutate(_photo_mutation(photo_data, updated_at))
+            else:
+                found = self._append_photo(user_id, photo_data, updated_at)
+            
+            if found:
+                self._track_expiry(user_id, updated_at)
                 logger.info(f"Photo added to session for user {user_id}")
                 return True
             else:
@@ -257,19 +831,18 @@ class SessionBAService:
     def set_temp_data(self, user_id, key, value):
         """Set temporary data during input process"""
         try:
-            sessions = self._load_sessions()
+            updated_at = datetime.now().isoformat()
+            unit = self._unit_for(user_id)
             
-            if str(user_id) in sessions:
-                if 'temp_data' not in sessions[str(user_id)]:
-                    sessions[str(user_id)]['temp_data'] = {}
-                
-                sessions[str(user_id)]['temp_data'][key] = value
-                sessions[str(user_id)]['updated_at'] = datetime.now().isoformat()
-                
-                self._save_sessions(sessions)
-                return True
+            self._maybe_flush_access_times()
+            if unit is not None:
+                found = unit.mutate(_temp_value_mutation(key, value, updated_at))
+            else:
+                found = self._set_temp_value(user_id, key, value, updated_at)
             
-            return False
+            if found:
+                self._track_expiry(user_id, updated_at)
+            return found
             
         except Exception as e:
             logger.error(f"Error setting temp data for user {user_id}: {e}")
@@ -290,21 +863,23 @@ class SessionBAService:
     def clear_temp_data(self, user_id, key=None):
         """Clear temporary data (specific key or all)"""
         try:
-            sessions = self._load_sessions()
+            updated_at = datetime.now().isoformat()
             
-            if str(user_id) in sessions:
+            def apply(session):
                 if key:
                     # Clear specific key
-                    if 'temp_data' in sessions[str(user_id)] and key in sessions[str(user_id)]['temp_data']:
-                        del sessions[str(user_id)]['temp_data'][key]
+                    if 'temp_data' in session and key in session['temp_data']:
+                        del session['temp_data'][key]
                 else:
                     # Clear all temp data
-                    sessions[str(user_id)]['temp_data'] = {}
+                    session['temp_data'] = {}
                 
-                sessions[str(user_id)]['updated_at'] = datetime.now().isoformat()
-                self._save_sessions(sessions)
-                return True
+                session['updated_at'] = updated_at
+                return ['temp_data', 'updated_at']
             
+            if self._mutate(user_id, apply):
+                self._track_expiry(user_id, updated_at)
+                return True
             return False
             
         except Exception as e:
@@ -355,15 +930,15 @@ class SessionBAService:
     def end_session(self, user_id):
         """End current session"""
         try:
-            sessions = self._load_sessions()
+            completed_at = datetime.now().isoformat()
             
-            if str(user_id) in sessions:
+            def apply(session):
                 # Mark session as completed instead of deleting
-                sessions[str(user_id)]['status'] = 'completed'
-                sessions[str(user_id)]['completed_at'] = datetime.now().isoformat()
-                
-                self._save_sessions(sessions)
-                
+                session['status'] = 'completed'
+                session['completed_at'] = completed_at
+                return ['status', 'completed_at']
+            
+            if self._mutate(user_id, apply):
                 logger.info(f"Session ended for user {user_id}")
                 return True
             
@@ -376,12 +951,14 @@ class SessionBAService:
     def delete_session(self, user_id):
         """Delete session completely"""
         try:
-            sessions = self._load_sessions()
+            with self._access_lock:
+                self._access_times.pop(str(user_id), None)
             
-            if str(user_id) in sessions:
-                del sessions[str(user_id)]
-                self._save_sessions(sessions)
-                
+            unit = self._unit_for(user_id)
+            deleted = unit.delete() if unit is not None else bool(self._remove_sessions([user_id]))
+            
+            if deleted:
+                self._track_expiry(user_id, None)
                 logger.info(f"Session deleted for user {user_id}")
                 return True
             
@@ -391,72 +968,108 @@ class SessionBAService:
             logger.error(f"Error deleting session for user {user_id}: {e}")
             return False
     
-    def cleanup_old_sessions(self, days_old=7):
-        """Clean up old sessions older than specified days"""
+    def sweep_expired_sessions(self, days_old=7, batch_size=50, on_expired=None):
+        """Evict at most batch_size expired sessions (oldest first), returns how many were removed
+
+        ``on_expired(user_id, session)`` dipanggil untuk setiap session yang dihapus.
+        """
         try:
-            sessions = self._load_sessions()
-            current_time = datetime.now()
+            # Sama dengan (now - updated_at).days > days_old
+            cutoff = datetime.now() - timedelta(days=days_old + 1)
+            candidates = self._expired_user_ids(cutoff, limit=batch_size)
+            if not candidates:
+                return 0
             
-            sessions_to_delete = []
+            removed, alive = self._remove_expired(candidates, cutoff)
             
-            for user_id, session_data in sessions.items():
-                try:
-                    # Check last update time
-                    updated_at = datetime.fromisoformat(session_data.get('updated_at', ''))
-                    days_diff = (current_time - updated_at).days
-                    
-                    if days_diff > days_old:
-                        sessions_to_delete.append(user_id)
-                        
-                except Exception as e:
-                    logger.warning(f"Error checking session age for user {user_id}: {e}")
+            # Session yang di-update worker lain sejak diindeks dimasukkan lagi ke index
+            for user_id, updated_at in alive.items():
+                self._track_expiry(user_id, updated_at)
             
-            # Delete old sessions
-            for user_id in sessions_to_delete:
-                del sessions[user_id]
+            for user_id, session_data in removed.items():
+                with self._access_lock:
+                    self._access_times.pop(user_id, None)
+                _remove_signature_files(session_data)
+                if on_expired is not None:
+                    on_expired(user_id, session_data)
                 logger.info(f"Cleaned up old session for user {user_id}")
             
-            if sessions_to_delete:
-                self._save_sessions(sessions)
-                logger.info(f"Cleaned up {len(sessions_to_delete)} old sessions")
+            return len(removed)
+            
+        except Exception as e:
+            logger.error(f"Error sweeping expired sessions: {e}")
+            return 0
+    
+    def cleanup_old_sessions(self, days_old=7):
+        """Clean up old sessions older than specified days"""
+        try:
+            total = 0
+            while True:
+                deleted = self.sweep_expired_sessions(days_old)
+                total += deleted
+                if not deleted:
+                    break
+            
+            if total:
+                logger.info(f"Cleaned up {total} old sessions")
             
-            return len(sessions_to_delete)
+            return total
             
         except Exception as e:
             logger.error(f"Error cleaning up old sessions: {e}")
             return 0
     
+    def _record_section_write(self, written):
+        with self._section_writes_lock:
+            self._section_writes['written' if written else 'skipped'] += 1
+    
+    def get_section_write_stats(self):
+        """How many section writes were done and how many were skipped as unchanged"""
+        with self._section_writes_lock:
+            return {
+                'section_writes': self._section_writes['written'],
+                'section_writes_skipped': self._section_writes['skipped']
+            }
+    
     def get_all_sessions_stats(self):
         """Get statistics about all sessions"""
         try:
-            sessions = self._load_sessions()
-            
-            stats = {
-                'total_sessions': len(sessions),
-                'active_sessions': 0,
-                'completed_sessions': 0,
-                'total_form_sections': 0,
-                'total_photos': 0
-            }
-            
-            for session_data in sessions.values():
-                status = session_data.get('status', 'active')
-                
-                if status == 'active':
-                    stats['active_sessions'] += 1
-                elif status == 'completed':
-                    stats['completed_sessions'] += 1
-                
-                # Count form sections
-                form_data = session_data.get('form_data', {})
-                stats['total_form_sections'] += len(form_data)
-                
-                # Count photos
-                photos = session_data.get('photos', [])
-                stats['total_photos'] += len(photos)
-            
-            return stats
+            return self._session_stats()
             
         except Exception as e:
             logger.error(f"Error getting sessions stats: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+def create_session_service(backend=None):
+    """Create session service sesuai SESSION_BACKEND (json | journal | sqlite)
+
+    Deploy dengan beberapa worker gunicorn (WEB_CONCURRENCY > 1) sebaiknya memakai sqlite:
+    json aman antar worker tapi setiap tulis memegang lock file dan menulis ulang seluruh file,
+    jadi throughput turun saat worker ditambah; journal hanya aman untuk satu worker.
+    """
+    backend = (backend or os.environ.get('SESSION_BACKEND', 'json')).lower()
+    try:
+        workers = int(os.environ.get('WEB_CONCURRENCY') or '1')
+    except ValueError:
+        # Hanya dipakai untuk warning, nilai yang salah tidak boleh menggagalkan startup
+        logger.warning(f"⚠️ Invalid WEB_CONCURRENCY '{os.environ.get('WEB_CONCURRENCY')}', assuming 1 worker")
+        workers = 1
+    
+    if backend == 'journal':
+        from services.session_journal_service import JournalSessionBAService
+        flush_interval = float(os.environ.get('SESSION_JOURNAL_FLUSH_INTERVAL', '2'))
+        if workers > 1:
+            logger.warning("⚠️ SESSION_BACKEND=journal hanya aman untuk satu worker, gunakan sqlite")
+        return JournalSessionBAService(flush_interval=flush_interval)
+    
+    if backend == 'sqlite':
+        from services.session_sqlite_service import SQLiteSessionBAService
+        return SQLiteSessionBAService(os.environ.get('SESSION_DB_PATH'))
+    
+    if backend != 'json':
+        logger.warning(f"⚠️ Unknown SESSION_BACKEND '{backend}', using json")
+    if workers > 1:
+        logger.warning(f"⚠️ SESSION_BACKEND=json dengan {workers} worker: semua tulis antri di satu lock file "
+                       "dan throughput turun saat worker ditambah, gunakan SESSION_BACKEND=sqlite")
+    return SessionBAService()
@@ -0,0 +1,144 @@
+# services/session_codec.py - Encoding ringkas untuk file session
+import json
+from collections.abc import MutableMapping
+
+FORMAT_NAME = 'ba-sessions'
+FORMAT_VERSION = 2
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+# Key session yang selalu ada, ditambah key yang ditulis bot_ba.py dan photo_handler.py
+SESSION_KEYS = [
+    'user_id', 'form_data', 'current_section', 'temp_data', 'photos', 'evidence_folder_id',
+    'created_at', 'updated_at', 'status', 'last_accessed', 'completed_at', 'form_type',
+    'report_folder_id', 'ba_form_folder_id', 'excel_generated', 'provisioned_folders', 'name',
+    'filename', 'file_id', 'description', 'uploaded_at', 'drive_identity',
+]
+
+
+class SessionCodec:
+    """Encode session dengan key table dari field registry BeritaAcaraConfig.
+
+    Dict di-encode sebagai list datar ``[key, value, key, value, ...]`` dengan key berupa
+    nomor di table (key di luar table tetap string), list asli dibungkus ``{"l": [...]}``.
+    Format file (versi 2), dua baris JSON::
+
+        {"format": "ba-sessions", "v": 2, "keys": [...]}
+        {user_id: encoded session, ...}
+
+    Table key ikut disimpan di header, jadi file lama tetap bisa dibaca walau urutan
+    field di BeritaAcaraConfig berubah. File versi 1 (JSON biasa {user_id: session})
+    tetap bisa di-load.
+    """
+
+    def __init__(self, keys):
+        self.keys = list(dict.fromkeys(keys))
+        self._key_ids = {key: index for index, key in enumerate(self.keys)}
+
+    @classmethod
+    def from_config(cls):
+        """Key table dari session keys + field registry BeritaAcaraConfig"""
+        from config.ba_config import BeritaAcaraConfig
+        return cls(SESSION_KEYS + BeritaAcaraConfig().field_registry())
+
+    def encode_session(self, value):
+        """Session dict -> compact JSON-able structure"""
+        if isinstance(value, dict):
+            encoded = []
+            for key, item in value.items():
+                key = str(key)
+                encoded.append(self._key_ids.get(key, key))
+                encoded.append(self.encode_session(item))
+            return encoded
+        if isinstance(value, list):
+            return {'l': [self.encode_session(item) for item in value]}
+        return value
+
+    def decode_session(self, value, keys=None):
+        """Inverse of encode_session (keys: table from the file header)"""
+        keys = self.keys if keys is None else keys
+        if isinstance(value, list):
+            return {
+                keys[key] if isinstance(key, int) else key: self.decode_session(item, keys)
+                for key, item in zip(value[::2], value[1::2])
+            }
+        if isinstance(value, dict):
+            return [self.decode_session(item, keys) for item in value['l']]
+        return value
+
+    def dumps(self, sessions):
+        """Serialize {user_id: session} in the compact format"""
+        header = {'format': FORMAT_NAME, 'v': FORMAT_VERSION, 'keys': self.keys}
+        if isinstance(sessions, EncodedSessions) and sessions.codec is self:
+            body = sessions.encoded
+        else:
+            body = {user_id: self.encode_session(session) for user_id, session in sessions.items()}
+        # Body di-encode per session (hasilnya sama persis dengan satu json.dumps), supaya
+        # thread lain tetap dapat GIL selama snapshot besar ditulis
+        encode = _ENCODER.encode
+        return '\n'.join([
+            encode(header),
+            '{' + ','.join(f'{encode(user_id)}:{encode(session)}' for user_id, session in body.items()) + '}',
+        ])
+
+    def loads(self, text):
+        """Parse a session file of any known version into EncodedSessions"""
+        sessions = EncodedSessions(self)
+        if not text.strip():
+            return sessions
+
+        # File versi 1: JSON biasa {user_id: session}
+        if not text.startswith('{"format"'):
+            for user_id, session in json.loads(text).items():
+                sessions[user_id] = session
+            return sessions
+
+        header_line, _, body = text.partition('\n')
+        header = json.loads(header_line)
+        if header.get('format') != FORMAT_NAME or header.get('v') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported session file version: {header.get('v')}")
+
+        encoded = json.loads(body)
+        if header['keys'] != self.keys:
+            # Table di file berbeda (config berubah): encode ulang dengan table sekarang
+            for user_id, session in encoded.items():
+                encoded[user_id] = self.encode_session(self.decode_session(session, header['keys']))
+
+        sessions.encoded = encoded
+        return sessions
+
+
+class EncodedSessions(MutableMapping):
+    """{user_id: session} yang disimpan ter-encode; session hanya di-decode saat diakses.
+
+    Setiap akses mengembalikan salinan baru, jadi perubahan harus ditulis kembali
+    dengan ``sessions[user_id] = session``.
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.encoded = {}
+
+    def __getitem__(self, user_id):
+        return self.codec.decode_session(self.encoded[user_id])
+
+    def __setitem__(self, user_id, session):
+        self.encoded[user_id] = self.codec.encode_session(session)
+
+    def __delitem__(self, user_id):
+        del self.encoded[user_id]
+
+    def __contains__(self, user_id):
+        return user_id in self.encoded
+
+    def __iter__(self):
+        return iter(self.encoded)
+
+    def __len__(self):
+        return len(self.encoded)
+
+    def copy(self):
+        """Snapshot murah: nilai ter-encode tidak pernah diubah di tempat, cukup salin dict-nya"""
+        sessions = EncodedSessions(self.codec)
+        sessions.encoded = dict(self.encoded)
+        return sessions
@@ -0,0 +1,248 @@
+# services/session_journal_service.py - Session in-memory dengan write-behind journal
+import json
+import os
+import atexit
+import logging
+import tempfile
+import threading
+
+from services.session_ba_service import SessionBAService, SessionStats, _pop_expired
+
+logger = logging.getLogger(__name__)
+
+class JournalSessionBAService(SessionBAService):
+    """SessionBAService yang menyimpan session di memory dan menulis perubahan ke journal append-only.
+
+    Snapshot (``ba_user_sessions.json``) hanya ditulis ulang saat compaction, sehingga biaya
+    per update tidak bertambah seiring jumlah user. Journal di-flush per batch setiap
+    ``flush_interval`` detik, jadi crash paling banyak kehilangan satu interval flush.
+    Mode ini hanya aman untuk satu proses (satu worker gunicorn).
+    """
+
+    def __init__(self, session_file=None, flush_interval=2.0, compact_threshold=1000):
+        super().__init__(session_file)
+        self.journal_file = f"{self.session_file}.journal"
+        self.flush_interval = flush_interval
+        self.compact_threshold = compact_threshold
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()  # Satu flush/compaction pada satu waktu; disk I/O di luar _lock
+        self._pending = []  # Journal records yang belum di-flush
+        self._journal_records = 0  # Jumlah record di journal sejak compaction terakhir
+        self._sessions = self._load_sessions()  # EncodedSessions: ringkas di memory, di-decode per akses
+        self._replay_journal()
+        self._stats = SessionStats.from_sessions(self._sessions)
+
+        self._stop_event = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='session-journal-flusher', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+        logger.info(f"Session journal location: {self.journal_file} ({len(self._sessions)} sessions loaded)")
+
+    def _replay_journal(self):
+        """Apply journal records on top of the loaded snapshot"""
+        if not os.path.exists(self.journal_file):
+            return
+
+        replayed = 0
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Baris terakhir bisa terpotong saat crash, abaikan
+                    logger.warning("⚠️ Skipping torn journal record")
+                    continue
+                self._apply_record(record)
+                replayed += 1
+
+        self._journal_records = replayed
+        logger.info(f"Replayed {replayed} session journal records")
+
+    def _apply_record(self, record):
+        """Apply one journal record to the in-memory sessions"""
+        op = record.get('op')
+        user_id = record.get('user_id')
+
+        if op == 'put':
+            self._sessions[user_id] = record['session']
+        elif op == 'set':
+            session = self._sessions.get(user_id)
+            if session is not None:
+                session.update(record['fields'])
+                for section_id, section_data in record.get('sections', {}).items():
+                    session.setdefault('form_data', {})[section_id] = section_data
+                self._sessions[user_id] = session
+        elif op == 'del':
+            self._sessions.pop(user_id, None)
+
+    def _append(self, record):
+        """Queue a journal record for the next flush"""
+        self._pending.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+
+    def _read_session(self, user_id):
+        with self._lock:
+            # Decode selalu menghasilkan salinan baru
+            return self._sessions.get(str(user_id))
+
+    def _insert_session(self, user_id, session_data):
+        with self._lock:
+            before = SessionStats.contribution(self._sessions.get(str(user_id)))
+            self._sessions[str(user_id)] = session_data
+            self._stats.apply(before, SessionStats.contribution(session_data))
+            self._append({'op': 'put', 'user_id': str(user_id), 'session': session_data})
+
+    def _mutate_session(self, user_id, mutate):
+        with self._lock:
+            session = self._sessions.get(str(user_id))
+            if session is None:
+                return False
+
+            before = SessionStats.contribution(session)
+            changed = mutate(session)
+            if changed:
+                self._sessions[str(user_id)] = session
+                self._stats.apply(before, SessionStats.contribution(session))
+                record = {'op': 'set', 'user_id': str(user_id)}
+                record['fields'] = {key: session.get(key) for key in changed if not isinstance(key, tuple)}
+                # Section yang berubah dicatat sendiri-sendiri, bukan seluruh form_data
+                if 'form_data' not in record['fields']:
+                    sections = {key[1]: session['form_data'][key[1]] for key in changed if isinstance(key, tuple)}
+                    if sections:
+                        record['sections'] = sections
+                self._append(record)
+            return True
+
+    def _remove_sessions(self, user_ids):
+        with self._lock:
+            removed = []
+            for user_id in user_ids:
+                session = self._sessions.pop(str(user_id), None)
+                if session is not None:
+                    self._stats.apply(SessionStats.contribution(session), None)
+                    self._append({'op': 'del', 'user_id': str(user_id)})
+                    removed.append(str(user_id))
+            return removed
+
+    def _remove_expired(self, user_ids, cutoff):
+        with self._lock:
+            removed, alive = _pop_expired(self._sessions, user_ids, cutoff.isoformat())
+            for user_id, session in removed.items():
+                self._stats.apply(SessionStats.contribution(session), None)
+                self._append({'op': 'del', 'user_id': user_id})
+            return removed, alive
+
+    def _write_access_times(self, access_times):
+        with self._lock:
+            for user_id, last_accessed in access_times.items():
+                session = self._sessions.get(user_id)
+                if session is not None:
+                    session['last_accessed'] = last_accessed
+                    self._sessions[user_id] = session
+                    self._append({'op': 'set', 'user_id': user_id, 'fields': {'last_accessed': last_accessed}})
+
+    def _all_sessions(self):
+        with self._lock:
+            return dict(self._sessions)
+
+    def _session_stats(self):
+        with self._lock:
+            return self._stats.snapshot()
+
+    def flush(self):
+        """Append pending records to the journal and fsync"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, []
+
+            # Tulis dan fsync di luar _lock supaya get/update tidak menunggu disk
+            try:
+                self._write_journal(batch)
+            except Exception as e:
+                # Kembalikan ke antrian supaya dicoba lagi di flush berikutnya
+                with self._lock:
+                    self._pending = batch + self._pending
+                logger.error(f"Error flushing session journal: {e}")
+                return 0
+
+            self._journal_records += len(batch)
+
+            if self._journal_records >= self.compact_threshold:
+                self._compact()
+
+            return len(batch)
+
+    def _write_journal(self, batch):
+        os.makedirs(os.path.dirname(self.journal_file), exist_ok=True)
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(batch) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self):
+        """Rebuild the snapshot from memory and truncate the journal"""
+        with self._flush_lock:
+            return self._compact()
+
+    def _compact(self):
+        """compact() body (caller holds _flush_lock)"""
+        try:
+            # Snapshot diambil di bawah _lock; dump dan fsync berjalan di luar lock
+            with self._lock:
+                batch, self._pending = self._pending, []
+                sessions = self._sessions.copy()
+
+            # Record yang masih di antrian ditulis dulu, jadi journal tetap lengkap kalau snapshot gagal
+            if batch:
+                try:
+                    self._write_journal(batch)
+                except Exception:
+                    with self._lock:
+                        self._pending = batch + self._pending
+                    raise
+                self._journal_records += len(batch)
+
+            # Tulis snapshot secara atomic lalu kosongkan journal. Record yang masuk setelah
+            # snapshot diambil masih di _pending (flush menunggu _flush_lock), dan record
+            # journal bersifat idempotent, jadi crash di antara dua langkah ini aman.
+            session_dir = os.path.dirname(self.session_file)
+            os.makedirs(session_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=session_dir, prefix='.ba_sessions_', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(self.codec.dumps(sessions))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.session_file)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            open(self.journal_file, 'w').close()
+            self._journal_records = 0
+
+            logger.info(f"Session snapshot compacted ({len(sessions)} sessions)")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error compacting session snapshot: {e}")
+            return False
+
+    def _flush_loop(self):
+        """Background flusher"""
+        while not self._stop_event.wait(self.flush_interval):
+            self._maybe_flush_access_times()
+            self.flush()
+
+    def close(self):
+        """Stop the flusher and write everything to disk"""
+        self._stop_event.set()
+        self.flush_access_times()
+        self.flush()
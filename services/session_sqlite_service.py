@@ -0,0 +1,358 @@
+# services/session_sqlite_service.py - Session Management berbasis SQLite
+import json
+import os
+import logging
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from services.session_ba_service import SessionBAService, _top_level_keys
+
+logger = logging.getLogger(__name__)
+
+# Kolom khusus; key session lainnya (form_type, folder IDs, dll) disimpan di kolom 'extra'
+JSON_COLUMNS = {
+    'form_data': {},
+    'temp_data': {},
+    'photos': [],
+}
+TEXT_COLUMNS = ('status', 'created_at', 'updated_at')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'active',
+    created_at TEXT,
+    updated_at TEXT,
+    form_data TEXT NOT NULL DEFAULT '{}',
+    temp_data TEXT NOT NULL DEFAULT '{}',
+    photos TEXT NOT NULL DEFAULT '[]',
+    extra TEXT NOT NULL DEFAULT '{}',
+    section_count INTEGER NOT NULL DEFAULT 0,
+    photo_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions(status, section_count, photo_count);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at);
+
+-- Counter statistik satu row, di-update oleh trigger sehingga get_all_sessions_stats O(1)
+CREATE TABLE IF NOT EXISTS session_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total_sessions INTEGER NOT NULL,
+    active_sessions INTEGER NOT NULL,
+    completed_sessions INTEGER NOT NULL,
+    total_form_sections INTEGER NOT NULL,
+    total_photos INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO session_stats
+SELECT 1, COUNT(*), COALESCE(SUM(status = 'active'), 0), COALESCE(SUM(status = 'completed'), 0),
+       COALESCE(SUM(section_count), 0), COALESCE(SUM(photo_count), 0)
+FROM sessions;
+
+CREATE TRIGGER IF NOT EXISTS trg_sessions_stats_insert AFTER INSERT ON sessions BEGIN
+    UPDATE session_stats SET
+        total_sessions = total_sessions + 1,
+        active_sessions = active_sessions + (NEW.status = 'active'),
+        completed_sessions = completed_sessions + (NEW.status = 'completed'),
+        total_form_sections = total_form_sections + NEW.section_count,
+        total_photos = total_photos + NEW.photo_count
+    WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_sessions_stats_delete AFTER DELETE ON sessions BEGIN
+    UPDATE session_stats SET
+        total_sessions = total_sessions - 1,
+        active_sessions = active_sessions - (OLD.status = 'active'),
+        completed_sessions = completed_sessions - (OLD.status = 'completed'),
+        total_form_sections = total_form_sections - OLD.section_count,
+        total_photos = total_photos - OLD.photo_count
+    WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_sessions_stats_update AFTER UPDATE OF status, section_count, photo_count ON sessions BEGIN
+    UPDATE session_stats SET
+        active_sessions = active_sessions - (OLD.status = 'active') + (NEW.status = 'active'),
+        completed_sessions = completed_sessions - (OLD.status = 'completed') + (NEW.status = 'completed'),
+        total_form_sections = total_form_sections - OLD.section_count + NEW.section_count,
+        total_photos = total_photos - OLD.photo_count + NEW.photo_count
+    WHERE id = 1;
+END;
+"""
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _dumps_section(section_data):
+    """Section form dengan key terurut, seperti _section_digest; isi yang sama selalu teks yang sama"""
+    return json.dumps(section_data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+def _dumps_form_data(form_data):
+    """form_data dengan setiap section ditulis lewat _dumps_section (urutan section tetap)"""
+    return '{' + ','.join(f'{_dumps(str(section_id))}:{_dumps_section(section_data)}'
+                          for section_id, section_data in form_data.items()) + '}'
+
+
+def _json_path(key):
+    """JSON path untuk satu key object, None jika key tidak bisa di-quote dengan aman"""
+    key = str(key)
+    if '"' in key or '\\' in key:
+        return None
+    return f'$."{key}"'
+
+
+class SQLiteSessionBAService(SessionBAService):
+    """SessionBAService dengan satu row per user di SQLite (WAL mode).
+
+    form_data, temp_data dan photos disimpan di kolom terpisah sehingga
+    update_form_section, set_temp_data dan add_photo cukup satu UPDATE pada satu row.
+    """
+
+    def __init__(self, db_path=None):
+        if not db_path:
+            db_path = os.path.join(tempfile.gettempdir(), 'ba_user_sessions.db')
+        self.db_path = db_path
+        self._local = threading.local()
+
+        # File JSON lama dipakai untuk migrasi pertama kali
+        super().__init__()
+
+        # Satu transaksi, supaya counter awal dan trigger konsisten walau beberapa worker start bersamaan
+        self._connection().executescript(f"BEGIN IMMEDIATE;{SCHEMA}COMMIT;")
+
+        self._import_legacy_sessions()
+        logger.info(f"Session database location: {self.db_path}")
+
+    def _connection(self):
+        """One connection per thread (dibuka ulang setelah fork worker gunicorn)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # WAL: reader tidak pernah memblokir writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self, immediate=False):
+        """Explicit transaction; IMMEDIATE takes the write lock up front for read-modify-write"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _import_legacy_sessions(self):
+        """Copy sessions from the JSON file into an empty database"""
+        if not os.path.exists(self.session_file):
+            return
+
+        with self._transaction(immediate=True) as conn:
+            if conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone():
+                return
+
+            sessions = self._load_sessions()
+            for user_id, session_data in sessions.items():
+                self._upsert_row(conn, user_id, session_data)
+
+        if sessions:
+            logger.info(f"Imported {len(sessions)} sessions from {self.session_file}")
+
+    def _row_to_session(self, row):
+        """Rebuild the session dict from a row"""
+        session = json.loads(row['extra'])
+        for column in TEXT_COLUMNS:
+            if row[column] is not None:
+                session[column] = row[column]
+        for column in JSON_COLUMNS:
+            session[column] = json.loads(row[column])
+        return session
+
+    def _session_to_columns(self, session_data):
+        """Split a session dict into column values"""
+        columns = {column: session_data.get(column) for column in TEXT_COLUMNS}
+        columns['status'] = columns['status'] or 'active'
+        for column, default in JSON_COLUMNS.items():
+            columns[column] = _dumps(session_data.get(column) or default)
+        columns['form_data'] = _dumps_form_data(session_data.get('form_data') or {})
+        columns['extra'] = _dumps({
+            key: value for key, value in session_data.items()
+            if key not in JSON_COLUMNS and key not in TEXT_COLUMNS
+        })
+        columns['section_count'] = len(session_data.get('form_data') or {})
+        columns['photo_count'] = len(session_data.get('photos') or [])
+        return columns
+
+    def _upsert_row(self, conn, user_id, session_data):
+        columns = self._session_to_columns(session_data)
+        names = ', '.join(columns)
+        placeholders = ', '.join('?' for _ in columns)
+        # ON CONFLICT DO UPDATE (bukan REPLACE) supaya trigger statistik update ikut jalan
+        updates = ', '.join(f"{name} = excluded.{name}" for name in columns)
+        conn.execute(
+            f"INSERT INTO sessions (user_id, {names}) VALUES (?, {placeholders}) "
+            f"ON CONFLICT(user_id) DO UPDATE SET {updates}",
+            [str(user_id), *columns.values()]
+        )
+
+    def _read_session(self, user_id):
+        row = self._connection().execute(
+            "SELECT * FROM sessions WHERE user_id = ?", (str(user_id),)
+        ).fetchone()
+        return self._row_to_session(row) if row else None
+
+    def _insert_session(self, user_id, session_data):
+        with self._transaction(immediate=True) as conn:
+            self._upsert_row(conn, user_id, session_data)
+
+    def _mutate_session(self, user_id, mutate):
+        with self._transaction(immediate=True) as conn:
+            row = conn.execute(
+                "SELECT * FROM sessions WHERE user_id = ?", (str(user_id),)
+            ).fetchone()
+            if row is None:
+                return False
+
+            session = self._row_to_session(row)
+            changed = mutate(session)
+            if not changed:
+                return True
+            changed = _top_level_keys(changed)
+
+            # Hanya kolom yang berubah yang ditulis ulang
+            columns = self._session_to_columns(session)
+            updates = {}
+            for key in changed:
+                if key in JSON_COLUMNS or key in TEXT_COLUMNS:
+                    updates[key] = columns[key]
+                else:
+                    updates['extra'] = columns['extra']
+                if key == 'form_data':
+                    updates['section_count'] = columns['section_count']
+                elif key == 'photos':
+                    updates['photo_count'] = columns['photo_count']
+
+            assignments = ', '.join(f"{column} = ?" for column in updates)
+            conn.execute(
+                f"UPDATE sessions SET {assignments} WHERE user_id = ?",
+                [*updates.values(), str(user_id)]
+            )
+            return True
+
+    def _set_form_section(self, user_id, section_id, section_data, updated_at):
+        path = _json_path(section_id)
+        if path is None:
+            return super()._set_form_section(user_id, section_id, section_data, updated_at)
+
+        # Section yang isinya sama tidak ditulis ulang; key terurut supaya urutan key tidak dihitung perubahan
+        conn = self._connection()
+        cursor = conn.execute(
+            """
+            UPDATE sessions
+            SET form_data = json_set(form_data, ?1, json(?2)),
+                section_count = (SELECT COUNT(*) FROM json_each(json_set(form_data, ?1, json(?2)))),
+                updated_at = ?3
+            WHERE user_id = ?4 AND json_extract(form_data, ?1) IS NOT json(?2)
+            """,
+            (path, _dumps_section(section_data), updated_at, str(user_id))
+        )
+        if cursor.rowcount > 0:
+            self._record_section_write(True)
+            return True
+
+        found = conn.execute("SELECT 1 FROM sessions WHERE user_id = ?", (str(user_id),)).fetchone() is not None
+        if found:
+            self._record_section_write(False)
+        return found
+
+    def _set_temp_value(self, user_id, key, value, updated_at):
+        path = _json_path(key)
+        if path is None:
+            return super()._set_temp_value(user_id, key, value, updated_at)
+
+        cursor = self._connection().execute(
+            "UPDATE sessions SET temp_data = json_set(temp_data, ?, json(?)), updated_at = ? WHERE user_id = ?",
+            (path, _dumps(value), updated_at, str(user_id))
+        )
+        return cursor.rowcount > 0
+
+    def _append_photo(self, user_id, photo_data, updated_at):
+        cursor = self._connection().execute(
+            """
+            UPDATE sessions
+            SET photos = json_insert(photos, '$[#]', json(?)),
+                photo_count = photo_count + 1,
+                updated_at = ?
+            WHERE user_id = ?
+            """,
+            (_dumps(photo_data), updated_at, str(user_id))
+        )
+        return cursor.rowcount > 0
+
+    def _remove_sessions(self, user_ids):
+        removed = []
+        with self._transaction(immediate=True) as conn:
+            for user_id in user_ids:
+                cursor = conn.execute("DELETE FROM sessions WHERE user_id = ?", (str(user_id),))
+                if cursor.rowcount:
+                    removed.append(str(user_id))
+        return removed
+
+    def _write_access_times(self, access_times):
+        with self._transaction(immediate=True) as conn:
+            conn.executemany(
+                "UPDATE sessions SET extra = json_set(extra, '$.last_accessed', ?) WHERE user_id = ?",
+                [(last_accessed, user_id) for user_id, last_accessed in access_times.items()]
+            )
+
+    def _all_sessions(self):
+        rows = self._connection().execute("SELECT * FROM sessions").fetchall()
+        return {row['user_id']: self._row_to_session(row) for row in rows}
+
+    def _expired_user_ids(self, cutoff, limit=None):
+        # Memakai idx_sessions_updated_at, tanpa membaca isi session
+        rows = self._connection().execute(
+            "SELECT user_id FROM sessions WHERE updated_at <= ? ORDER BY updated_at LIMIT ?",
+            (cutoff.isoformat(), -1 if limit is None else limit)
+        ).fetchall()
+        return [row['user_id'] for row in rows]
+
+    def _track_expiry(self, user_id, updated_at):
+        # Expiry index sudah ada di database (idx_sessions_updated_at)
+        pass
+
+    def _remove_expired(self, user_ids, cutoff):
+        cutoff = cutoff.isoformat()
+        removed = {}
+        alive = {}
+        with self._transaction(immediate=True) as conn:
+            for user_id in user_ids:
+                row = conn.execute(
+                    "SELECT * FROM sessions WHERE user_id = ?", (str(user_id),)
+                ).fetchone()
+                if row is None:
+                    continue
+
+                if row['updated_at'] and row['updated_at'] <= cutoff:
+                    conn.execute("DELETE FROM sessions WHERE user_id = ?", (str(user_id),))
+                    removed[str(user_id)] = self._row_to_session(row)
+                elif row['updated_at']:
+                    alive[str(user_id)] = row['updated_at']
+        return removed, alive
+
+    def _session_stats(self):
+        # Satu row yang dijaga trigger, tanpa scan tabel sessions
+        row = self._connection().execute(
+            """
+            SELECT total_sessions, active_sessions, completed_sessions, total_form_sections, total_photos
+            FROM session_stats WHERE id = 1
+            """
+        ).fetchone()
+        return dict(row)
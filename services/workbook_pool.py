@@ -0,0 +1,153 @@
+# services/workbook_pool.py - Pool workbook openpyxl yang sudah di-parse, di-reset setelah dipakai
+import os
+import io
+import logging
+import threading
+from contextlib import contextmanager
+
+from openpyxl.cell.cell import MergedCell
+from openpyxl.utils.cell import coordinate_to_tuple
+
+logger = logging.getLogger(__name__)
+
+# Maksimum workbook idle yang disimpan per template
+WORKBOOK_POOL_SIZE = int(os.environ.get('WORKBOOK_POOL_SIZE', '2'))
+
+# Perkiraan memory satu workbook openpyxl: dasar + per cell + kelipatan ukuran file xlsx
+# (dikalibrasi dengan tracemalloc pada template 100-15.000 cell, selisih sekitar 15%)
+WORKBOOK_BASE_BYTES = 60000
+WORKBOOK_CELL_BYTES = 360
+WORKBOOK_FILE_FACTOR = 2
+
+
+class WorkbookPool:
+    """Workbook template yang sudah di-load, dipinjam per render lalu dikembalikan.
+
+    Render hanya menulis sejumlah cell dan menambah gambar di sheet aktif, jadi setelah
+    dipakai cukup cell itu yang dikembalikan ke nilai awalnya (cell yang sebelumnya tidak ada
+    dihapus lagi) dan daftar gambar dipulihkan; workbook tidak perlu di-parse ulang.
+
+    Key pool adalah (file id, versi) template; versi baru dari file yang sama membuang
+    workbook versi lama. Ukuran satu workbook diperkirakan dari ukuran file template dan
+    jumlah cell saat pertama di-load (tanpa tracemalloc, yang berlaku untuk seluruh process).
+    """
+
+    def __init__(self, size=None):
+        self.size = WORKBOOK_POOL_SIZE if size is None else size
+        self._lock = threading.Lock()
+        self._idle = {}  # {template_key: [workbook]}
+        self._leased = {}  # {template_key: jumlah workbook yang sedang dipinjam}
+        self._workbook_bytes = {}  # {template_key: perkiraan bytes per workbook}
+        self._template_images = {}  # {id(workbook): [(image, data)]} gambar bawaan template
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def _load(self, template_key, load, template_size):
+        """Load a new workbook, estimating its size the first time for this template"""
+        workbook = load()
+
+        # Image._data() menutup stream-nya saat save; simpan bytes supaya bisa di-save berulang kali
+        images = [(image, image._data()) for image in workbook.active._images]
+        
+        if template_key not in self._workbook_bytes:
+            cells = sum(len(worksheet._cells) for worksheet in workbook.worksheets)
+            size = (
+                WORKBOOK_BASE_BYTES + WORKBOOK_CELL_BYTES * cells + WORKBOOK_FILE_FACTOR * template_size +
+                sum(len(data) for _, data in images)
+            )
+            with self._lock:
+                self._workbook_bytes[template_key] = size
+            logger.info(f"📚 Workbook pool loaded template {template_key[0]} (~{size / 1e6:.1f} MB per workbook)")
+
+        with self._lock:
+            self._template_images[id(workbook)] = images
+        return workbook
+
+    def invalidate(self, file_id=None):
+        """Drop workbooks (semua, atau hanya untuk satu file template); yang sedang dipinjam tidak dikembalikan"""
+        with self._lock:
+            for template_key in list(self._workbook_bytes):
+                if file_id is None or template_key[0] == file_id:
+                    self._drop(template_key)
+
+    def _drop(self, template_key):
+        for workbook in self._idle.pop(template_key, []):
+            self._template_images.pop(id(workbook), None)
+        self._workbook_bytes.pop(template_key, None)
+
+    @contextmanager
+    def lease(self, template_key, coordinates, load, template_size=0):
+        """Borrow a parsed workbook; cells in ``coordinates`` and images are restored afterwards.
+
+        ``load``: callable yang me-load workbook baru kalau pool untuk template ini kosong.
+        ``template_size``: ukuran file xlsx template (bytes), untuk perkiraan memory.
+        """
+        with self._lock:
+            # Versi template lama tidak dipakai lagi
+            for cached_key in [key for key in self._workbook_bytes if key[0] == template_key[0] and key != template_key]:
+                self._drop(cached_key)
+            idle = self._idle.get(template_key)
+            workbook = idle.pop() if idle else None
+            self._stats['hits' if workbook else 'misses'] += 1
+            self._leased[template_key] = self._leased.get(template_key, 0) + 1
+
+        reusable = False
+        try:
+            if workbook is None:
+                workbook = self._load(template_key, load, template_size)
+            worksheet = workbook.active
+
+            # Snapshot cell yang akan ditulis: (row, column) -> nilai awal, atau tidak ada
+            missing = object()
+            snapshot = {}
+            for coordinate in coordinates:
+                position = coordinate_to_tuple(coordinate)
+                cell = worksheet._cells.get(position)
+                if not isinstance(cell, MergedCell):  # Cell di dalam merge tidak bisa ditulis
+                    snapshot[position] = missing if cell is None else cell.value
+
+            # Gambar bawaan template mendapat stream baru untuk save berikutnya
+            with self._lock:
+                images = self._template_images.get(id(workbook), [])
+            for image, data in images:
+                image.ref = io.BytesIO(data)
+
+            # Kalau render gagal (exception), workbook bisa setengah terisi dan tidak dikembalikan ke pool
+            yield workbook
+
+            # Reset: cell kembali ke nilai template, gambar kembali ke gambar bawaan template
+            for position, value in snapshot.items():
+                if value is missing:
+                    worksheet._cells.pop(position, None)
+                else:
+                    worksheet._cells[position].value = value
+            worksheet._images = [image for image, _ in images]
+            reusable = True
+        finally:
+            with self._lock:
+                self._leased[template_key] -= 1
+                if not self._leased[template_key]:
+                    del self._leased[template_key]
+                # Template yang sudah di-invalidate tidak punya entry ukuran lagi
+                idle = self._idle.setdefault(template_key, []) if template_key in self._workbook_bytes else None
+                if reusable and idle is not None and len(idle) < self.size:
+                    idle.append(workbook)
+                elif workbook is not None:
+                    self._template_images.pop(id(workbook), None)
+
+    def stats(self):
+        """Workbooks held and their estimated memory"""
+        with self._lock:
+            idle = sum(len(workbooks) for workbooks in self._idle.values())
+            leased = sum(self._leased.values())
+            held = sum(
+                self._workbook_bytes.get(template_key, 0) * (len(self._idle.get(template_key, [])) + self._leased.get(template_key, 0))
+                for template_key in set(self._idle) | set(self._leased)
+            )
+            return {
+                'templates': len([key for key, workbooks in self._idle.items() if workbooks]),
+                'idle': idle,
+                'leased': leased,
+                'memory_bytes': held,
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+            }
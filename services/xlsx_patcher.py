@@ -0,0 +1,542 @@
+# services/xlsx_patcher.py - Isi template XLSX langsung di XML part, tanpa load/save openpyxl
+import io
+import re
+import zipfile
+import posixpath
+from bisect import bisect_right
+from collections import defaultdict
+from xml.sax.saxutils import escape, unescape
+
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+XDR_NS = 'http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing'
+A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+
+OFFICE_DOCUMENT_REL = REL_NS + '/officeDocument'
+SHARED_STRINGS_REL = REL_NS + '/sharedStrings'
+CALC_CHAIN_REL = REL_NS + '/calcChain'
+DRAWING_REL = REL_NS + '/drawing'
+IMAGE_REL = REL_NS + '/image'
+
+DRAWING_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.drawing+xml'
+IMAGE_CONTENT_TYPES = {'png': 'image/png', 'jpeg': 'image/jpeg', 'gif': 'image/gif'}
+
+# Aturan nilai cell sama dengan openpyxl.cell.cell
+ILLEGAL_CHARACTERS_RE = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+ERROR_CODES = ('#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A')
+MAX_STRING_LENGTH = 32767
+
+# Elemen worksheet yang menurut schema harus berada setelah <drawing>
+AFTER_DRAWING = ('legacyDrawing', 'legacyDrawingHF', 'drawingHF', 'picture', 'oleObjects',
+                 'controls', 'webPublishItems', 'tableParts', 'extLst')
+# Elemen workbook yang harus berada setelah <calcPr>
+AFTER_CALC_PR = ('oleSize', 'customWorkbookViews', 'pivotCaches', 'smartTagPr', 'smartTagTypes',
+                 'webPublishing', 'fileRecoveryPr', 'webPublishObjects', 'extLst')
+
+ATTR_RE = re.compile(r'([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+ROW_RE = re.compile(r'<row\b([^>]*?)(/?)>')
+CELL_RE = re.compile(r'<c\b([^>]*?)(/?)>')
+COL_RE = re.compile(r'<col\b([^>]*?)/?>')
+MERGE_RE = re.compile(r'<mergeCell\b([^>]*?)/?>')
+RELATIONSHIP_RE = re.compile(r'<Relationship\b([^>]*?)/?>')
+COORDINATE_RE = re.compile(r'^\$?([A-Z]{1,3})\$?([0-9]+)$')
+
+
+class XlsxPatchError(Exception):
+    """Template memakai struktur yang tidak ditangani patcher; pakai openpyxl sebagai fallback"""
+
+
+def _attrs(text):
+    return {
+        match.group(1): unescape(match.group(2) if match.group(2) is not None else match.group(3), {'&quot;': '"', '&apos;': "'"})
+        for match in ATTR_RE.finditer(text)
+    }
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index
+
+
+def _split_coordinate(coordinate):
+    match = COORDINATE_RE.match(coordinate.upper())
+    if not match:
+        raise XlsxPatchError(f"Invalid coordinate {coordinate}")
+    return _column_index(match.group(1)), int(match.group(2))
+
+
+def _rels_part(part):
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, '_rels', f"{name}.rels")
+
+
+def _resolve(source_part, target):
+    if target.startswith('/'):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def _relative(source_part, target_part):
+    return posixpath.relpath(target_part, posixpath.dirname(source_part))
+
+
+def _parse_relationships(xml):
+    return [_attrs(match.group(1)) for match in RELATIONSHIP_RE.finditer(xml or '')]
+
+
+def _next_rel_id(used_ids):
+    n = 1
+    while f"rId{n}" in used_ids:
+        n += 1
+    return f"rId{n}"
+
+
+def _add_relationships(xml, relationships):
+    """Append (id, type, target) tuples to a .rels part (None: buat part baru)"""
+    entries = ''.join(
+        f'<Relationship Id="{rel_id}" Type="{rel_type}" Target="{escape(target)}"/>'
+        for rel_id, rel_type, target in relationships
+    )
+    if xml is None:
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{PACKAGE_REL_NS}">{entries}</Relationships>'
+        )
+    closing = xml.rfind('</Relationships>')
+    if closing == -1:
+        # <Relationships .../> tanpa isi
+        root = re.search(r'<Relationships\b[^>]*?/>', xml)
+        return xml[:root.end() - 2] + '>' + entries + '</Relationships>' + xml[root.end():]
+    return xml[:closing] + entries + xml[closing:]
+
+
+def _first_element(xml, names, start=0):
+    """Offset of the first unprefixed <name> element from names, or None"""
+    positions = [match.start() for name in names for match in [re.compile(rf'<{name}\b').search(xml, start)] if match]
+    return min(positions) if positions else None
+
+
+class XlsxTemplate:
+    """Template XLSX yang sudah di-index sekali, lalu di-render berkali-kali tanpa openpyxl.
+
+    Saat dibuat, zip template dibuka sekali: sheet aktif, shared strings, ukuran kolom/baris
+    dan posisi cell untuk setiap koordinat di ``coordinates`` dicatat. ``render`` hanya
+    menyisipkan cell yang berubah (plus drawing dan media untuk gambar) lalu menambahkan
+    part tersebut ke zip dasar yang isinya sudah ter-compress.
+
+    Hasilnya mengikuti aturan openpyxl saat menulis cell: style cell yang ada dipertahankan,
+    string di shared strings, ``=...`` menjadi formula, kode error menjadi cell error,
+    string dipotong di 32.767 karakter, dan cell di dalam merge (bukan kiri atas) ditolak.
+    Gambar di-anchor satu cell dengan ukuran pixel seperti ``openpyxl.drawing.image.Image``.
+    """
+
+    def __init__(self, content, coordinates=()):
+        with zipfile.ZipFile(io.BytesIO(content)) as source:
+            infos = source.infolist()
+            parts = {info.filename: source.read(info) for info in infos}
+
+        self._content_types = self._text(parts, '[Content_Types].xml')
+
+        # Workbook dan sheet aktif (workbook.active di openpyxl)
+        root_rels = _parse_relationships(self._text(parts, '_rels/.rels'))
+        workbook_rel = next((rel for rel in root_rels if rel.get('Type') == OFFICE_DOCUMENT_REL), None)
+        if workbook_rel is None:
+            raise XlsxPatchError("No workbook part")
+        self.workbook_part = _resolve('', workbook_rel['Target'])
+        workbook_xml = self._text(parts, self.workbook_part)
+        workbook_rels_part = _rels_part(self.workbook_part)
+        workbook_rels_xml = self._text(parts, workbook_rels_part)
+        workbook_rels = {rel.get('Id'): rel for rel in _parse_relationships(workbook_rels_xml)}
+
+        sheets = [_attrs(match.group(1)) for match in re.finditer(r'<sheet\b([^>]*?)/?>', workbook_xml)]
+        view = re.search(r'<workbookView\b([^>]*?)/?>', workbook_xml)
+        active_tab = int(_attrs(view.group(1)).get('activeTab', 0)) if view else 0
+        if not sheets or active_tab >= len(sheets):
+            raise XlsxPatchError("Active sheet not found")
+        sheet_rel_id = next((value for key, value in sheets[active_tab].items() if key.endswith(':id')), None)
+        sheet_rel = workbook_rels.get(sheet_rel_id)
+        if sheet_rel is None or not sheet_rel.get('Type', '').endswith('/worksheet'):
+            raise XlsxPatchError("Active sheet is not a worksheet")
+        self.sheet_part = _resolve(self.workbook_part, sheet_rel['Target'])
+        self._sheet = self._text(parts, self.sheet_part)
+        if not re.search(r'<worksheet\b', self._sheet):
+            raise XlsxPatchError("Prefixed worksheet XML is not supported")
+
+        # Shared strings: string baru ditambahkan di akhir tabel
+        self.shared_strings_part = None
+        sst_rel = next((rel for rel in workbook_rels.values() if rel.get('Type') == SHARED_STRINGS_REL), None)
+        if sst_rel is not None:
+            self.shared_strings_part = _resolve(self.workbook_part, sst_rel['Target'])
+            self._sst = self._text(parts, self.shared_strings_part)
+            self._sst_end = self._sst.rfind('</sst>')
+            if self._sst_end == -1:
+                raise XlsxPatchError("Empty shared string table")
+            self._string_count = len(re.findall(r'<si\b', self._sst))
+
+        self._index_sheet()
+        self._index_drawing(parts)
+
+        # calcChain dibuang dan workbook dihitung ulang saat dibuka, seperti hasil openpyxl
+        calc_chain_ids = [rel_id for rel_id, rel in workbook_rels.items() if rel.get('Type') == CALC_CHAIN_REL]
+        dropped = {_resolve(self.workbook_part, workbook_rels[rel_id]['Target']) for rel_id in calc_chain_ids}
+        for rel_id in calc_chain_ids:
+            workbook_rels_xml = re.sub(rf'<Relationship\b[^>]*\bId="{rel_id}"[^>]*/>', '', workbook_rels_xml)
+        for part in dropped:
+            self._content_types = re.sub(rf'<Override\b[^>]*PartName="/{re.escape(part)}"[^>]*/>', '', self._content_types)
+        static = {self.workbook_part: self._full_calc_on_load(workbook_xml).encode('utf-8')}
+        if calc_chain_ids:
+            static[workbook_rels_part] = workbook_rels_xml.encode('utf-8')
+
+        # Zip dasar: semua part yang tidak berubah per render, sudah ter-compress
+        dynamic = {'[Content_Types].xml', self.sheet_part, self.sheet_rels_part, self.shared_strings_part,
+                   self.drawing_part, self.drawing_rels_part} | dropped
+        base = io.BytesIO()
+        with zipfile.ZipFile(base, 'w', zipfile.ZIP_DEFLATED) as target:
+            for info in infos:
+                if info.filename not in dynamic:
+                    target.writestr(info.filename, static.get(info.filename, parts[info.filename]))
+        self._base_zip = base.getvalue()
+
+        self._sheet_rels = self._text(parts, self.sheet_rels_part, required=False)
+        self._drawing = self._text(parts, self.drawing_part, required=False) if self.drawing_part else None
+        self._drawing_rels = self._text(parts, self.drawing_rels_part, required=False) if self.drawing_part else None
+        self._media_index = 1 + max(
+            [int(match.group(1)) for name in parts for match in [re.match(r'xl/media/image(\d+)\.', name)] if match] or [0]
+        )
+
+        self._cells = {coordinate: self._locate(coordinate) for coordinate in coordinates}
+
+    @staticmethod
+    def _text(parts, name, required=True):
+        if name not in parts:
+            if required:
+                raise XlsxPatchError(f"Missing part {name}")
+            return None
+        return parts[name].decode('utf-8')
+
+    @staticmethod
+    def _full_calc_on_load(workbook_xml):
+        calc_pr = re.search(r'<calcPr\b([^>]*?)/?>', workbook_xml)
+        if calc_pr:
+            if 'fullCalcOnLoad=' in calc_pr.group(1):
+                return workbook_xml
+            return workbook_xml[:calc_pr.start(1)] + ' fullCalcOnLoad="1"' + workbook_xml[calc_pr.start(1):]
+        position = _first_element(workbook_xml, AFTER_CALC_PR)
+        if position is None:
+            position = workbook_xml.rfind('</workbook>')
+        return workbook_xml[:position] + '<calcPr calcId="124519" fullCalcOnLoad="1"/>' + workbook_xml[position:]
+
+    def _index_sheet(self):
+        sheet = self._sheet
+        sheet_data = re.search(r'<sheetData\b[^>]*?(/?)>', sheet)
+        if not sheet_data:
+            raise XlsxPatchError("No sheetData")
+        self._sheet_data = sheet_data
+        self._sheet_data_close = None if sheet_data.group(1) else sheet.index('</sheetData>', sheet_data.end())
+
+        # {row: (start, open_end, close, attrs)}; close None untuk <row .../>
+        self._rows = {}
+        if self._sheet_data_close is not None:
+            position = sheet_data.end()
+            while True:
+                match = ROW_RE.search(sheet, position, self._sheet_data_close)
+                if not match:
+                    break
+                attrs = _attrs(match.group(1))
+                if 'r' not in attrs:
+                    raise XlsxPatchError("Row without r attribute")
+                if match.group(2):
+                    close = None
+                    position = match.end()
+                else:
+                    close = sheet.index('</row>', match.end())
+                    position = close + len('</row>')
+                self._rows[int(attrs['r'])] = (match.start(), match.end(), close, attrs)
+        self._row_numbers = sorted(self._rows)
+
+        # Lebar kolom seperti worksheet.column_dimensions openpyxl: di-key oleh kolom "min"
+        self._column_widths = {}
+        for match in COL_RE.finditer(sheet, 0, sheet_data.start()):
+            attrs = _attrs(match.group(1))
+            self._column_widths[int(attrs['min'])] = float(attrs['width']) if 'width' in attrs else 13.0
+
+        self._merged = []
+        for match in MERGE_RE.finditer(sheet):
+            ref = _attrs(match.group(1)).get('ref', '')
+            if ':' in ref:
+                first, last = ref.split(':')
+                self._merged.append(_split_coordinate(first) + _split_coordinate(last))
+
+        # Relasi dan namespace untuk elemen <drawing>
+        self.sheet_rels_part = _rels_part(self.sheet_part)
+        root = re.search(r'<worksheet\b[^>]*>', sheet)
+        declared = {match.group(1): match.group(2) for match in re.finditer(r'xmlns:(\w+)="([^"]*)"', root.group(0))}
+        self._rel_prefix = next((prefix for prefix, uri in declared.items() if uri == REL_NS), None)
+        self._root_insert = root.end() - 1
+        if self._rel_prefix is None:
+            self._rel_prefix = 'r' if 'r' not in declared else 'rel'
+            self._declare_rel_prefix = True
+        else:
+            self._declare_rel_prefix = False
+
+        drawing = re.search(r'<drawing\b([^>]*?)/?>', sheet)
+        self._drawing_rel_id = None
+        if drawing:
+            self._drawing_rel_id = next((value for key, value in _attrs(drawing.group(1)).items() if key.endswith(':id')), None)
+        else:
+            position = _first_element(sheet, AFTER_DRAWING, sheet_data.end())
+            self._drawing_insert = position if position is not None else sheet.rfind('</worksheet>')
+
+    def _index_drawing(self, parts):
+        sheet_rels = _parse_relationships(self._text(parts, self.sheet_rels_part, required=False))
+        self._sheet_rel_ids = {rel.get('Id') for rel in sheet_rels}
+
+        if self._drawing_rel_id is not None:
+            rel = next((rel for rel in sheet_rels if rel.get('Id') == self._drawing_rel_id), None)
+            if rel is None:
+                raise XlsxPatchError("Drawing relationship not found")
+            self.drawing_part = _resolve(self.sheet_part, rel['Target'])
+            self.drawing_rels_part = _rels_part(self.drawing_part)
+            drawing = self._text(parts, self.drawing_part)
+            match = re.search(r'</(\w+:)?wsDr>\s*$', drawing)
+            if not match:
+                raise XlsxPatchError("Unsupported drawing part")
+            self._drawing_close = match.start()
+            ids = [int(value) for value in re.findall(r'<(?:\w+:)?cNvPr\b[^>]*?\bid="(\d+)"', drawing)]
+            self._next_shape_id = max(ids or [0]) + 1
+            self._new_drawing = False
+        else:
+            numbers = [int(match.group(1)) for name in parts for match in [re.match(r'xl/drawings/drawing(\d+)\.xml$', name)] if match]
+            self.drawing_part = f"xl/drawings/drawing{max(numbers or [0]) + 1}.xml"
+            self.drawing_rels_part = _rels_part(self.drawing_part)
+            self._next_shape_id = 1
+            self._new_drawing = True
+
+    def _merged_away(self, column, row):
+        """True if the cell is inside a merged range but not its top-left cell (MergedCell)"""
+        for min_col, min_row, max_col, max_row in self._merged:
+            if min_col <= column <= max_col and min_row <= row <= max_row:
+                return (column, row) != (min_col, min_row)
+        return False
+
+    def _locate(self, coordinate):
+        """Where to write a coordinate in the original sheet XML"""
+        column, row = _split_coordinate(coordinate)
+        if self._merged_away(column, row):
+            return ('merged', column, row)
+
+        entry = self._rows.get(row)
+        if entry is None:
+            # Baris belum ada: sisipkan sebelum baris berikutnya
+            following = bisect_right(self._row_numbers, row)
+            if following < len(self._row_numbers):
+                offset = self._rows[self._row_numbers[following]][0]
+            else:
+                offset = self._sheet_data_close
+            return ('new_row', column, row, offset)
+
+        start, open_end, close, _ = entry
+        if close is None:
+            return ('empty_row', column, row)
+
+        sheet = self._sheet
+        position = open_end
+        while True:
+            match = CELL_RE.search(sheet, position, close)
+            if not match:
+                return ('insert', column, row, close)
+            attrs = _attrs(match.group(1))
+            if 'r' not in attrs:
+                raise XlsxPatchError("Cell without r attribute")
+            end = match.end() if match.group(2) else sheet.index('</c>', match.end()) + len('</c>')
+            cell_column, _ = _split_coordinate(attrs['r'])
+            if cell_column == column:
+                if re.search(r'<f\b[^>]*\bt="shared"[^>]*\bref=', sheet[match.end():end]):
+                    raise XlsxPatchError(f"{coordinate} is a shared formula master")
+                return ('cell', column, row, match.start(), end, attrs.get('s'))
+            if cell_column > column:
+                return ('insert', column, row, match.start())
+            position = end
+
+    def cell_dimensions(self, coordinate):
+        """(column width, row height) as worksheet.column_dimensions / row_dimensions give them, None if unset"""
+        column, row = _split_coordinate(coordinate)
+        entry = self._rows.get(row)
+        height = entry[3].get('ht') if entry else None
+        return self._column_widths.get(column), float(height) if height else None
+
+    def _cell_xml(self, coordinate, style, value, new_strings):
+        attrs = f'r="{coordinate}"' + (f' s="{style}"' if style and style != '0' else '')
+        if len(value) > 1 and value.startswith('='):
+            return f'<c {attrs}><f>{escape(value[1:])}</f><v></v></c>'
+        if value in ERROR_CODES:
+            return f'<c {attrs} t="e"><v>{escape(value)}</v></c>'
+
+        space = ' xml:space="preserve"' if value != value.strip() else ''
+        text = escape(value).replace('\r', '&#13;')
+        if self.shared_strings_part is None:
+            return f'<c {attrs} t="inlineStr"><is><t{space}>{text}</t></is></c>'
+        new_strings.append(f'<si><t{space}>{text}</t></si>')
+        return f'<c {attrs} t="s"><v>{self._string_count + len(new_strings) - 1}</v></c>'
+
+    def render(self, values, images=()):
+        """Write values ({coordinate: str}) and images ([(coordinate, bytes, width_px, height_px, format)]).
+
+        Returns (xlsx bytes, skipped coordinates); koordinat di-skip bila openpyxl juga menolaknya.
+        """
+        edits = []
+        inserts = defaultdict(list)  # offset -> [(column, cell xml)]
+        empty_rows = defaultdict(list)  # row -> [(column, cell xml)]
+        new_rows = defaultdict(lambda: defaultdict(list))  # offset -> {row: [(column, cell xml)]}
+        new_strings = []
+        skipped = []
+
+        for coordinate, value in values.items():
+            if not isinstance(value, str):
+                raise XlsxPatchError(f"Unsupported value type for {coordinate}")
+            value = value[:MAX_STRING_LENGTH]
+            location = self._cells.get(coordinate) or self._locate(coordinate)
+            if location[0] == 'merged' or ILLEGAL_CHARACTERS_RE.search(value):
+                skipped.append(coordinate)
+                continue
+
+            kind, column, row = location[:3]
+            style = location[5] if kind == 'cell' else None
+            cell = self._cell_xml(coordinate, style, value, new_strings)
+            if kind == 'cell':
+                edits.append((location[3], location[4], cell))
+            elif kind == 'insert':
+                inserts[location[3]].append((column, cell))
+            elif kind == 'empty_row':
+                empty_rows[row].append((column, cell))
+            else:
+                new_rows[location[3]][row].append((column, cell))
+
+        for offset, cells in inserts.items():
+            edits.append((offset, offset, ''.join(cell for _, cell in sorted(cells))))
+        for row, cells in empty_rows.items():
+            start, open_end, _, _ = self._rows[row]
+            opening = self._sheet[start:open_end]
+            opening = opening[:-2].rstrip() + '>'
+            edits.append((start, open_end, opening + ''.join(cell for _, cell in sorted(cells)) + '</row>'))
+        for offset, rows in new_rows.items():
+            xml = ''.join(
+                f'<row r="{row}">' + ''.join(cell for _, cell in sorted(cells)) + '</row>'
+                for row, cells in sorted(rows.items())
+            )
+            if offset is None:
+                # <sheetData/> tanpa baris
+                opening = self._sheet[self._sheet_data.start():self._sheet_data.end()]
+                edits.append((self._sheet_data.start(), self._sheet_data.end(), opening[:-2].rstrip() + '>' + xml + '</sheetData>'))
+            else:
+                edits.append((offset, offset, xml))
+
+        parts = {}
+        content_types = self._content_types
+        if images:
+            content_types = self._add_images(images, edits, parts, content_types)
+        elif self._sheet_rels is not None:
+            parts[self.sheet_rels_part] = self._sheet_rels
+        if not images and self._drawing is not None:
+            parts[self.drawing_part] = self._drawing
+            if self._drawing_rels is not None:
+                parts[self.drawing_rels_part] = self._drawing_rels
+
+        parts['[Content_Types].xml'] = content_types
+        parts[self.sheet_part] = self._apply(self._sheet, edits)
+        if self.shared_strings_part is not None:
+            parts[self.shared_strings_part] = self._shared_strings(new_strings)
+
+        output = io.BytesIO(self._base_zip)
+        with zipfile.ZipFile(output, 'a', zipfile.ZIP_DEFLATED) as target:
+            for name, text in parts.items():
+                target.writestr(name, text.encode('utf-8') if isinstance(text, str) else text)
+        return output.getvalue(), skipped
+
+    @staticmethod
+    def _apply(text, edits):
+        chunks = []
+        position = 0
+        for start, end, replacement in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+            chunks.append(text[position:start])
+            chunks.append(replacement)
+            position = end
+        chunks.append(text[position:])
+        return ''.join(chunks)
+
+    def _shared_strings(self, new_strings):
+        sst = self._sst
+        if not new_strings:
+            return sst
+        root = re.search(r'<sst\b([^>]*)>', sst)
+        attrs = re.sub(r'\s(count|uniqueCount)="[^"]*"', '', root.group(1))
+        total = self._string_count + len(new_strings)
+        opening = f'<sst{attrs} count="{total}" uniqueCount="{total}">'
+        return sst[:root.start()] + opening + sst[root.end():self._sst_end] + ''.join(new_strings) + sst[self._sst_end:]
+
+    def _add_images(self, images, edits, parts, content_types):
+        """Add image anchors to the sheet drawing (dibuat jika belum ada)"""
+        drawing_rels = self._drawing_rels
+        used_ids = {rel.get('Id') for rel in _parse_relationships(drawing_rels)}
+        relationships = []
+        anchors = []
+        extensions = set()
+
+        for number, (coordinate, data, width, height, image_format) in enumerate(images):
+            extension = 'jpeg' if image_format == 'jpg' else image_format
+            if extension not in IMAGE_CONTENT_TYPES:
+                raise XlsxPatchError(f"Unsupported image format {image_format}")
+            media_part = f"xl/media/image{self._media_index + number}.{extension}"
+            parts[media_part] = data
+            extensions.add(extension)
+
+            rel_id = _next_rel_id(used_ids)
+            used_ids.add(rel_id)
+            relationships.append((rel_id, IMAGE_REL, _relative(self.drawing_part, media_part)))
+
+            column, row = _split_coordinate(coordinate)
+            shape_id = self._next_shape_id + number
+            anchors.append(
+                f'<xdr:oneCellAnchor xmlns:xdr="{XDR_NS}" xmlns:a="{A_NS}">'
+                f'<xdr:from><xdr:col>{column - 1}</xdr:col><xdr:colOff>0</xdr:colOff>'
+                f'<xdr:row>{row - 1}</xdr:row><xdr:rowOff>0</xdr:rowOff></xdr:from>'
+                f'<xdr:ext cx="{int(width * 9525)}" cy="{int(height * 9525)}"/>'
+                f'<xdr:pic><xdr:nvPicPr><xdr:cNvPr id="{shape_id}" name="Image {shape_id}"/>'
+                f'<xdr:cNvPicPr><a:picLocks noChangeAspect="1"/></xdr:cNvPicPr></xdr:nvPicPr>'
+                f'<xdr:blipFill><a:blip xmlns:r="{REL_NS}" r:embed="{rel_id}"/><a:stretch><a:fillRect/></a:stretch></xdr:blipFill>'
+                f'<xdr:spPr><a:prstGeom prst="rect"><a:avLst/></a:prstGeom></xdr:spPr></xdr:pic>'
+                f'<xdr:clientData/></xdr:oneCellAnchor>'
+            )
+
+        if self._new_drawing:
+            drawing = (
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<xdr:wsDr xmlns:xdr="{XDR_NS}" xmlns:a="{A_NS}">{"".join(anchors)}</xdr:wsDr>'
+            )
+            # Hubungkan drawing baru ke sheet
+            rel_id = _next_rel_id(self._sheet_rel_ids)
+            parts[self.sheet_rels_part] = _add_relationships(
+                self._sheet_rels, [(rel_id, DRAWING_REL, _relative(self.sheet_part, self.drawing_part))]
+            )
+            edits.append((self._drawing_insert, self._drawing_insert, f'<drawing {self._rel_prefix}:id="{rel_id}"/>'))
+            if self._declare_rel_prefix:
+                edits.append((self._root_insert, self._root_insert, f' xmlns:{self._rel_prefix}="{REL_NS}"'))
+            content_types = content_types.replace(
+                '</Types>', f'<Override PartName="/{self.drawing_part}" ContentType="{DRAWING_CONTENT_TYPE}"/></Types>'
+            )
+        else:
+            drawing = self._drawing[:self._drawing_close] + ''.join(anchors) + self._drawing[self._drawing_close:]
+            if self._sheet_rels is not None:
+                parts[self.sheet_rels_part] = self._sheet_rels
+
+        parts[self.drawing_part] = drawing
+        parts[self.drawing_rels_part] = _add_relationships(drawing_rels, relationships)
+
+        for extension in sorted(extensions):
+            if not re.search(rf'<Default\b[^>]*Extension="{extension}"', content_types, re.IGNORECASE):
+                content_types = content_types.replace(
+                    '</Types>', f'<Default Extension="{extension}" ContentType="{IMAGE_CONTENT_TYPES[extension]}"/></Types>'
+                )
+        return content_types